@@ -41,11 +41,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'runapp.middleware.ProfilingMiddleware',
+    'runapp.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'runapp.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -80,9 +82,66 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'CONN_MAX_AGE': 60,
+        # A file-backed test database lets tests run concurrent
+        # connections from many threads.
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    },
+    # Locally a second SQLite file stands in for the replica, refreshed
+    # from the primary with manage.py sync_replica.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'CONN_MAX_AGE': 60,
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
 }
 
+# Persistent connections are checked at the start of a request when
+# they were not checked or opened for this many seconds.
+
+DATABASE_CHECK_INTERVAL = 10
+
+# Read-only views read from a replica, everything else uses the primary
+# database. After a request changing data, the reads of the following
+# REPLICA_STICKY_SECONDS go to the primary, which should exceed the
+# replication lag.
+
+DATABASE_ROUTERS = ['runapp.routers.ReplicaRouter']
+
+DATABASE_REPLICAS = ['replica']
+
+REPLICA_STICKY_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Rendered page fragments are stored in the FRAGMENT_CACHE. The local
+# memory cache serves a single process; to share fragments between
+# processes switch it to e.g.
+# 'django.core.cache.backends.filebased.FileBasedCache' with a directory
+# as LOCATION, or to a memcached backend.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+
+FRAGMENT_CACHE = 'fragments'
+
 
 # Custom user model
 
@@ -99,6 +158,99 @@ LOGIN_REDIRECT_URL = 'runapp:homepage'
 LOGOUT_REDIRECT_URL = 'runapp:landing_page'
 
 
+# Training calendar
+# Number of rendered monthly calendars kept in memory by each process.
+
+CALENDAR_CACHE_SIZE = 512
+
+
+# Profiling
+# When enabled, every request is timed and the results are sent in the
+# Server-Timing header and kept for the admin-only stats endpoint.
+
+PROFILING_ENABLED = False
+
+PROFILING_SAMPLES = 1000
+
+
+# Sessions and authentication
+# Sessions are read from the default cache and written through to the
+# database. Authenticated users are kept in memory by each process for
+# AUTH_USER_CACHE_TTL seconds. Each entry is checked against a token
+# kept in the AUTH_USER_CACHE_ALIAS cache, which is replaced when the
+# user or their plan list changes, so the alias has to be shared by all
+# processes (e.g. memcached or Redis) for the changes to be seen at
+# once everywhere. With None a change is seen by other processes after
+# the TTL at the latest.
+# 'django.contrib.sessions.backends.signed_cookies' avoids the session
+# table altogether, at the cost of not being able to end sessions on
+# the server.
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+AUTH_USER_CACHE_SIZE = 1024
+
+AUTH_USER_CACHE_TTL = 30
+
+AUTH_USER_CACHE_ALIAS = 'default'
+
+
+# Activity files
+# Number of processes parsing uploaded GPX, TCX and CSV activity files,
+# None uses one process per CPU.
+
+ACTIVITY_PARSE_WORKERS = None
+
+
+# Background jobs
+# Workers started with manage.py runworker check the queue every
+# JOB_POLL_INTERVAL seconds. A failed job is retried after
+# JOB_RETRY_DELAY seconds, doubled on every further attempt. Running
+# jobs send a heartbeat with every progress update, a job without one
+# for JOB_TIMEOUT seconds is assumed to be left by a dead worker and
+# is queued again, or failed once out of attempts. The timeout must
+# exceed the longest time a job runs between progress updates.
+
+JOB_POLL_INTERVAL = 1
+
+JOB_RETRY_DELAY = 30
+
+JOB_TIMEOUT = 3600
+
+
+# Weekly adherence
+# Number of processes computing the weekly adherence report, None uses
+# one process per CPU.
+
+ADHERENCE_WORKERS = None
+
+
+# Password hashing
+# New passwords are hashed with the first hasher, the others verify
+# older hashes, which are updated on the next login. Moving Argon2 to
+# the front needs the argon2-cffi package. A higher scrypt work factor
+# costs proportionally more CPU per login, see
+# benchmarks/password_hashing.py.
+
+PASSWORD_HASHERS = [
+    'runapp.hashers.ScryptPasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+PASSWORD_SCRYPT_WORK_FACTOR = 2 ** 14
+
+PASSWORD_SCRYPT_BLOCK_SIZE = 8
+
+PASSWORD_SCRYPT_PARALLELISM = 1
+
+# Number of threads hashing passwords of users created in bulk, None
+# uses the default of ThreadPoolExecutor.
+
+PASSWORD_HASH_WORKERS = None
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,155 @@
+"""Compare the sync views under WSGI with the async views under ASGI.
+
+Seed a scratch database with the seed_data command and request the plan
+details, plan list, calendar and diary pages: the sync views with the
+WSGI test client from a pool of worker threads, and their async
+variants with the ASGI test client from concurrent tasks on a single
+event loop. Print the throughput and p50/p95/p99 latency of both.
+
+Both clients call the handlers in process, so the numbers leave out
+the server and the network. Under ASGI the queries of all requests run
+in one thread, as sync_to_async is thread sensitive.
+
+    python -m benchmarks.asgi_wsgi [--requests 2000] [--concurrency 50]
+        [--workers 8]
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import benchmark_database, setup_django
+
+VIEWS = ('training_plan_details', 'training_plan_list', 'calendar',
+         'training_diary')
+
+
+def get_urls(user, prefix):
+    """Return the URLs of the benchmarked views for the user."""
+    from django.urls import reverse
+
+    from runapp.calendar import get_date_today
+
+    plan = user.trainingplan_set.get(current_plan=True)
+    today = get_date_today()
+    arguments = {
+        'training_plan_details': [plan.pk],
+        'training_plan_list': [],
+        'calendar': [today.month, today.year],
+        'training_diary': [],
+    }
+    return [reverse(f'runapp:{prefix}{name}', args=arguments[name])
+            for name in VIEWS]
+
+
+def report(title, timings, duration):
+    """Print the throughput and latency percentiles of a run."""
+    from runapp.profiling import percentile
+
+    print(f'{title}: {len(timings)} requests in {duration:.2f} s, '
+          f'{len(timings) / duration:.1f} requests per second')
+    print(f'    p50 {percentile(timings, 0.5):.3f} ms, '
+          f'p95 {percentile(timings, 0.95):.3f} ms, '
+          f'p99 {percentile(timings, 0.99):.3f} ms')
+
+
+def run_wsgi(users, requests, workers):
+    """Request the sync views from a pool of threads."""
+    from django.db import connection
+    from django.test import Client
+
+    local = threading.local()
+    user_numbers = itertools.count()
+
+    def get_client():
+        if not hasattr(local, 'client'):
+            user = users[next(user_numbers) % len(users)]
+            local.client = Client()
+            local.client.force_login(user)
+            local.urls = get_urls(user, '')
+        return local.client, local.urls
+
+    def request(number):
+        client, urls = get_client()
+        start = time.perf_counter()
+        response = client.get(urls[number % len(urls)])
+        elapsed = (time.perf_counter() - start) * 1000
+        assert response.status_code == 200, response.status_code
+        return elapsed
+
+    def close_connection(_):
+        connection.close()
+
+    with ThreadPoolExecutor(workers) as executor:
+        start = time.perf_counter()
+        timings = list(executor.map(request, range(requests)))
+        duration = time.perf_counter() - start
+        list(executor.map(close_connection, range(workers)))
+    return timings, duration
+
+
+def run_asgi(users, requests, concurrency):
+    """Request the async views from concurrent tasks on one event loop."""
+    from django.test import AsyncClient
+
+    clients = []
+    for number in range(concurrency):
+        user = users[number % len(users)]
+        client = AsyncClient()
+        client.force_login(user)
+        clients.append((client, get_urls(user, 'async_')))
+    numbers = iter(range(requests))
+    timings = []
+
+    async def worker(client, urls):
+        for number in numbers:
+            start = time.perf_counter()
+            response = await client.get(urls[number % len(urls)])
+            timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.status_code
+
+    async def run():
+        await asyncio.gather(*(worker(client, urls)
+                               for client, urls in clients))
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    return timings, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50,
+                        help='concurrent requests under ASGI')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='worker threads under WSGI')
+    parser.add_argument('--users', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+    from django.test.utils import setup_test_environment
+
+    from runapp.calendar import month_cache
+    from runapp.fragments import get_fragment_cache
+    from runapp.models import User
+
+    setup_test_environment()
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    with benchmark_database():
+        call_command('seed_data', users=args.users)
+        users = list(User.objects.order_by('pk'))
+        report(f'WSGI, {args.workers} threads',
+               *run_wsgi(users, args.requests, args.workers))
+        month_cache.clear()
+        get_fragment_cache().clear()
+        report(f'ASGI, {args.concurrency} concurrent requests',
+               *run_asgi(users, args.requests, args.concurrency))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Compare the default session and authentication with the fast path.
+
+Seed a scratch database with the seed_data command and request the
+calendar, diary and plan details pages as logged in users, first with
+database sessions and Django's AuthenticationMiddleware, then with
+cached_db sessions and CachedAuthenticationMiddleware. Print the
+queries per request and the p50/p95 latency of each page.
+
+    python -m benchmarks.auth_fast_path [--requests 500] [--users 20]
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.common import benchmark_database, setup_django
+
+MODES = {
+    'database sessions': (
+        'django.contrib.sessions.backends.db',
+        'django.contrib.auth.middleware.AuthenticationMiddleware'),
+    'cached sessions and users': (
+        'django.contrib.sessions.backends.cached_db',
+        'runapp.middleware.CachedAuthenticationMiddleware'),
+}
+
+
+def get_urls(user):
+    """Return the benchmarked URLs for the user."""
+    from django.urls import reverse
+
+    from runapp.calendar import get_date_today
+
+    plan = user.trainingplan_set.get(current_plan=True)
+    today = get_date_today()
+    return {
+        'calendar': reverse('runapp:calendar',
+                            args=[today.month, today.year]),
+        'training_diary': reverse('runapp:training_diary'),
+        'training_plan_details': reverse('runapp:training_plan_details',
+                                         args=[plan.pk]),
+    }
+
+
+def get_middleware(authentication):
+    """Return the project middleware with the authentication replaced."""
+    from django.conf import settings
+
+    return [authentication if 'AuthenticationMiddleware' in name else name
+            for name in settings.MIDDLEWARE]
+
+
+def run(users, requests):
+    """Request every page in turn and return the samples of each page."""
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    clients = []
+    for user in users:
+        client = Client()
+        client.force_login(user)
+        clients.append((client, get_urls(user)))
+    samples = {name: [] for name in clients[0][1]}
+    for number in range(requests):
+        client, urls = clients[number % len(clients)]
+        for name, url in urls.items():
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.get(url)
+                elapsed = (time.perf_counter() - start) * 1000
+            assert response.status_code == 200, response.status_code
+            samples[name].append((elapsed, len(queries)))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500,
+                        help='requests of every page in each mode')
+    parser.add_argument('--users', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.cache import cache
+    from django.core.management import call_command
+    from django.test.utils import override_settings, setup_test_environment
+
+    from runapp.authentication import user_cache
+    from runapp.models import User
+    from runapp.profiling import percentile
+
+    setup_test_environment()
+    with benchmark_database():
+        call_command('seed_data', users=args.users)
+        users = list(User.objects.order_by('pk'))
+        for mode, (engine, authentication) in MODES.items():
+            cache.clear()
+            user_cache.clear()
+            with override_settings(SESSION_ENGINE=engine,
+                                   MIDDLEWARE=get_middleware(authentication)):
+                samples = run(users, args.requests)
+            print(f'{mode}:')
+            for name, page_samples in samples.items():
+                timings = [elapsed for elapsed, _ in page_samples]
+                queries = statistics.mean(count for _, count in page_samples)
+                print(f'    {name:24} {queries:5.2f} queries, '
+                      f'p50 {percentile(timings, 0.5):.3f} ms, '
+                      f'p95 {percentile(timings, 0.95):.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
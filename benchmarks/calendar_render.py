@@ -0,0 +1,72 @@
+"""Compare the calendar renderers on the same monthly calendars.
+
+Render a month full of trainings many times with the HTMLCalendar based
+TrainingCalendar.formatmonth and with the single pass format_month.
+No database is needed, the plan and trainings are kept in memory.
+
+    python -m benchmarks.calendar_render [--renders 10000]
+"""
+import argparse
+from datetime import date, timedelta
+
+from benchmarks.common import measure, setup_django, summarize
+
+
+def make_plan(month, year):
+    """Return an unsaved plan and its trainings of every other day."""
+    from runapp.calendar import month_date_range
+    from runapp.models import Training, TrainingPlan
+
+    first_day, next_month = month_date_range(month, year)
+    plan = TrainingPlan(pk=1, name='Marathon', start_date=first_day,
+                        end_date=next_month - timedelta(days=1))
+    trainings = {}
+    for day in range(1, (next_month - first_day).days + 1, 2):
+        trainings[day] = Training(
+            pk=day, training_plan=plan, main_training='Easy run',
+            additional_training='Strides',
+            date=date(year, month, day))
+    return plan, trainings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--renders', type=int, default=10000)
+    parser.add_argument('--month', type=int, default=5)
+    parser.add_argument('--year', type=int, default=2021)
+    args = parser.parse_args()
+
+    setup_django()
+    from runapp.calendar import TrainingCalendar, format_month
+
+    month, year = args.month, args.year
+    plan, trainings = make_plan(month, year)
+
+    def render_html_calendar():
+        TrainingCalendar(plan, month, year, trainings).formatmonth(year,
+                                                                   month)
+
+    def render_single_pass():
+        format_month(plan, month, year, trainings)
+
+    old = TrainingCalendar(plan, month, year, trainings).formatmonth(year,
+                                                                     month)
+    if format_month(plan, month, year, trainings) != old:
+        raise SystemExit('The renderers give different HTML.')
+
+    results = [
+        ('TrainingCalendar.formatmonth', render_html_calendar),
+        ('format_month', render_single_pass),
+    ]
+    totals = {}
+    for title, render in results:
+        timings = measure(render, args.renders)
+        totals[title] = sum(timings)
+        print(f'{title}: {args.renders} renders in {totals[title]:.0f} ms')
+        print(f'    {summarize(timings)}')
+    speedup = totals[results[0][0]] / totals[results[1][0]]
+    print(f'\nformat_month is {speedup:.1f}x faster')
+
+
+if __name__ == '__main__':
+    main()
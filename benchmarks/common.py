@@ -0,0 +1,52 @@
+"""Helpers shared by the benchmark scripts.
+
+The scripts are run from the project directory, e.g.
+``python -m benchmarks.query_plans``. Every script works on a scratch
+database created the same way as the test database, so the
+development database is never touched.
+"""
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+import django
+
+
+def setup_django():
+    """Configure Django with the project settings."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'RunSchedule.settings')
+    django.setup()
+
+
+@contextmanager
+def benchmark_database():
+    """Create a migrated scratch database and destroy it afterwards.
+
+    The databases are set up like the test runner does, so the replica
+    alias mirrors the scratch database.
+    """
+    from django.db import connection
+    from django.test.utils import setup_databases, teardown_databases
+
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield connection
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+
+def measure(function, repeat):
+    """Call the function repeatedly and return timings in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(timings):
+    """Return the mean and median of the timings as a short string."""
+    return (f'mean {statistics.mean(timings):.3f} ms, '
+            f'median {statistics.median(timings):.3f} ms')
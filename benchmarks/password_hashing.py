@@ -0,0 +1,91 @@
+"""Measure logins per second per core at different password hash costs.
+
+For scrypt at several work factors, Django's PBKDF2 hasher and Argon2
+if argon2-cffi is installed, create a user in a scratch database and
+authenticate it repeatedly in one thread, so the logins per second are
+those of a single core. Then create a club of users in bulk with one
+and with several hashing threads.
+
+    python -m benchmarks.password_hashing [--logins 20] [--club 200]
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.common import benchmark_database, measure, setup_django
+
+SCRYPT_WORK_FACTORS = (2 ** 12, 2 ** 13, 2 ** 14, 2 ** 15, 2 ** 16)
+
+
+def get_costs():
+    """Return (name, hasher, settings) of every benchmarked cost."""
+    costs = [(f'scrypt n=2^{factor.bit_length() - 1}',
+              'runapp.hashers.ScryptPasswordHasher',
+              {'PASSWORD_SCRYPT_WORK_FACTOR': factor})
+             for factor in SCRYPT_WORK_FACTORS]
+    costs.append(('pbkdf2_sha256 (Django default)',
+                  'django.contrib.auth.hashers.PBKDF2PasswordHasher', {}))
+    try:
+        import argon2  # noqa: F401
+    except ImportError:
+        print('Argon2 skipped, argon2-cffi is not installed.')
+    else:
+        costs.append(('argon2 (Django default)',
+                      'django.contrib.auth.hashers.Argon2PasswordHasher', {}))
+    return costs
+
+
+def benchmark_logins(logins):
+    """Print the login rate of one thread at every cost."""
+    from django.conf import settings
+    from django.contrib.auth import authenticate
+    from django.test.utils import override_settings
+
+    from runapp.models import User
+
+    for number, (name, hasher, cost) in enumerate(get_costs()):
+        hashers = [hasher] + [other for other in settings.PASSWORD_HASHERS
+                              if other != hasher]
+        with override_settings(PASSWORD_HASHERS=hashers, **cost):
+            email = f'login{number}@example.com'
+            User.objects.create_user(email, 'password')
+            timings = measure(lambda: authenticate(email=email,
+                                                   password='password'),
+                              logins)
+        print(f'{name:32} {1000 / statistics.mean(timings):8.1f} logins '
+              f'per second per core, median {statistics.median(timings):.1f}'
+              f' ms')
+
+
+def benchmark_club(club, workers):
+    """Print the users created per second with one and more threads."""
+    from runapp.models import User
+
+    for threads in (1, workers):
+        start = time.perf_counter()
+        User.objects.create_users(
+            [(f'member{threads}-{number}@example.com', 'password')
+             for number in range(club)], workers=threads)
+        duration = time.perf_counter() - start
+        print(f'{club} users with {threads} hashing threads in '
+              f'{duration:.2f} s, {club / duration:.1f} users per second')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=20,
+                        help='logins measured at every cost')
+    parser.add_argument('--club', type=int, default=200,
+                        help='users created in bulk')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='hashing threads of the bulk creation')
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        benchmark_logins(args.logins)
+        benchmark_club(args.club, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Print query plans and timings of the hot training lookups.
+
+Seed a scratch SQLite database with a million trainings and compare the
+calendar month lookup by date__year/date__month with the date range
+predicate, next to the current plan and training date lookups.
+
+    python -m benchmarks.query_plans [--trainings 1000000]
+"""
+import argparse
+import random
+from datetime import date, timedelta
+
+from benchmarks.common import (benchmark_database, measure, setup_django,
+                               summarize)
+
+
+def seed(trainings, plans_per_user, trainings_per_plan):
+    """Create users, plans and trainings in bulk."""
+    from runapp.models import Training, TrainingPlan, User
+
+    plan_count = trainings // trainings_per_plan
+    user_count = max(plan_count // plans_per_user, 1)
+    User.objects.bulk_create(
+        [User(email=f'runner{i}@example.com') for i in range(user_count)],
+        batch_size=5000)
+    user_ids = list(User.objects.values_list('pk', flat=True))
+
+    start_date = date(2021, 1, 1)
+    plans = []
+    for i in range(plan_count):
+        plan_start = start_date + timedelta(days=i % 365)
+        plans.append(TrainingPlan(
+            name=f'Plan {i}', owner_id=user_ids[i % user_count],
+            start_date=plan_start,
+            end_date=plan_start + timedelta(days=trainings_per_plan - 1),
+            current_plan=i < user_count))
+    TrainingPlan.objects.bulk_create(plans, batch_size=5000)
+
+    batch = []
+    for plan in TrainingPlan.objects.only('pk', 'start_date').iterator():
+        for day in range(trainings_per_plan):
+            batch.append(Training(training_plan_id=plan.pk,
+                                  date=plan.start_date + timedelta(days=day),
+                                  main_training='Easy run'))
+        if len(batch) >= 20000:
+            Training.objects.bulk_create(batch, batch_size=5000)
+            batch = []
+    Training.objects.bulk_create(batch, batch_size=5000)
+
+
+def explain(connection, queryset):
+    """Return the SQLite query plan of the queryset."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return '\n'.join(f'    {row[-1]}' for row in cursor.fetchall())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trainings', type=int, default=1000000)
+    parser.add_argument('--plans-per-user', type=int, default=5)
+    parser.add_argument('--trainings-per-plan', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+    from runapp.calendar import month_date_range
+    from runapp.models import Training, TrainingPlan
+
+    with benchmark_database() as connection:
+        print(f'Seeding {args.trainings} trainings...')
+        seed(args.trainings, args.plans_per_user, args.trainings_per_plan)
+        connection.cursor().execute('ANALYZE')
+
+        plans = list(TrainingPlan.objects.values_list(
+            'pk', 'owner_id', 'start_date'))
+        random.seed(0)
+
+        def month_lookup_old():
+            pk, _, start = random.choice(plans)
+            return Training.objects.filter(
+                training_plan_id=pk, date__year=start.year,
+                date__month=start.month).order_by('date')
+
+        def month_lookup_range():
+            pk, _, start = random.choice(plans)
+            first_day, next_month = month_date_range(start.month, start.year)
+            return Training.objects.filter(
+                training_plan_id=pk, date__gte=first_day,
+                date__lt=next_month).order_by('date')
+
+        def current_plan_lookup():
+            _, owner_id, _ = random.choice(plans)
+            return TrainingPlan.objects.filter(owner_id=owner_id,
+                                               current_plan=True)
+
+        def training_date_lookup():
+            pk, _, start = random.choice(plans)
+            return Training.objects.filter(training_plan_id=pk, date=start)
+
+        lookups = [
+            ('Calendar month (date__year/date__month)', month_lookup_old),
+            ('Calendar month (date range)', month_lookup_range),
+            ('Current plan (owner, current_plan)', current_plan_lookup),
+            ('Training on date (training_plan, date)', training_date_lookup),
+        ]
+        for title, lookup in lookups:
+            timings = measure(lambda: list(lookup()), args.repeat)
+            print(f'\n{title}')
+            print(explain(connection, lookup()))
+            print(f'    {summarize(timings)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""Load test every runapp URL with the Django test client.
+
+Seed a scratch database with the seed_data command, then let a number
+of threads, each logged in as a different user, request every URL of
+runapp/urls.py in turn. Print p50/p95/p99 latency, queries per request
+and throughput of each URL, optionally save the results as JSON and
+compare them with an earlier run.
+
+    python -m benchmarks.views [--threads 8] [--requests 50]
+        [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import logging
+import statistics
+import threading
+import time
+from collections import defaultdict
+
+from benchmarks.common import benchmark_database, setup_django
+
+# URLs not requested by the benchmark, with the reason.
+EXCLUDED = {
+    'logout': 'ends the session of the benchmark client',
+    'training_delete': 'accepts POST requests only',
+    'api_plan_trainings_bulk': 'accepts POST requests only',
+    'api_diary_bulk': 'accepts POST requests only',
+    'api_job_list': 'accepts POST requests only',
+}
+
+
+def get_url_arguments(user):
+    """Return the URL arguments of every benchmarked view for the user."""
+    from runapp.calendar import get_date_today
+    from runapp.ical import get_feed_token
+    from runapp.models import Job
+
+    plan = user.trainingplan_set.get(current_plan=True)
+    training = plan.training_set.order_by('date').first()
+    entry = user.trainingdiary_set.order_by('date').first()
+    job = Job.objects.get_or_create(name='refresh_summaries', owner=user)[0]
+    today = get_date_today()
+    return {
+        'landing_page': [],
+        'homepage': [],
+        'login': [],
+        'register_user': [],
+        'training_plan_create': [],
+        'training_plan_edit': [plan.pk],
+        'training_plan_details': [plan.pk],
+        'training_plan_clone': [plan.pk],
+        'training_plan_feed': [get_feed_token(plan)],
+        'training_plan_list': [],
+        'select_current_training_plan': [],
+        'training_create': [plan.pk],
+        'training_import': [plan.pk],
+        'training_shift': [plan.pk],
+        'training_edit': [training.pk],
+        'calendar': [today.month, today.year],
+        'year_calendar': [today.year],
+        'plan_calendar': [],
+        'training_diary': [],
+        'activity_import': [],
+        'diary_export': ['csv'],
+        'all_diaries_export': ['csv'],
+        'training_stats': [],
+        'adherence_report': [],
+        'diary_entry_create': [training.pk],
+        'profiling_stats': [],
+        'api_plan_list': [],
+        'api_plan': [plan.pk],
+        'api_plan_trainings': [plan.pk],
+        'api_plan_month': [plan.pk, today.year, today.month],
+        'api_training': [training.pk],
+        'api_diary': [],
+        'api_diary_entry': [entry.pk],
+        'api_job': [job.pk],
+        'async_training_plan_details': [plan.pk],
+        'async_training_plan_list': [],
+        'async_calendar': [today.month, today.year],
+        'async_training_diary': [],
+    }
+
+
+def get_url_names():
+    """Return the names of all runapp URLs."""
+    from runapp.urls import urlpatterns
+
+    return [pattern.name for pattern in urlpatterns]
+
+
+def run_client(user, repeat, results, errors, start):
+    """Request every URL as the user and record the measurements."""
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from django.urls import reverse
+
+    try:
+        client = Client()
+        client.force_login(user)
+        urls = [(name, reverse(f'runapp:{name}', args=arguments))
+                for name, arguments in get_url_arguments(user).items()]
+        start.wait()
+        for _ in range(repeat):
+            for name, url in urls:
+                with CaptureQueriesContext(connection) as queries:
+                    began = time.perf_counter()
+                    response = client.get(url)
+                    if hasattr(response, 'streaming_content'):
+                        b''.join(response.streaming_content)
+                    elapsed = (time.perf_counter() - began) * 1000
+                results[name].append(
+                    (elapsed, len(queries), response.status_code))
+    except Exception as error:
+        errors.append(error)
+    finally:
+        connection.close()
+
+
+def summarize_url(samples, threads):
+    """Return the latency percentiles and query counts of a URL.
+
+    The requests of a URL are interleaved with those of the other URLs,
+    so its throughput is the number of its requests divided by the time
+    the threads spent on it, which is their summed latency shared by
+    the threads running concurrently.
+    """
+    from runapp.profiling import percentile
+
+    timings = [elapsed for elapsed, _, _ in samples]
+    busy_seconds = sum(timings) / 1000 / threads
+    return {
+        'requests': len(samples),
+        'p50_ms': round(percentile(timings, 0.5), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'queries': round(statistics.mean(
+            queries for _, queries, _ in samples), 2),
+        'throughput_rps': round(len(samples) / busy_seconds, 1),
+        'status_codes': sorted({status for _, _, status in samples}),
+    }
+
+
+def compare(results, baseline):
+    """Print the change of p95 latency and queries against a baseline."""
+    print('\nComparison with the baseline (p95, queries):')
+    for name, result in results['urls'].items():
+        old = baseline['urls'].get(name)
+        if old is None:
+            print(f'{name:32} new')
+            continue
+        change = (result['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100
+        print(f'{name:32} {old["p95_ms"]:9.3f} -> {result["p95_ms"]:9.3f} '
+              f'ms ({change:+6.1f}%), queries {old["queries"]} -> '
+              f'{result["queries"]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=50,
+                        help='requests of every URL made by each thread')
+    parser.add_argument('--warmup', type=int, default=2,
+                        help='requests of every URL before measuring')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--plans-per-user', type=int, default=3)
+    parser.add_argument('--trainings-per-plan', type=int, default=90)
+    parser.add_argument('--diary-entries', type=int, default=60)
+    parser.add_argument('--output', help='save the results to a JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+    from django.test.utils import setup_test_environment
+
+    from runapp.models import User
+
+    setup_test_environment()
+    # Forbidden responses are expected, e.g. of the admin only views.
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    with benchmark_database():
+        call_command('seed_data', users=max(args.users, args.threads),
+                     plans_per_user=args.plans_per_user,
+                     trainings_per_plan=args.trainings_per_plan,
+                     diary_entries=args.diary_entries)
+        users = list(User.objects.order_by('pk')[:args.threads])
+        names = set(get_url_arguments(users[0])) | set(EXCLUDED)
+        missing = set(get_url_names()) - names
+        if missing:
+            raise SystemExit(f'No arguments for the URLs: {missing}')
+
+        if args.warmup:
+            run_client(users[0], args.warmup, defaultdict(list), [],
+                       threading.Barrier(1))
+
+        results = defaultdict(list)
+        errors = []
+        start = threading.Barrier(args.threads + 1)
+        workers = [threading.Thread(target=run_client, args=(
+            user, args.requests, results, errors, start)) for user in users]
+        for worker in workers:
+            worker.start()
+        start.wait()
+        began = time.perf_counter()
+        for worker in workers:
+            worker.join()
+        duration = time.perf_counter() - began
+        if errors:
+            raise SystemExit(f'The benchmark failed: {errors[0]!r}')
+
+    total = sum(len(samples) for samples in results.values())
+    output = {
+        'settings': vars(args),
+        'duration_s': round(duration, 3),
+        'requests': total,
+        'throughput_rps': round(total / duration, 1),
+        'urls': {name: summarize_url(samples, args.threads)
+                 for name, samples in sorted(results.items())},
+    }
+    print(f'{"URL":32} {"p50":>9} {"p95":>9} {"p99":>9} {"queries":>8} '
+          f'{"req/s":>8}  status')
+    for name, result in output['urls'].items():
+        print(f'{name:32} {result["p50_ms"]:9.3f} {result["p95_ms"]:9.3f} '
+              f'{result["p99_ms"]:9.3f} {result["queries"]:8} '
+              f'{result["throughput_rps"]:8}  {result["status_codes"]}')
+    print(f'\n{total} requests by {args.threads} threads in {duration:.2f} s'
+          f', {output["throughput_rps"]} requests per second')
+    for name, reason in EXCLUDED.items():
+        print(f'Skipped {name}: {reason}')
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(output, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(output, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
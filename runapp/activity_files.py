@@ -0,0 +1,163 @@
+import csv
+import io
+import math
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from time import perf_counter
+from xml.etree import ElementTree
+
+EARTH_RADIUS_KM = 6371.0088
+ACTIVITY_NAME = 'Run'
+
+
+def local_name(tag):
+    """Return the XML tag without the namespace."""
+    return tag.rsplit('}', 1)[-1]
+
+
+def parse_time(value):
+    """Return the timestamp of an activity file as a datetime."""
+    value = value.strip()
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment
+
+
+def distance_km(first, second):
+    """Return the great-circle distance between two (lat, lon) points."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (*first, *second))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(
+        lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def make_activity(start, distance, seconds, name):
+    """Return the activity with the distance in km and time in minutes."""
+    if not (math.isfinite(distance) and distance > 0
+            and math.isfinite(seconds) and seconds > 0):
+        raise ValueError(f'The run on {start.date()} has no distance or '
+                         f'time.')
+    return {
+        'date': start.date(),
+        'distance': Decimal(distance).quantize(Decimal('0.01')),
+        'time': max(round(seconds / 60), 1),
+        'name': (name or ACTIVITY_NAME)[:128],
+    }
+
+
+def parse_gpx(content):
+    """Return the activities of the tracks in GPX content."""
+    activities = []
+    for track in ElementTree.fromstring(content).iter():
+        if local_name(track.tag) != 'trk':
+            continue
+        name = None
+        points = []
+        for element in track.iter():
+            tag = local_name(element.tag)
+            if tag == 'name' and name is None:
+                name = (element.text or '').strip()
+            elif tag == 'trkpt':
+                moment = next((child.text for child in element
+                               if local_name(child.tag) == 'time'), None)
+                if moment is None:
+                    raise ValueError('Track point without time.')
+                points.append(((float(element.get('lat')),
+                                float(element.get('lon'))),
+                               parse_time(moment)))
+        if len(points) < 2:
+            continue
+        distance = sum(distance_km(first[0], second[0])
+                       for first, second in zip(points, points[1:]))
+        seconds = (points[-1][1] - points[0][1]).total_seconds()
+        activities.append(make_activity(points[0][1], distance, seconds,
+                                        name))
+    if not activities:
+        raise ValueError('The file contains no track with time stamps.')
+    return activities
+
+
+def parse_tcx(content):
+    """Return the activities of TCX content summed over their laps."""
+    activities = []
+    for activity in ElementTree.fromstring(content).iter():
+        if local_name(activity.tag) != 'Activity':
+            continue
+        start = next((child.text for child in activity
+                      if local_name(child.tag) == 'Id'), None)
+        if start is None:
+            raise ValueError('Activity without Id.')
+        meters = seconds = 0
+        for lap in activity:
+            if local_name(lap.tag) != 'Lap':
+                continue
+            for child in lap:
+                if local_name(child.tag) == 'DistanceMeters':
+                    meters += float(child.text)
+                elif local_name(child.tag) == 'TotalTimeSeconds':
+                    seconds += float(child.text)
+        activities.append(make_activity(parse_time(start), meters / 1000,
+                                        seconds, activity.get('Sport')))
+    if not activities:
+        raise ValueError('The file contains no activity.')
+    return activities
+
+
+def parse_activities_csv(content):
+    """Return activities from CSV rows with a header row.
+
+    The columns are date (YYYY-MM-DD), distance in kilometres, time in
+    minutes and the optional name. The distance and time must be
+    positive.
+    """
+    activities = []
+    reader = csv.DictReader(io.StringIO(content.decode('utf-8-sig')))
+    for number, row in enumerate(reader, start=1):
+        try:
+            day = datetime.strptime(row['date'], '%Y-%m-%d').date()
+            distance = Decimal(row['distance'])
+            time = int(row['time'])
+        except (KeyError, TypeError, ValueError, InvalidOperation):
+            raise ValueError(f'Row {number} needs a date (YYYY-MM-DD), '
+                             f'distance and time.')
+        if not (distance.is_finite() and distance > 0 and time > 0):
+            raise ValueError(f'Row {number} needs a positive distance and '
+                             f'time.')
+        activities.append({
+            'date': day,
+            'distance': distance.quantize(Decimal('0.01')),
+            'time': time,
+            'name': (row.get('name') or ACTIVITY_NAME)[:128],
+        })
+    return activities
+
+
+PARSERS = {
+    '.gpx': parse_gpx,
+    '.tcx': parse_tcx,
+    '.csv': parse_activities_csv,
+}
+
+
+def parse_activity_file(name, content):
+    """Parse an activity file and measure how long it took.
+
+    Return the file name, the list of activities, the error message or
+    None and the parsing time in seconds. Errors are returned instead
+    of raised, so one broken file does not stop a batch. The database
+    is not used, so files can be parsed in worker processes.
+    """
+    start = perf_counter()
+    parser = PARSERS.get(name[name.rfind('.'):].lower())
+    activities, error = [], None
+    if parser is None:
+        error = 'Only GPX, TCX and CSV files can be imported.'
+    else:
+        try:
+            activities = parser(content)
+        except (TypeError, ValueError, ElementTree.ParseError) as exception:
+            error = str(exception) or 'The file cannot be read.'
+    return name, activities, error, perf_counter() - start
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 
-from .models import User
+from .models import Job, PlanTemplate, PlanTemplateTraining, User
 
 
 class UserAdmin(BaseUserAdmin):
@@ -23,4 +23,29 @@ class UserAdmin(BaseUserAdmin):
     filter_horizontal = ()
 
 
+class PlanTemplateTrainingInline(admin.TabularInline):
+    """Inline for the trainings of a plan template."""
+    model = PlanTemplateTraining
+    ordering = ('day',)
+
+
+class PlanTemplateAdmin(admin.ModelAdmin):
+    """ModelAdmin for plan templates."""
+    inlines = (PlanTemplateTrainingInline,)
+    list_display = ('name', 'duration', 'author')
+    search_fields = ('name',)
+
+
+class JobAdmin(admin.ModelAdmin):
+    """ModelAdmin for background jobs."""
+    list_display = ('name', 'status', 'attempts', 'progress_done',
+                    'progress_total', 'owner', 'created_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('attempts', 'progress_done', 'progress_total',
+                       'result', 'error', 'worker', 'created_at',
+                       'started_at', 'heartbeat_at', 'finished_at')
+
+
 admin.site.register(User, UserAdmin)
+admin.site.register(PlanTemplate, PlanTemplateAdmin)
+admin.site.register(Job, JobAdmin)
@@ -0,0 +1,399 @@
+import json
+
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.exceptions import (BadRequest, PermissionDenied,
+                                    ValidationError)
+from django.db import transaction
+from django.db.models import Count, Max
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views import View
+
+from runapp.calendar import is_valid_year, month_date_range
+from runapp.conditional import conditional_response
+from runapp.forms import DiaryEntryForm, TrainingForm, TrainingPlanForm
+from runapp.importers import import_trainings, training_row
+from runapp.jobs import enqueue
+from runapp.models import (Job, TrainingPlan, Training, TrainingDiary,
+                           TrainingSummary)
+from runapp.pagination import paginate_by_date
+
+
+def plan_data(plan):
+    """Return the training plan as a dictionary."""
+    return {
+        'id': plan.pk,
+        'name': plan.name,
+        'start_date': plan.start_date,
+        'end_date': plan.end_date,
+        'current_plan': plan.current_plan,
+        'description': plan.description,
+        'trainings_total': plan.trainings_total,
+        'trainings_completed': plan.trainings_completed,
+        'completed_distance': plan.completed_distance,
+        'updated_at': plan.updated_at,
+    }
+
+
+def training_data(training):
+    """Return the training as a dictionary."""
+    return {
+        'id': training.pk,
+        'training_plan': training.training_plan_id,
+        'date': training.date,
+        'main_training': training.main_training,
+        'additional_training': training.additional_training,
+        'completed': training.completed,
+        'updated_at': training.updated_at,
+    }
+
+
+def entry_data(entry):
+    """Return the diary entry as a dictionary."""
+    return {
+        'id': entry.pk,
+        'date': entry.date,
+        'training_information': entry.training_information,
+        'training_distance': entry.training_distance,
+        'training_time': entry.training_time,
+        'average_speed': entry.average_speed,
+        'notes': entry.notes,
+        'updated_at': entry.updated_at,
+    }
+
+
+def job_data(job):
+    """Return the status of the background job as a dictionary."""
+    return {
+        'id': job.pk,
+        'name': job.name,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'progress_done': job.progress_done,
+        'progress_total': job.progress_total,
+        'result': job.result,
+        'error': job.error,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'heartbeat_at': job.heartbeat_at,
+        'finished_at': job.finished_at,
+    }
+
+
+def error_response(message, status, errors=None):
+    """Return a JSON response describing the error."""
+    data = {'error': message}
+    if errors is not None:
+        data['errors'] = errors
+    return JsonResponse(data, status=status)
+
+
+def json_response(request, etag, last_modified, get_data):
+    """Return 304 Not Modified or the JSON data with validators."""
+    return conditional_response(
+        request, etag, last_modified,
+        lambda: JsonResponse(get_data(), safe=False))
+
+
+def plan_etag(plan, resource):
+    """Return the ETag of a resource derived from the plan version."""
+    return f'{resource}-{plan.pk}-{plan.version}'
+
+
+def parse_json(request, expected_type=dict):
+    """Return the decoded JSON body of the request.
+
+    Raise BadRequest if the body is not valid JSON of the expected type.
+    """
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        raise BadRequest('Invalid JSON')
+    if not isinstance(data, expected_type):
+        raise BadRequest(f'Expected a JSON {expected_type.__name__}')
+    return data
+
+
+class ApiView(LoginRequiredMixin, View):
+    """Base view for the JSON API endpoints."""
+
+    def handle_no_permission(self):
+        """Return an error instead of redirecting to the login page."""
+        return error_response('Authentication required', 401)
+
+    def dispatch(self, request, *args, **kwargs):
+        """Return JSON errors for denied, missing and bad requests."""
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except PermissionDenied:
+            return error_response('Forbidden', 403)
+        except Http404:
+            return error_response('Not found', 404)
+        except BadRequest as error:
+            return error_response(str(error), 400)
+
+    @staticmethod
+    def get_plan(request, pk):
+        """Return the user's training plan."""
+        training_plan = get_object_or_404(TrainingPlan, pk=pk)
+        training_plan.confirm_owner(request.user)
+        return training_plan
+
+
+class PlanListApiView(ApiView):
+    """List the user's training plans or create a new one."""
+
+    def get(self, request):
+        """Return all user training plans."""
+        plans = TrainingPlan.objects.filter(owner=request.user)
+        state = plans.aggregate(count=Count('pk'), updated=Max('updated_at'))
+        updated = state['updated']
+        etag = f'plans-{request.user.pk}-{state["count"]}-' \
+               f'{updated.timestamp() if updated else 0}'
+        return json_response(
+            request, etag, updated,
+            lambda: [plan_data(plan) for plan in plans.order_by('pk')])
+
+    def post(self, request):
+        """Create a new training plan."""
+        form = TrainingPlanForm(data=parse_json(request))
+        if not form.is_valid():
+            return error_response('Invalid data', 400, form.errors)
+        form.instance.owner = request.user
+        training_plan = form.save()
+        training_plan.refresh_from_db()
+        return JsonResponse(plan_data(training_plan), status=201)
+
+
+class PlanApiView(ApiView):
+    """Return a single training plan."""
+
+    def get(self, request, pk):
+        """Return the training plan."""
+        training_plan = self.get_plan(request, pk)
+        return json_response(
+            request, plan_etag(training_plan, 'plan'),
+            training_plan.updated_at, lambda: plan_data(training_plan))
+
+
+class PlanTrainingsApiView(ApiView):
+    """List the trainings of a plan or add a new one."""
+
+    def get(self, request, pk):
+        """Return all trainings of the plan."""
+        training_plan = self.get_plan(request, pk)
+        trainings = training_plan.training_set.order_by('date')
+        return json_response(
+            request, plan_etag(training_plan, 'trainings'),
+            training_plan.updated_at,
+            lambda: [training_data(training) for training in trainings])
+
+    def post(self, request, pk):
+        """Add a new training to the plan."""
+        training_plan = self.get_plan(request, pk)
+        form = TrainingForm(data=parse_json(request), user=request.user)
+        form.instance.training_plan = training_plan
+        if not form.is_valid():
+            return error_response('Invalid data', 400, form.errors)
+        with transaction.atomic():
+            training = form.save()
+            TrainingPlan.update_counters(training_plan.pk, total=1)
+        return JsonResponse(training_data(training), status=201)
+
+
+class PlanTrainingsBulkApiView(ApiView):
+    """Add many trainings to a plan at once."""
+
+    def post(self, request, pk):
+        """Validate and add a list of trainings to the plan."""
+        training_plan = self.get_plan(request, pk)
+        rows = parse_json(request, list)
+        if not all(isinstance(row, dict) for row in rows):
+            raise BadRequest('Expected a list of trainings')
+        try:
+            trainings = import_trainings(
+                training_plan, [training_row(row) for row in rows])
+        except ValidationError as error:
+            return error_response('Invalid data', 400, error.messages)
+        return JsonResponse({'created': len(trainings)}, status=201)
+
+
+class PlanMonthApiView(ApiView):
+    """Return a plan with all its trainings in the given month."""
+
+    def get(self, request, pk, year, month):
+        """Return the training plan and trainings of the month."""
+        if not 1 <= month <= 12 or not is_valid_year(year):
+            raise Http404
+        training_plan = self.get_plan(request, pk)
+        first_day, first_day_next_month = month_date_range(month, year)
+        trainings = training_plan.training_set.filter(
+            date__gte=first_day, date__lt=first_day_next_month
+        ).order_by('date')
+        return json_response(
+            request, plan_etag(training_plan, f'month-{year}-{month}'),
+            training_plan.updated_at,
+            lambda: {
+                'training_plan': plan_data(training_plan),
+                'trainings': [training_data(training)
+                              for training in trainings],
+            })
+
+
+class TrainingApiView(ApiView):
+    """Return a single training."""
+
+    def get(self, request, pk):
+        """Return the training."""
+        training = get_object_or_404(
+            Training.objects.select_related('training_plan'), pk=pk)
+        training.training_plan.confirm_owner(request.user)
+        return json_response(
+            request, f'training-{training.pk}-'
+                     f'{training.updated_at.timestamp()}',
+            training.updated_at, lambda: training_data(training))
+
+
+class DiaryApiView(ApiView):
+    """List the user's diary entries or add a new one."""
+
+    def get(self, request):
+        """Return a page of diary entries after the cursor."""
+        cursor = request.GET.get('after')
+        entries = request.user.trainingdiary_set.all()
+        state = entries.aggregate(count=Count('pk'),
+                                  updated=Max('updated_at'))
+        updated = state['updated']
+        etag = f'diary-{request.user.pk}-{state["count"]}-' \
+               f'{updated.timestamp() if updated else 0}-{cursor or ""}'
+
+        def get_data():
+            page, next_cursor = paginate_by_date(entries, cursor)
+            return {'results': [entry_data(entry) for entry in page],
+                    'next': next_cursor}
+
+        return json_response(request, etag, updated, get_data)
+
+    def post(self, request):
+        """Add a new diary entry, optionally completing a training."""
+        data = parse_json(request)
+        training = None
+        if data.get('training') is not None:
+            training = get_object_or_404(
+                Training.objects.select_related('training_plan'),
+                pk=data['training'])
+            training.training_plan.confirm_owner(request.user)
+            if training.completed:
+                return error_response('Training already completed', 400)
+        form = DiaryEntryForm(data=data)
+        if not form.is_valid():
+            return error_response('Invalid data', 400, form.errors)
+        form.instance.user = request.user
+        form.instance.average_speed = form.cleaned_data.get(
+            'training_distance') / form.cleaned_data.get('training_time')
+        with transaction.atomic():
+            entry = form.save()
+            if training is not None and not training.mark_completed(entry):
+                transaction.set_rollback(True)
+                return error_response('Training already completed', 400)
+        entry.refresh_from_db()
+        return JsonResponse(entry_data(entry), status=201)
+
+
+class DiaryBulkApiView(ApiView):
+    """Add many diary entries at once."""
+
+    def post(self, request):
+        """Validate and add a list of diary entries.
+
+        Every entry is checked before anything is saved. Entries may
+        complete a training like those added one at a time; if any is
+        invalid, the errors of all entries are returned by their index.
+        """
+        rows = parse_json(request, list)
+        if not all(isinstance(row, dict) for row in rows):
+            raise BadRequest('Expected a list of diary entries')
+        trainings = Training.objects.filter(
+            training_plan__owner=request.user).in_bulk(
+            [row['training'] for row in rows
+             if isinstance(row.get('training'), int)])
+        entries = []
+        completing = set()
+        errors = {}
+        for index, row in enumerate(rows):
+            form = DiaryEntryForm(data=row)
+            row_errors = {} if form.is_valid() else dict(form.errors)
+            training = None
+            if row.get('training') is not None:
+                training = trainings.get(row['training'])
+                if training is None:
+                    row_errors['training'] = ['Training not found']
+                elif training.completed or training.pk in completing:
+                    row_errors['training'] = ['Training already completed']
+            if row_errors:
+                errors[index] = row_errors
+                continue
+            form.instance.user = request.user
+            form.instance.average_speed = form.cleaned_data.get(
+                'training_distance') / form.cleaned_data.get('training_time')
+            entries.append((form.instance, training))
+            if training is not None:
+                completing.add(training.pk)
+        if errors:
+            return error_response('Invalid data', 400, errors)
+
+        with transaction.atomic():
+            TrainingDiary.objects.bulk_create(
+                [entry for entry, _ in entries])
+            for entry, training in entries:
+                if training is not None and \
+                        not training.mark_completed(entry):
+                    transaction.set_rollback(True)
+                    return error_response('Training already completed', 400)
+            TrainingSummary.refresh(request.user.pk)
+        return JsonResponse({'created': len(entries)}, status=201)
+
+
+class DiaryEntryApiView(ApiView):
+    """Return a single diary entry."""
+
+    def get(self, request, pk):
+        """Return the diary entry."""
+        entry = get_object_or_404(TrainingDiary, pk=pk, user=request.user)
+        return json_response(
+            request, f'entry-{entry.pk}-{entry.updated_at.timestamp()}',
+            entry.updated_at, lambda: entry_data(entry))
+
+
+class JobListApiView(ApiView):
+    """Start a background job."""
+
+    def post(self, request):
+        """Enqueue the named job with the arguments, admins only."""
+        if not request.user.is_admin:
+            raise PermissionDenied
+        data = parse_json(request)
+        arguments = data.get('arguments', {})
+        if not isinstance(data.get('name'), str) or \
+                not isinstance(arguments, dict):
+            raise BadRequest('Expected a job name and an arguments object')
+        try:
+            job = enqueue(data['name'], owner=request.user, **arguments)
+        except ValueError as error:
+            return error_response(str(error), 400)
+        response = JsonResponse(job_data(job), status=202)
+        response['Location'] = reverse('runapp:api_job', args=[job.pk])
+        return response
+
+
+class JobApiView(ApiView):
+    """Return the status of a background job."""
+
+    def get(self, request, pk):
+        """Return the job of the user, admins can see all jobs."""
+        job = get_object_or_404(Job, pk=pk)
+        if job.owner_id != request.user.pk and not request.user.is_admin:
+            raise PermissionDenied
+        return JsonResponse(job_data(job))
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RunappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'runapp'
+
+    def ready(self):
+        """Connect the application signal handlers."""
+        from runapp import signals  # noqa: F401
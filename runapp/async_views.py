@@ -0,0 +1,143 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.mixins import AccessMixin
+from django.shortcuts import redirect, render, get_object_or_404
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.decorators import classonlymethod
+from django.views import View
+
+from runapp.calendar import (get_date_today, previous_and_next_month,
+                             render_month)
+from runapp.fragments import cached_fragment
+from runapp.ical import get_feed_token
+from runapp.models import TrainingPlan
+from runapp.pagination import paginate_by_date
+from runapp.profiling import timer
+
+render_async = sync_to_async(render)
+cached_fragment_async = sync_to_async(cached_fragment)
+
+
+class AsyncView(View):
+    """Base class for views with async request handlers.
+
+    Under ASGI the handlers run on the event loop, the database queries
+    and template rendering are moved to a worker thread with
+    sync_to_async, so slow clients do not hold a thread each.
+    """
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        """Return the view function marked as a coroutine function."""
+        view = super().as_view(**initkwargs)
+        view._is_coroutine = asyncio.coroutines._is_coroutine
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        """Await the handler, the sync responses are returned as is."""
+        response = super().dispatch(request, *args, **kwargs)
+        if asyncio.iscoroutine(response):
+            response = await response
+        return response
+
+
+class AsyncLoginRequiredMixin(AccessMixin):
+    """Verify that the current user of an async view is authenticated."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        """Load the user off the event loop and check the login."""
+        is_authenticated = await sync_to_async(
+            lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return self.handle_no_permission()
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncCurrentPlanCalendarView(AsyncLoginRequiredMixin, AsyncView):
+    """Display a monthly calendar with the user's current plan."""
+    replica_reads = True
+
+    async def get(self, request, month, year):
+        """Display a calendar for the given month."""
+        current_plan = await sync_to_async(TrainingPlan.get_current)(
+            request.user)
+        context = {'training_plan': current_plan}
+        if current_plan is not None:
+            monthly_calendar = await sync_to_async(render_month)(
+                current_plan, month, year)
+            previous_month, next_month = previous_and_next_month(month, year)
+            context.update({
+                'monthly_calendar': monthly_calendar,
+                'previous_month': previous_month,
+                'next_month': next_month,
+            })
+        with timer('render'):
+            return await render_async(
+                request, 'runapp/current_plan_calendar.html', context)
+
+
+class AsyncTrainingDiaryView(AsyncLoginRequiredMixin, AsyncView):
+    """View for displaying a training diary."""
+    replica_reads = True
+
+    async def get(self, request):
+        """Display a single page of entries after the cursor.
+
+        Streaming all entries needs a sync iterator over the database,
+        so such requests are redirected to the sync diary view, which
+        reads the entries in its thread under ASGI.
+        """
+        if request.GET.get('stream'):
+            return redirect(f'{reverse("runapp:training_diary")}?stream=1')
+        cursor = request.GET.get('after')
+        entries, next_cursor = await sync_to_async(paginate_by_date)(
+            request.user.trainingdiary_set.all(), cursor)
+        context = {'entries': entries, 'cursor': cursor,
+                   'next_cursor': next_cursor}
+        with timer('render'):
+            return await render_async(
+                request, 'runapp/training_diary.html', context)
+
+
+class AsyncTrainingPlanDetailsView(AsyncLoginRequiredMixin, AsyncView):
+    """View for displaying details about the training plan."""
+    replica_reads = True
+
+    async def get(self, request, pk):
+        """Display information about the selected training plan."""
+        training_plan = await sync_to_async(get_object_or_404)(
+            TrainingPlan, pk=pk)
+        training_plan.confirm_owner(request.user)
+        today = get_date_today()
+        trainings_html = await cached_fragment_async(
+            'training_plan_trainings',
+            (training_plan.pk, training_plan.version, today),
+            lambda: render_to_string(
+                'runapp/training_plan_trainings.html',
+                {'trainings': training_plan.training_set.order_by('date'),
+                 'today': today}))
+        context = {'training_plan': training_plan,
+                   'trainings_html': trainings_html,
+                   'feed_token': get_feed_token(training_plan)}
+        return await render_async(
+            request, 'runapp/training_plan_details.html', context)
+
+
+class AsyncTrainingPlanListView(AsyncLoginRequiredMixin, AsyncView):
+    """View for displaying the list of user training plans."""
+    replica_reads = True
+
+    async def get(self, request):
+        """Display all user training plans."""
+        training_plans_html = await cached_fragment_async(
+            'training_plan_list',
+            (request.user.pk, request.user.plans_version),
+            lambda: render_to_string(
+                'runapp/training_plan_list_items.html',
+                {'training_plans': TrainingPlan.objects.filter(
+                    owner=request.user)}))
+        return await render_async(
+            request, 'runapp/training_plan_list.html',
+            {'training_plans_html': training_plans_html})
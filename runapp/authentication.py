@@ -0,0 +1,119 @@
+import copy
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import HASH_SESSION_KEY, SESSION_KEY
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+
+
+class UserCache:
+    """Keep recently authenticated users in memory for a short time.
+
+    Entries are keyed on the user id and the session auth hash, so a
+    changed password never matches an old entry. Entries expire after
+    the TTL; the least recently used ones are evicted once the cache is
+    full.
+
+    With a shared cache alias every entry also stores the user's token
+    from that cache. Invalidating replaces the token, so the entries
+    kept by other processes stop matching as well.
+    """
+
+    def __init__(self, max_size, ttl, cache_alias=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def _token_key(self, user_id):
+        return 'user_cache:%s' % user_id
+
+    def get_token(self, user_id):
+        """Return the shared token of the user, creating it if missing."""
+        if self.cache_alias is None:
+            return None
+        cache = caches[self.cache_alias]
+        key = self._token_key(user_id)
+        token = cache.get(key)
+        if token is None:
+            cache.add(key, uuid4().hex, None)
+            token = cache.get(key)
+        return token
+
+    def get(self, key):
+        """Return a copy of the cached user or None if it is not cached."""
+        with self._lock:
+            try:
+                user, expires, token = self._entries[key]
+            except KeyError:
+                return None
+            if expires < monotonic():
+                del self._entries[key]
+                return None
+        if token != self.get_token(key[0]):
+            with self._lock:
+                self._entries.pop(key, None)
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return copy.copy(user)
+
+    def set(self, key, user, token=None):
+        """Store the user, evicting the least recently used one.
+
+        The token has to be read with get_token before the user is
+        loaded, so a change made in between invalidates the entry.
+        """
+        with self._lock:
+            self._entries[key] = (copy.copy(user), monotonic() + self.ttl,
+                                  token)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """Remove all cached entries of the user in every process."""
+        if self.cache_alias is not None:
+            caches[self.cache_alias].set(
+                self._token_key(user_id), uuid4().hex, None)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        """Remove all cached users."""
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(getattr(settings, 'AUTH_USER_CACHE_SIZE', 1024),
+                       getattr(settings, 'AUTH_USER_CACHE_TTL', 30),
+                       getattr(settings, 'AUTH_USER_CACHE_ALIAS', None))
+
+
+def get_user(request):
+    """Return the user of the request session, cached between requests.
+
+    On a miss the user is loaded and verified by Django's get_user and
+    stored only if it is authenticated.
+    """
+    try:
+        user_id = auth.get_user_model()._meta.pk.to_python(
+            request.session[SESSION_KEY])
+        key = (user_id, request.session[HASH_SESSION_KEY])
+    except (KeyError, ValidationError):
+        return auth.get_user(request)
+    user = user_cache.get(key)
+    if user is None:
+        token = user_cache.get_token(user_id)
+        user = auth.get_user(request)
+        if user.is_authenticated and user.pk == key[0]:
+            user_cache.set(key, user, token)
+    return user
@@ -1,22 +1,32 @@
 from calendar import HTMLCalendar
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import MAXYEAR, MINYEAR, datetime, timedelta
+from functools import lru_cache
+from threading import Lock
 
+from django.conf import settings
 from django.shortcuts import reverse
 from django.utils.http import urlencode
 from django.utils.safestring import mark_safe
 
+from runapp.profiling import timer
+
+URL_PLACEHOLDER_PK = 2147483647
+
 
 class TrainingCalendar(HTMLCalendar):
     """Create a monthly training calendar in HTML"""
     table_css = 'table calendar'
     training_css = 'training_info'
 
-    def __init__(self, training_plan, month, year):
+    def __init__(self, training_plan, month, year, trainings=None):
         super(TrainingCalendar, self).__init__()
         self.month = month
         self.year = year
         self.training_plan = training_plan
-        self.trainings = self.get_trainings()
+        if trainings is None:
+            trainings = self.get_trainings()
+        self.trainings = trainings
 
     def formatday(self, day, weekday):
         """Return a formatted day as a table cell."""
@@ -86,8 +96,11 @@ class TrainingCalendar(HTMLCalendar):
 
     def get_trainings(self):
         """Create a dictionary mapping day with training."""
+        first_day, first_day_next_month = month_date_range(self.month,
+                                                           self.year)
         trainings = self.training_plan.training_set.filter(
-            date__year=self.year, date__month=self.month).order_by('date')
+            date__gte=first_day, date__lt=first_day_next_month
+        ).order_by('date')
         return {t.date.day: t for t in trainings}
 
     def previous_and_next_month(self):
@@ -96,16 +109,222 @@ class TrainingCalendar(HTMLCalendar):
         Return previous and next month dictionaries containing month
         and year numbers for these months.
         """
-        first_day_current_month = self.create_date(day=1)
-        last_day_previous_month = first_day_current_month - timedelta(days=1)
-        some_day_next_month = (first_day_current_month + timedelta(days=32))
+        return previous_and_next_month(self.month, self.year)
+
+
+@lru_cache(maxsize=256)
+def month_layout(year, month):
+    """Return the static parts of the monthly calendar table.
+
+    Return the table header with the month name and weekday names, and
+    the weeks of the month as lists of (day, date, css class) tuples
+    with None for the days outside the month.
+    """
+    calendar = HTMLCalendar()
+    header = f'<table border="0" cellpadding="0" cellspacing="0"' \
+             f' class="{TrainingCalendar.table_css}">\n' \
+             f'{calendar.formatmonthname(year, month)}\n' \
+             f'{calendar.formatweekheader()}\n'
+    weeks = [
+        [(day, datetime(year=year, month=month, day=day).date(),
+          calendar.cssclasses[weekday]) if day else None
+         for day, weekday in week]
+        for week in calendar.monthdays2calendar(year, month)
+    ]
+    return header, weeks
+
+
+def format_month(training_plan, month, year, trainings):
+    """Return the plan's monthly calendar in HTML.
+
+    Give the same result as TrainingCalendar.formatmonth, but resolve
+    the training URLs and the highlighted dates once per month instead
+    of once per day and build the table in a single pass.
+    """
+    header, weeks = month_layout(year, month)
+    add_url = reverse('runapp:training_create', args=[training_plan.pk])
+    edit_url = reverse('runapp:training_edit', args=[URL_PLACEHOLDER_PK])
+    edit_prefix, edit_suffix = edit_url.split(str(URL_PLACEHOLDER_PK))
+    highlights = {training_plan.end_date: 'plan_end',
+                  training_plan.start_date: 'plan_start',
+                  get_date_today(): 'today'}
+    noday = f'<td class="{TrainingCalendar.cssclass_noday}">&nbsp;</td>'
+    training_css = TrainingCalendar.training_css
+
+    result = [header]
+    a = result.append
+    for week in weeks:
+        a('<tr>')
+        for cell in week:
+            if cell is None:
+                a(noday)
+                continue
+            day, date, css_class = cell
+            training = trainings.get(day)
+            highlight = highlights.get(date)
+            if highlight is None and training is not None:
+                highlight = 'training_day'
+            if highlight is not None:
+                css_class = f'{css_class} {highlight}'
+            if training is None:
+                a(f'<td class="{css_class}"><a href="{add_url}?date={date}">'
+                  f'{day}</a></td>')
+            else:
+                a(f'<td class="{css_class}"><a href="{edit_prefix}'
+                  f'{training.pk}{edit_suffix}?date={date}">{day}<br>'
+                  f'<div class="{training_css}">{training}</div></a></td>')
+        a('</tr>\n')
+    a('</table>\n')
+    return mark_safe(''.join(result))
+
+
+class MonthCache:
+    """Keep recently rendered monthly calendars in memory.
+
+    Entries are keyed on the plan id, year, month, plan version and
+    today's date. The least recently used entries are evicted once the
+    cache is full.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def make_key(training_plan, month, year):
+        """Return the cache key for the plan's monthly calendar."""
+        return (training_plan.pk, year, month, training_plan.version,
+                get_date_today())
+
+    def get(self, key):
+        """Return the cached calendar or None if it is not cached."""
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                return None
+            return self._entries[key]
+
+    def set(self, key, monthly_calendar):
+        """Store the calendar, evicting the least recently used one."""
+        with self._lock:
+            self._entries[key] = monthly_calendar
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, plan_id):
+        """Remove all cached calendars of the training plan."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == plan_id]:
+                del self._entries[key]
+
+    def clear(self):
+        """Remove all cached calendars."""
+        with self._lock:
+            self._entries.clear()
+
+
+month_cache = MonthCache(getattr(settings, 'CALENDAR_CACHE_SIZE', 512))
+
+
+def render_month(training_plan, month, year):
+    """Return the plan's monthly calendar in HTML.
+
+    Serve the calendar from the month cache when possible, otherwise
+    render it and store it in the cache.
+    """
+    return render_months(training_plan, [(month, year)])[0]
+
+
+def render_months(training_plan, months):
+    """Return the plan's calendars in HTML for a list of (month, year).
+
+    The months must be given in chronological order. Serve the
+    calendars from the month cache when possible. The trainings of all
+    other months are fetched in a single query and the rendered
+    calendars are stored in the cache.
+    """
+    keys = [month_cache.make_key(training_plan, month, year)
+            for month, year in months]
+    calendars = [month_cache.get(key) for key in keys]
+    missing = [index for index, calendar in enumerate(calendars)
+               if calendar is None]
+    if not missing:
+        return calendars
+
+    with timer('calendar'):
+        first_day = month_date_range(*months[missing[0]])[0]
+        last_day = month_date_range(*months[missing[-1]])[1]
+        trainings = get_trainings_by_month(training_plan, first_day,
+                                           last_day)
+        for index in missing:
+            month, year = months[index]
+            calendars[index] = format_month(
+                training_plan, month, year, trainings.get((year, month), {}))
+            month_cache.set(keys[index], calendars[index])
+    return calendars
+
+
+def get_trainings_by_month(training_plan, first_day, last_day):
+    """Return the plan's trainings between the dates grouped by month.
+
+    The dictionary maps (year, month) pairs with dictionaries mapping
+    days with trainings, the last day is not included.
+    """
+    trainings = {}
+    for training in training_plan.training_set.filter(
+            date__gte=first_day, date__lt=last_day).order_by('date'):
+        month = trainings.setdefault(
+            (training.date.year, training.date.month), {})
+        month[training.date.day] = training
+    return trainings
+
+
+def months_between(first_day, last_day):
+    """Return (month, year) pairs of all months between the dates."""
+    months = []
+    month, year = first_day.month, first_day.year
+    while (year, month) <= (last_day.year, last_day.month):
+        months.append((month, year))
+        month, year = (1, year + 1) if month == 12 else (month + 1, year)
+    return months
+
+
+def is_valid_year(year):
+    """Return True if the calendars of the year and its neighbours fit.
+
+    The first and the last supported years are left out, so the ranges
+    and links reaching into the previous and next years stay valid.
+    """
+    return MINYEAR < year < MAXYEAR
+
+
+def month_date_range(month, year):
+    """Return the first day of the month and of the following month."""
+    first_day = datetime(year=year, month=month, day=1).date()
+    if month == 12:
+        return first_day, datetime(year=year + 1, month=1, day=1).date()
+    return first_day, datetime(year=year, month=month + 1, day=1).date()
+
+
+def previous_and_next_month(month, year):
+    """Calculate the previous and next month for the given month.
+
+    Return previous and next month dictionaries containing month
+    and year numbers for these months.
+    """
+    first_day_current_month = datetime(year=year, month=month, day=1).date()
+    last_day_previous_month = first_day_current_month - timedelta(days=1)
+    some_day_next_month = (first_day_current_month + timedelta(days=32))
 
-        previous_month = {'month': last_day_previous_month.month,
-                          'year': last_day_previous_month.year}
-        next_month = {'month': some_day_next_month.month,
-                      'year': some_day_next_month.year}
+    previous_month = {'month': last_day_previous_month.month,
+                      'year': last_day_previous_month.year}
+    next_month = {'month': some_day_next_month.month,
+                  'year': some_day_next_month.year}
 
-        return previous_month, next_month
+    return previous_month, next_month
 
 
 def get_date_today():
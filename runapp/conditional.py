@@ -0,0 +1,20 @@
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def conditional_response(request, etag, last_modified, get_response):
+    """Return 304 Not Modified or the full response with validators.
+
+    The full response is created only if the client does not have the
+    current version of the resource.
+    """
+    etag = quote_etag(etag)
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=timestamp)
+    if response is None:
+        response = get_response()
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    return response
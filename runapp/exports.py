@@ -0,0 +1,78 @@
+import csv
+import json
+
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_LINES_PER_CHUNK = 500
+DIARY_FIELDS = ('date', 'training_information', 'training_distance',
+                'training_time', 'average_speed', 'notes')
+
+
+class Echo:
+    """A file-like object returning what is written to it."""
+
+    def write(self, value):
+        """Return the value instead of storing it."""
+        return value
+
+
+def join_lines(lines, size=EXPORT_LINES_PER_CHUNK):
+    """Yield the lines joined in chunks of the given number of lines."""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def iter_csv(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the CSV header and the rows of the queryset as lines."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        yield writer.writerow(row)
+
+
+def iter_jsonl(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the rows of the queryset as lines of JSON objects."""
+    for row in queryset.values(*fields).iterator(chunk_size=chunk_size):
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', iter_csv),
+    'jsonl': ('application/x-ndjson', iter_jsonl),
+}
+
+
+def streaming_response(request, content, **kwargs):
+    """Return a response sending the chunks of the content iterator.
+
+    Under ASGI, Django 3.2 iterates streaming responses on the event
+    loop, where the database cannot be used, so the chunks are read in
+    the thread of the view before the response is returned.
+    """
+    if isinstance(request, ASGIRequest):
+        content = list(content)
+    return StreamingHttpResponse(content, **kwargs)
+
+
+def export_response(request, queryset, fields, export_format, filename):
+    """Return a response streaming the queryset rows as a download.
+
+    The rows are read from the database in chunks while the response is
+    sent, so the memory use does not grow with the number of rows.
+    """
+    content_type, iter_lines = EXPORT_FORMATS[export_format]
+    response = streaming_response(
+        request, join_lines(iter_lines(queryset, fields)),
+        content_type=content_type)
+    response['Content-Disposition'] = \
+        f'attachment; filename="{filename}.{export_format}"'
+    return response
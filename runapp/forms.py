@@ -39,7 +39,7 @@ class TrainingPlanForm(ModelForm):
         cleaned_data = super().clean()
         start_date = cleaned_data.get('start_date')
         end_date = cleaned_data.get('end_date')
-        if end_date < start_date:
+        if start_date and end_date and end_date < start_date:
             raise ValidationError(
                 'The start date cannot be later than the end date')
         return cleaned_data
@@ -66,8 +66,8 @@ class TrainingForm(ModelForm):
         training plan.
         """
         cleaned_data = super().clean()
-        owner = self.instance.training_plan.owner
-        if self.user != owner:
+        if self.user is None or \
+                self.instance.training_plan.owner_id != self.user.pk:
             raise PermissionDenied
         return cleaned_data
 
@@ -75,7 +75,8 @@ class TrainingForm(ModelForm):
         date = self.cleaned_data['date']
         training_plan = self.instance.training_plan
 
-        if training_plan.training_set.filter(date=date):
+        if training_plan.training_set.filter(date=date).exclude(
+                pk=self.instance.pk).exists():
             self.add_error('date',
                            'You already have training planned for that day.')
         if date < training_plan.start_date:
@@ -87,15 +88,58 @@ class TrainingForm(ModelForm):
         return date
 
 
+class TrainingPlanCloneForm(forms.Form):
+    """Form for copying a training plan to a new start date."""
+    name = forms.CharField(
+        max_length=64, label='Name of the new plan',
+        widget=forms.TextInput(attrs={'class': CSS_INPUT}))
+    start_date = forms.DateField(
+        label='New plan start date',
+        widget=DatePicker(attrs={'class': CSS_INPUT}))
+    current_plan = forms.BooleanField(
+        required=False, label='Set as current plan',
+        widget=forms.CheckboxInput(attrs={'class': CSS_INPUT_CHECKBOX}))
+
+
+class TrainingShiftForm(forms.Form):
+    """Form for moving the remaining trainings of a plan."""
+    from_date = forms.DateField(
+        label='Move trainings planned from',
+        widget=DatePicker(attrs={'class': CSS_INPUT}))
+    days = forms.IntegerField(
+        min_value=-365, max_value=365,
+        label='By number of days (negative to move earlier)',
+        widget=forms.NumberInput(attrs={'class': CSS_INPUT}))
+    extend_plan = forms.BooleanField(
+        required=False, label='Extend the plan if needed',
+        widget=forms.CheckboxInput(attrs={'class': CSS_INPUT_CHECKBOX}))
+
+
+class TrainingImportForm(forms.Form):
+    """Form for uploading a file with trainings to import."""
+    file = forms.FileField(
+        label='CSV or JSON file with trainings',
+        widget=forms.ClearableFileInput(attrs={'class': CSS_INPUT}))
+
+
+class ActivityImportForm(forms.Form):
+    """Form for uploading activity files with runs."""
+    files = forms.FileField(
+        label='GPX, TCX or CSV activity files',
+        widget=forms.ClearableFileInput(attrs={'class': CSS_INPUT,
+                                               'multiple': True}))
+
+
 class SelectCurrentPlanForm(forms.Form):
     """Form for selecting the current training plan."""
 
     def __init__(self, user, **kwargs):
         super(SelectCurrentPlanForm, self).__init__(**kwargs)
-        user_plans = [(plan.id, plan.name) for plan in
-                      TrainingPlan.objects.filter(owner=user)]
-        current_plan = TrainingPlan.get_current(user)
-        initial_value = current_plan.pk if current_plan else None
+        plans = TrainingPlan.objects.filter(owner=user).only(
+            'id', 'name', 'current_plan')
+        user_plans = [(plan.id, plan.name) for plan in plans]
+        initial_value = next(
+            (plan.id for plan in plans if plan.current_plan), None)
         self.fields['current_plan'] = forms.ChoiceField(
             choices=user_plans, label='Choose your current plan',
             initial=initial_value)
@@ -0,0 +1,62 @@
+from collections import Counter
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.safestring import mark_safe
+
+
+class FragmentMetrics:
+    """Count fragment cache hits and misses of each fragment."""
+
+    def __init__(self):
+        self._hits = Counter()
+        self._misses = Counter()
+        self._lock = Lock()
+
+    def record(self, name, hit):
+        """Count a single lookup of the fragment."""
+        with self._lock:
+            (self._hits if hit else self._misses)[name] += 1
+
+    def summary(self):
+        """Return hits, misses and hit ratio of each fragment."""
+        with self._lock:
+            names = set(self._hits) | set(self._misses)
+            return {name: {
+                'hits': self._hits[name],
+                'misses': self._misses[name],
+                'hit_ratio': self._hits[name] / (
+                    self._hits[name] + self._misses[name]),
+            } for name in names}
+
+    def clear(self):
+        """Reset all counters."""
+        with self._lock:
+            self._hits.clear()
+            self._misses.clear()
+
+
+fragment_metrics = FragmentMetrics()
+
+
+def get_fragment_cache():
+    """Return the cache storing rendered fragments."""
+    return caches[getattr(settings, 'FRAGMENT_CACHE', 'default')]
+
+
+def cached_fragment(name, version, render):
+    """Return the rendered HTML fragment of the given version.
+
+    The version must change whenever the fragment content changes, so
+    stale fragments are never served and simply expire. On a miss the
+    fragment is rendered with the render function and stored.
+    """
+    cache = get_fragment_cache()
+    key = f'runapp:fragment:{name}:' + ':'.join(str(part) for part in version)
+    html = cache.get(key)
+    fragment_metrics.record(name, hit=html is not None)
+    if html is None:
+        html = render()
+        cache.set(key, html)
+    return mark_safe(html)
@@ -0,0 +1,101 @@
+import base64
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.hashers import BasePasswordHasher, mask_hash
+from django.utils.crypto import constant_time_compare
+from django.utils.translation import gettext_noop as _
+
+SCRYPT_KEY_LENGTH = 64
+
+
+class ScryptPasswordHasher(BasePasswordHasher):
+    """Hash passwords with scrypt from the standard library.
+
+    The cost is read from the PASSWORD_SCRYPT_* settings on every call,
+    hashes made with other parameters are updated on the next login.
+    The format matches the scrypt hasher of Django 4.0, so the stored
+    hashes stay valid after an upgrade.
+    """
+    algorithm = 'scrypt'
+
+    @property
+    def work_factor(self):
+        return getattr(settings, 'PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14)
+
+    @property
+    def block_size(self):
+        return getattr(settings, 'PASSWORD_SCRYPT_BLOCK_SIZE', 8)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'PASSWORD_SCRYPT_PARALLELISM', 1)
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        """Return the password hash with the given or configured cost."""
+        assert password is not None
+        assert salt and '$' not in salt
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        # OpenSSL refuses to use more than 32 MiB unless allowed to.
+        hash_ = hashlib.scrypt(password.encode(), salt=salt.encode(), n=n,
+                               r=r, p=p, maxmem=256 * n * r * p,
+                               dklen=SCRYPT_KEY_LENGTH)
+        hash_ = base64.b64encode(hash_).decode('ascii').strip()
+        return f'{self.algorithm}${n}${salt}${r}${p}${hash_}'
+
+    def decode(self, encoded):
+        """Return the parts of the password hash."""
+        algorithm, work_factor, salt, block_size, parallelism, hash_ = \
+            encoded.split('$', 5)
+        assert algorithm == self.algorithm
+        return {
+            'algorithm': algorithm,
+            'work_factor': int(work_factor),
+            'salt': salt,
+            'block_size': int(block_size),
+            'parallelism': int(parallelism),
+            'hash': hash_,
+        }
+
+    def verify(self, password, encoded):
+        """Return True if the password matches the hash."""
+        decoded = self.decode(encoded)
+        encoded_2 = self.encode(password, decoded['salt'],
+                                decoded['work_factor'],
+                                decoded['block_size'],
+                                decoded['parallelism'])
+        return constant_time_compare(encoded, encoded_2)
+
+    def safe_summary(self, encoded):
+        """Return the parts of the hash that can be shown in the admin."""
+        decoded = self.decode(encoded)
+        return {
+            _('algorithm'): decoded['algorithm'],
+            _('work factor'): decoded['work_factor'],
+            _('block size'): decoded['block_size'],
+            _('parallelism'): decoded['parallelism'],
+            _('salt'): mask_hash(decoded['salt']),
+            _('hash'): mask_hash(decoded['hash']),
+        }
+
+    def must_update(self, encoded):
+        """Return True if the hash was made with another cost."""
+        decoded = self.decode(encoded)
+        return (decoded['work_factor'], decoded['block_size'],
+                decoded['parallelism']) != (self.work_factor,
+                                            self.block_size,
+                                            self.parallelism)
+
+    def harden_runtime(self, password, encoded):
+        """Hash once more at the current cost if the hash is cheaper.
+
+        Together with the update on login this makes the time of a
+        login independent of the cost the hash was made with.
+        """
+        decoded = self.decode(encoded)
+        if decoded['work_factor'] * decoded['block_size'] * decoded[
+                'parallelism'] < (self.work_factor * self.block_size
+                                  * self.parallelism):
+            self.encode(password, decoded['salt'])
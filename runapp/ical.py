@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+
+from django.core import signing
+
+FEED_SALT = 'runapp.ical'
+PRODUCT_ID = '-//RunSchedule//Training plan//EN'
+MAX_LINE_LENGTH = 75
+
+
+def get_feed_token(training_plan):
+    """Return the signed token identifying the plan's feed."""
+    return signing.dumps(training_plan.pk, salt=FEED_SALT)
+
+
+def get_plan_id(token):
+    """Return the id of the plan the feed token was created for.
+
+    If the token is not valid return None.
+    """
+    try:
+        return signing.loads(token, salt=FEED_SALT)
+    except signing.BadSignature:
+        return None
+
+
+def encode_sync_token(timestamp):
+    """Return the sync token for the time of the last change."""
+    return str(int(timestamp.timestamp() * 1000000))
+
+
+def decode_sync_token(token):
+    """Return the time stored in the sync token or None if invalid."""
+    try:
+        return datetime.fromtimestamp(int(token) / 1000000, tz=timezone.utc)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def escape_text(text):
+    """Escape special characters of an iCalendar text value."""
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(
+        ',', '\\,').replace('\n', '\\n')
+
+
+def fold_line(line):
+    """Split a content line longer than 75 octets into folded lines."""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= MAX_LINE_LENGTH:
+        return f'{line}\r\n'
+    parts = []
+    limit = MAX_LINE_LENGTH
+    while encoded:
+        cut = min(limit, len(encoded))
+        while cut < len(encoded) and encoded[cut] & 0xC0 == 0x80:
+            cut -= 1  # do not split multibyte characters
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        limit = MAX_LINE_LENGTH - 1  # continuation lines start with a space
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def format_event(training, domain):
+    """Return the training as an iCalendar event."""
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:training-{training.pk}@{domain}',
+        f'DTSTAMP:{training.updated_at:%Y%m%dT%H%M%SZ}',
+        f'DTSTART;VALUE=DATE:{training.date:%Y%m%d}',
+        f'DTEND;VALUE=DATE:{training.date + timedelta(days=1):%Y%m%d}',
+        f'SUMMARY:{escape_text(training.training_information())}',
+        'STATUS:CONFIRMED',
+        'TRANSP:TRANSPARENT',
+    ]
+    if training.completed:
+        lines.append('DESCRIPTION:Completed')
+    lines.append('END:VEVENT')
+    return ''.join(fold_line(line) for line in lines)
+
+
+def iter_calendar(training_plan, trainings, domain):
+    """Yield the plan with its trainings in the iCalendar format.
+
+    The trainings are written one event at a time, so any iterable,
+    including a queryset iterator, can be streamed.
+    """
+    yield ''.join(fold_line(line) for line in [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODUCT_ID}',
+        'CALSCALE:GREGORIAN',
+        f'X-WR-CALNAME:{escape_text(training_plan.name)}',
+    ])
+    for training in trainings:
+        yield format_event(training, domain)
+    yield fold_line('END:VCALENDAR')
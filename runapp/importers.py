@@ -0,0 +1,250 @@
+import csv
+import io
+import json
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+
+from runapp.activity_files import parse_activity_file
+from runapp.calendar import get_date_today
+from runapp.models import (Training, TrainingDiary, TrainingPlan,
+                           TrainingSummary)
+
+IMPORT_BATCH_SIZE = 500
+TRAINING_FIELDS = ('date', 'main_training', 'additional_training')
+
+
+def parse_trainings_csv(content):
+    """Return a list of training rows read from CSV content.
+
+    The first line of the file must be a header naming the columns.
+    """
+    reader = csv.DictReader(io.StringIO(content))
+    try:
+        return [training_row(row) for row in reader]
+    except csv.Error:
+        raise ValidationError('The file is not valid CSV.')
+
+
+def parse_trainings_json(content):
+    """Return a list of training rows read from a JSON array."""
+    try:
+        rows = json.loads(content)
+    except ValueError:
+        raise ValidationError('The file does not contain valid JSON.')
+    if not isinstance(rows, list) or not all(
+            isinstance(row, dict) for row in rows):
+        raise ValidationError('The file must contain a list of trainings.')
+    return [training_row(row) for row in rows]
+
+
+def training_row(row):
+    """Return the training fields of a row with empty values as None."""
+    return {field: str(row[field]) if row.get(field) not in (None, '')
+            else None for field in TRAINING_FIELDS}
+
+
+def parse_trainings_file(file):
+    """Return training rows read from an uploaded CSV or JSON file."""
+    try:
+        content = file.read().decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ValidationError('The file must be encoded in UTF-8.')
+    if '\x00' in content:
+        raise ValidationError('The file must not contain NUL characters.')
+    if file.name.lower().endswith('.json'):
+        return parse_trainings_json(content)
+    if file.name.lower().endswith('.csv'):
+        return parse_trainings_csv(content)
+    raise ValidationError('Only CSV and JSON files can be imported.')
+
+
+def import_trainings(training_plan, rows, batch_size=IMPORT_BATCH_SIZE):
+    """Validate the training rows and add them to the training plan.
+
+    All rows are checked against the plan dates and the trainings
+    already scheduled in the plan before anything is saved. If any row
+    is invalid, raise ValidationError listing all the problems.
+
+    The check and the insert run in one transaction, which starts by
+    updating the plan row. Concurrent imports into the same plan are
+    serialized by the row lock and cannot both add a training on the
+    same day.
+    """
+    with transaction.atomic():
+        TrainingPlan.bump_version(training_plan.pk)
+        trainings = []
+        errors = []
+        dates = set()
+        for number, row in enumerate(rows, start=1):
+            training = Training(training_plan=training_plan, **row)
+            try:
+                training.clean_fields(exclude=['training_plan', 'completed'])
+            except ValidationError as error:
+                for field, messages in error.message_dict.items():
+                    errors.append(
+                        f'Row {number}, {field}: {" ".join(messages)}')
+                continue
+
+            if training.date < training_plan.start_date:
+                errors.append(f'Row {number}: the date of the training '
+                              f'cannot be earlier than the training plan '
+                              f'start date.')
+            elif training.date > training_plan.end_date:
+                errors.append(f'Row {number}: the date of the training '
+                              f'cannot be later than the training plan end '
+                              f'date.')
+            elif training.date in dates:
+                errors.append(f'Row {number}: the file contains more than '
+                              f'one training on {training.date}.')
+            dates.add(training.date)
+            trainings.append(training)
+
+        if trainings:
+            scheduled = set(training_plan.training_set.filter(
+                date__range=(min(dates), max(dates))
+            ).values_list('date', flat=True))
+            for date in sorted(scheduled & dates):
+                errors.append(
+                    f'You already have training planned for {date}.')
+
+        if errors:
+            raise ValidationError(errors)
+
+        Training.objects.bulk_create(trainings, batch_size=batch_size)
+        TrainingPlan.update_counters(training_plan.pk, total=len(trainings))
+    return trainings
+
+
+def parse_activity_files(files, workers=None):
+    """Parse the (name, content) pairs of activity files.
+
+    Several files are parsed in a pool of worker processes. The workers
+    are spawned rather than forked, so they do not share the database
+    connections of this process.
+    """
+    if workers is None:
+        workers = getattr(settings, 'ACTIVITY_PARSE_WORKERS', None)
+    if len(files) < 2 or workers == 1:
+        return [parse_activity_file(name, content) for name, content in files]
+    names, contents = zip(*files)
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=context) as executor:
+        return list(executor.map(parse_activity_file, names, contents))
+
+
+def activity_entry(user, activity):
+    """Return an unsaved diary entry of the activity.
+
+    The average speed is set by check_activity_entry once the distance
+    and time are known to be valid.
+    """
+    return TrainingDiary(
+        user=user, date=activity['date'],
+        training_information=activity['name'],
+        training_distance=activity['distance'],
+        training_time=activity['time'])
+
+
+def check_activity_entry(entry, taken_dates, today):
+    """Return the problem with the diary entry or None if it is valid."""
+    if entry.date > today:
+        return f'The run on {entry.date} has not yet taken place.'
+    if entry.date in taken_dates:
+        return f'You already have a diary entry for {entry.date}.'
+    if not (entry.training_distance.is_finite()
+            and entry.training_distance > 0 and entry.training_time > 0):
+        return f'The run on {entry.date} has no distance or time.'
+    entry.average_speed = round(
+        entry.training_distance / entry.training_time, 2)
+    try:
+        entry.clean_fields(exclude=['user', 'notes'])
+    except ValidationError as error:
+        return f'The run on {entry.date}: {" ".join(error.messages)}'
+    return None
+
+
+def import_activities(user, files, workers=None):
+    """Add diary entries of the runs in the activity files.
+
+    The files are parsed in worker processes. A file is imported only
+    if all its runs are valid: they have already taken place and there
+    is no other diary entry on their day. Trainings of the user's plans
+    scheduled on the days of the imported runs are marked completed.
+    All entries are saved with a single bulk insert. Return the name,
+    number of imported entries, error and parsing time of every file.
+    """
+    results = parse_activity_files(files, workers)
+    dates = [activity['date'] for _, activities, _, _ in results
+             for activity in activities]
+    taken_dates = set(user.trainingdiary_set.filter(
+        date__range=(min(dates), max(dates))).values_list(
+        'date', flat=True)) if dates else set()
+    today = get_date_today()
+
+    report = []
+    entries = []
+    for name, activities, error, seconds in results:
+        file_entries = [activity_entry(user, activity)
+                        for activity in activities]
+        file_dates = set()
+        for entry in file_entries:
+            if error is None:
+                error = check_activity_entry(entry, taken_dates | file_dates,
+                                             today)
+            file_dates.add(entry.date)
+        if error is None:
+            entries.extend(file_entries)
+            taken_dates |= file_dates
+        report.append({'name': name, 'entries': 0 if error else len(
+            file_entries), 'error': error, 'seconds': seconds})
+    if not entries:
+        return report
+
+    trainings = {}
+    for training in Training.objects.filter(
+            training_plan__owner=user, completed=False,
+            date__in=[entry.date for entry in entries]).order_by(
+            '-training_plan__current_plan', 'pk'):
+        trainings.setdefault(training.date, training)
+    for entry in entries:
+        training = trainings.get(entry.date)
+        if training is not None:
+            entry.training_information = training.training_information()
+
+    with transaction.atomic():
+        TrainingDiary.objects.bulk_create(entries,
+                                          batch_size=IMPORT_BATCH_SIZE)
+        # Trainings completed by another request since they were read
+        # are left alone and not credited again.
+        open_trainings = set(Training.objects.select_for_update().filter(
+            pk__in=[training.pk for training in trainings.values()],
+            completed=False).values_list('pk', flat=True))
+        plan_progress = defaultdict(lambda: [0, 0])
+        credited = []
+        for entry in entries:
+            training = trainings.get(entry.date)
+            if training is not None and training.pk in open_trainings:
+                credited.append(When(pk=training.pk, then=Value(
+                    entry.training_distance)))
+                progress = plan_progress[training.training_plan_id]
+                progress[0] += 1
+                progress[1] += entry.training_distance
+        if credited:
+            Training.objects.filter(
+                pk__in=open_trainings, completed=False
+            ).update(completed=True, completed_distance=Case(
+                *credited, output_field=Training._meta.get_field(
+                    'completed_distance')), updated_at=timezone.now())
+        for plan_id, (completed, distance) in plan_progress.items():
+            TrainingPlan.update_counters(plan_id, completed=completed,
+                                         distance=distance)
+            TrainingPlan.bump_version(plan_id)
+        TrainingSummary.refresh(user.pk)
+    return report
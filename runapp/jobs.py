@@ -0,0 +1,163 @@
+import inspect
+import os
+import socket
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from runapp.models import (Job, PlanTemplate, TrainingPlan, TrainingSummary,
+                           User)
+from runapp.stats import compute_adherence
+
+JOBS = {}
+JOB_CHUNK_SIZE = 500
+
+
+def register(name):
+    """Register the decorated function as the job with the name.
+
+    The function is called with the Job and its arguments as keyword
+    arguments, its return value is saved as the result of the job and
+    must be serializable as JSON.
+    """
+    def decorator(function):
+        JOBS[name] = function
+        return function
+    return decorator
+
+
+def enqueue(name, owner=None, max_attempts=3, **arguments):
+    """Save a pending job to be run by a worker and return it.
+
+    Raise ValueError if there is no such job or it does not take the
+    arguments.
+    """
+    if name not in JOBS:
+        raise ValueError(f'Unknown job: {name}')
+    try:
+        inspect.signature(JOBS[name]).bind(None, **arguments)
+    except TypeError as error:
+        raise ValueError(f'Invalid arguments of {name}: {error}')
+    return Job.objects.create(name=name, owner=owner, arguments=arguments,
+                              max_attempts=max_attempts)
+
+
+def retry_delay(attempts):
+    """Return the seconds to wait before the next attempt of a job."""
+    return getattr(settings, 'JOB_RETRY_DELAY', 30) * 2 ** (attempts - 1)
+
+
+def run_job(job):
+    """Run the claimed job and save its result or error.
+
+    A failed job goes back to the queue with a growing delay until it
+    has used up its attempts.
+    """
+    try:
+        result = JOBS[job.name](job, **job.arguments)
+    except Exception as error:
+        message = f'{type(error).__name__}: {error}'
+        if job.attempts < job.max_attempts:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.PENDING, error=message,
+                run_after=timezone.now() + timedelta(
+                    seconds=retry_delay(job.attempts)))
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.FAILED, error=message,
+                finished_at=timezone.now())
+        return False
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.DONE, result=result, error='',
+        finished_at=timezone.now())
+    return True
+
+
+def get_worker_name():
+    """Return the name of this worker process."""
+    return f'{socket.gethostname()}:{os.getpid()}'[:64]
+
+
+def work(burst=False, poll_interval=None, worker=None):
+    """Claim and run jobs until stopped.
+
+    With burst, stop once no job is due. Return the number of jobs run.
+    """
+    if poll_interval is None:
+        poll_interval = getattr(settings, 'JOB_POLL_INTERVAL', 1)
+    timeout = getattr(settings, 'JOB_TIMEOUT', 3600)
+    worker = worker or get_worker_name()
+    count = 0
+    while True:
+        close_old_connections()
+        Job.requeue_stale(timeout)
+        job = Job.claim(worker)
+        if job is not None:
+            run_job(job)
+            count += 1
+        elif burst:
+            return count
+        else:
+            time.sleep(poll_interval)
+
+
+@register('apply_plan_template')
+def apply_plan_template(job, template_id, start_date, user_ids=None,
+                        current_plan=False):
+    """Create plans from the template for the users or all active users."""
+    template = PlanTemplate.objects.get(pk=template_id)
+    users = User.objects.filter(is_active=True)
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    # Users who got the plan in an earlier attempt are skipped.
+    users = users.exclude(pk__in=TrainingPlan.objects.filter(
+        name=template.name, start_date=start_date).values('owner'))
+    user_ids = list(users.order_by('pk').values_list('pk', flat=True))
+    job.set_progress(0, len(user_ids))
+    created = 0
+    for first in range(0, len(user_ids), JOB_CHUNK_SIZE):
+        chunk = user_ids[first:first + JOB_CHUNK_SIZE]
+        created += len(template.apply(chunk, date.fromisoformat(start_date),
+                                      current_plan))
+        job.set_progress(created)
+    return {'plans': created}
+
+
+@register('repair_plan_counters')
+def repair_plan_counters(job, plan_ids=None):
+    """Recalculate the progress counters of the plans or all plans."""
+    plans = TrainingPlan.objects.all()
+    if plan_ids is not None:
+        plans = plans.filter(pk__in=plan_ids)
+    plan_ids = list(plans.order_by('pk').values_list('pk', flat=True))
+    job.set_progress(0, len(plan_ids))
+    for first in range(0, len(plan_ids), JOB_CHUNK_SIZE):
+        chunk = plan_ids[first:first + JOB_CHUNK_SIZE]
+        TrainingPlan.recalculate_counters(
+            TrainingPlan.objects.filter(pk__in=chunk))
+        job.set_progress(first + len(chunk))
+    return {'plans': len(plan_ids)}
+
+
+@register('refresh_summaries')
+def refresh_summaries(job, user_ids=None):
+    """Recalculate the diary summaries of the users or all users."""
+    users = User.objects.all()
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    user_ids = list(users.order_by('pk').values_list('pk', flat=True))
+    job.set_progress(0, len(user_ids))
+    for number, user_id in enumerate(user_ids, start=1):
+        TrainingSummary.refresh(user_id)
+        if number % JOB_CHUNK_SIZE == 0 or number == len(user_ids):
+            job.set_progress(number)
+    return {'users': len(user_ids)}
+
+
+@register('compute_adherence')
+def compute_adherence_job(job, weeks=8):
+    """Recompute the weekly adherence of all users."""
+    return {'rows': compute_adherence(weeks, job=job)}
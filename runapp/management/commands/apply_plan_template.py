@@ -0,0 +1,59 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from runapp.jobs import enqueue
+from runapp.models import PlanTemplate, User
+
+USERS_CHUNK_SIZE = 500
+
+
+def parse_date(value):
+    """Return the date given in the YYYY-MM-DD format."""
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class Command(BaseCommand):
+    help = 'Create training plans from a plan template for many users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('template_id', type=int)
+        parser.add_argument('start_date', type=parse_date,
+                            help='start date of the plans (YYYY-MM-DD)')
+        parser.add_argument('user_ids', nargs='*', type=int,
+                            help='ids of the users getting the plan')
+        parser.add_argument('--all-users', action='store_true',
+                            help='create the plan for all active users')
+        parser.add_argument('--current-plan', action='store_true',
+                            help='make the new plans the current plans')
+        parser.add_argument('--background', action='store_true',
+                            help='queue a job for the runworker command')
+
+    def handle(self, *args, **options):
+        if bool(options['user_ids']) == options['all_users']:
+            raise CommandError('Give either user ids or --all-users.')
+        try:
+            template = PlanTemplate.objects.get(pk=options['template_id'])
+        except PlanTemplate.DoesNotExist:
+            raise CommandError(f'Plan template {options["template_id"]} '
+                               f'does not exist.')
+
+        if options['background']:
+            job = enqueue('apply_plan_template', template_id=template.pk,
+                          start_date=options['start_date'].isoformat(),
+                          user_ids=options['user_ids'] or None,
+                          current_plan=options['current_plan'])
+            self.stdout.write(f'Queued job {job.pk}.')
+            return
+
+        users = User.objects.filter(is_active=True)
+        if options['user_ids']:
+            users = users.filter(pk__in=options['user_ids'])
+        user_ids = list(users.order_by('pk').values_list('pk', flat=True))
+        created = 0
+        for first in range(0, len(user_ids), USERS_CHUNK_SIZE):
+            chunk = user_ids[first:first + USERS_CHUNK_SIZE]
+            created += len(template.apply(chunk, options['start_date'],
+                                          options['current_plan']))
+            self.stdout.write(f'Created {created} of {len(user_ids)} '
+                              f'training plans.')
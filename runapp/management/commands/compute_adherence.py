@@ -0,0 +1,36 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from runapp.jobs import enqueue
+from runapp.stats import compute_adherence
+
+
+class Command(BaseCommand):
+    help = 'Recompute the weekly plan adherence of all users, meant to be ' \
+           'run nightly.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weeks', type=int, default=8,
+                            help='number of recent weeks to recompute')
+        parser.add_argument('--workers', type=int,
+                            help='number of processes '
+                                 '(default: ADHERENCE_WORKERS)')
+        parser.add_argument('--chunk-size', type=int,
+                            help='number of users computed together')
+        parser.add_argument('--background', action='store_true',
+                            help='queue a job for the runworker command')
+
+    def handle(self, *args, **options):
+        if options['weeks'] < 1:
+            raise CommandError('At least one week is needed.')
+        if options['background']:
+            job = enqueue('compute_adherence', weeks=options['weeks'])
+            self.stdout.write(f'Queued job {job.pk}.')
+            return
+
+        start = perf_counter()
+        saved = compute_adherence(options['weeks'], options['workers'],
+                                  options['chunk_size'])
+        self.stdout.write(f'Saved {saved} weekly adherence rows in '
+                          f'{perf_counter() - start:.2f} s.')
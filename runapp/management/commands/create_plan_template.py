@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from runapp.models import PlanTemplate, TrainingPlan
+
+
+class Command(BaseCommand):
+    help = 'Create a plan template from the trainings of a training plan.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('plan_id', type=int,
+                            help='id of the training plan to copy')
+        parser.add_argument('--name', help='name of the template '
+                                           '(default: name of the plan)')
+
+    def handle(self, *args, **options):
+        try:
+            training_plan = TrainingPlan.objects.get(pk=options['plan_id'])
+        except TrainingPlan.DoesNotExist:
+            raise CommandError(f'Training plan {options["plan_id"]} does '
+                               f'not exist.')
+        template = PlanTemplate.from_plan(training_plan, options['name'])
+        self.stdout.write(f'Created plan template {template.pk} with '
+                          f'{template.plantemplatetraining_set.count()} '
+                          f'trainings.')
@@ -0,0 +1,35 @@
+import csv
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from runapp.models import User
+
+
+class Command(BaseCommand):
+    help = 'Create the users of a CSV file with email and optional ' \
+           'password columns, e.g. all members of a club.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row')
+        parser.add_argument('--workers', type=int,
+                            help='number of hashing threads '
+                                 '(default: PASSWORD_HASH_WORKERS)')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], newline='',
+                      encoding='utf-8-sig') as file:
+                accounts = [(row.get('email'), row.get('password') or None)
+                            for row in csv.DictReader(file)]
+        except OSError as error:
+            raise CommandError(error)
+
+        start = perf_counter()
+        try:
+            users = User.objects.create_users(accounts, options['workers'])
+        except ValueError as error:
+            raise CommandError(error)
+        duration = perf_counter() - start
+        self.stdout.write(f'Created {len(users)} users in {duration:.2f} s '
+                          f'({len(users) / duration:.1f} users per second).')
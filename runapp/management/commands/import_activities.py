@@ -0,0 +1,50 @@
+from pathlib import Path
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from runapp.importers import import_activities
+from runapp.models import User
+
+
+class Command(BaseCommand):
+    help = 'Add diary entries of the runs in GPX, TCX and CSV activity files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='email of the diary owner')
+        parser.add_argument('paths', nargs='+',
+                            help='activity files or directories with them')
+        parser.add_argument('--workers', type=int,
+                            help='number of parsing processes '
+                                 '(default: ACTIVITY_PARSE_WORKERS)')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(email=options['email'])
+        except User.DoesNotExist:
+            raise CommandError(f'User {options["email"]} does not exist.')
+
+        files = []
+        for path in map(Path, options['paths']):
+            paths = sorted(path.iterdir()) if path.is_dir() else [path]
+            for file_path in paths:
+                try:
+                    files.append((file_path.name, file_path.read_bytes()))
+                except OSError as error:
+                    raise CommandError(error)
+
+        start = perf_counter()
+        report = import_activities(user, files, options['workers'])
+        duration = perf_counter() - start
+        for result in report:
+            status = result['error'] or f'{result["entries"]} entries'
+            self.stdout.write(f'{result["name"]}: {status}, parsed in '
+                              f'{result["seconds"] * 1000:.1f} ms')
+        entries = sum(result['entries'] for result in report)
+        failed = sum(1 for result in report if result['error'])
+        self.stdout.write(
+            f'Imported {entries} entries from {len(report) - failed} of '
+            f'{len(report)} files in {duration:.2f} s '
+            f'({len(report) / duration:.1f} files per second).')
+        if failed:
+            raise CommandError(f'{failed} files were not imported.')
@@ -0,0 +1,50 @@
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from runapp.importers import (IMPORT_BATCH_SIZE, import_trainings,
+                              parse_trainings_file)
+from runapp.models import TrainingPlan
+
+
+class Command(BaseCommand):
+    help = 'Import trainings from a CSV or JSON file into training plans.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSON file with trainings')
+        parser.add_argument('plan_ids', nargs='+', type=int,
+                            help='ids of the training plans to fill')
+        parser.add_argument('--batch-size', type=int,
+                            default=IMPORT_BATCH_SIZE,
+                            help='number of trainings saved per query')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as file:
+                rows = parse_trainings_file(File(file))
+        except OSError as error:
+            raise CommandError(error)
+        except ValidationError as error:
+            raise CommandError(' '.join(error.messages))
+
+        training_plans = TrainingPlan.objects.in_bulk(options['plan_ids'])
+        failed = 0
+        for plan_id in options['plan_ids']:
+            training_plan = training_plans.get(plan_id)
+            if training_plan is None:
+                self.stderr.write(f'Training plan {plan_id} does not exist.')
+                failed += 1
+                continue
+            try:
+                trainings = import_trainings(training_plan, rows,
+                                             options['batch_size'])
+            except ValidationError as error:
+                self.stderr.write(f'Training plan {plan_id}: '
+                                  f'{" ".join(error.messages)}')
+                failed += 1
+                continue
+            self.stdout.write(f'Training plan {plan_id}: imported '
+                              f'{len(trainings)} trainings.')
+
+        if failed:
+            raise CommandError(f'{failed} training plans were not imported.')
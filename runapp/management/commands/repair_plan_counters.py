@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from runapp.jobs import enqueue
+from runapp.models import TrainingPlan
+
+
+class Command(BaseCommand):
+    help = 'Recalculate the progress counters of training plans.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('plan_ids', nargs='*', type=int,
+                            help='ids of the plans to repair (default: all)')
+        parser.add_argument('--background', action='store_true',
+                            help='queue a job for the runworker command')
+
+    def handle(self, *args, **options):
+        if options['background']:
+            job = enqueue('repair_plan_counters',
+                          plan_ids=options['plan_ids'] or None)
+            self.stdout.write(f'Queued job {job.pk}.')
+            return
+
+        plans = TrainingPlan.objects.all()
+        if options['plan_ids']:
+            plans = plans.filter(pk__in=options['plan_ids'])
+        updated = TrainingPlan.recalculate_counters(plans)
+        self.stdout.write(f'Recalculated counters of {updated} training '
+                          f'plans.')
@@ -0,0 +1,48 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from runapp.jobs import work
+
+
+class Command(BaseCommand):
+    help = 'Run the queued background jobs in worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1,
+                            help='number of worker processes, SQLite '
+                                 'allows one writer at a time, so more '
+                                 'processes mostly help other databases')
+        parser.add_argument('--burst', action='store_true',
+                            help='stop once no job is due')
+        parser.add_argument('--poll-interval', type=float,
+                            help='seconds between checks of an empty queue '
+                                 '(default: JOB_POLL_INTERVAL)')
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1:
+            raise CommandError('At least one process is needed.')
+        kwargs = {'burst': options['burst'],
+                  'poll_interval': options['poll_interval']}
+        if options['processes'] == 1:
+            count = work(**kwargs)
+            self.stdout.write(f'Ran {count} jobs.')
+            return
+
+        # The workers are forked, so they must not inherit the database
+        # connections of this process.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=work, kwargs=kwargs)
+                   for _ in range(options['processes'])]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
+                worker.join()
+        self.stdout.write(f'Stopped {len(workers)} workers.')
@@ -0,0 +1,152 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from runapp.calendar import get_date_today
+from runapp.models import (User, TrainingPlan, Training, TrainingDiary,
+                           TrainingSummary)
+
+TRAININGS = ('Easy run', 'Long run', 'Tempo run', 'Intervals', 'Recovery run')
+ADDITIONAL_TRAININGS = ('', '', 'Strides', 'Core', 'Stretching')
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a synthetic dataset of users, training ' \
+           'plans, trainings and diary entries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--plans-per-user', type=int, default=3)
+        parser.add_argument('--trainings-per-plan', type=int, default=90)
+        parser.add_argument('--diary-entries', type=int, default=60,
+                            help='number of diary entries of each user')
+        parser.add_argument('--email-prefix', default='runner',
+                            help='users get emails <prefix><number>@'
+                                 'example.com')
+        parser.add_argument('--password', default='password',
+                            help='password of all created users')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='number of objects saved per query')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='seed of the random generator')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['plans_per_user'] < 1:
+            raise CommandError('At least one user with one plan is needed.')
+        prefix = options['email_prefix']
+        if User.objects.filter(email__startswith=prefix,
+                               email__endswith='@example.com').exists():
+            raise CommandError(f'Users with the email prefix {prefix} '
+                               f'already exist, choose another prefix.')
+
+        self.random = random.Random(options['seed'])
+        self.today = get_date_today()
+        self.batch_size = options['batch_size']
+        self.password = make_password(options['password'])
+        self.totals = {'users': 0, 'plans': 0, 'trainings': 0, 'entries': 0}
+        # Users are created in chunks, so every chunk of plans,
+        # trainings and diary entries fits in a few bulk inserts.
+        chunk_size = max(self.batch_size // max(
+            options['trainings_per_plan'] * options['plans_per_user'], 1), 1)
+        for first in range(0, options['users'], chunk_size):
+            emails = [f'{prefix}{number}@example.com' for number in range(
+                first, min(first + chunk_size, options['users']))]
+            with transaction.atomic():
+                self.seed_users(emails, options['plans_per_user'],
+                                options['trainings_per_plan'],
+                                options['diary_entries'])
+
+        self.stdout.write(
+            f'Created {self.totals["users"]} users, {self.totals["plans"]} '
+            f'training plans, {self.totals["trainings"]} trainings and '
+            f'{self.totals["entries"]} diary entries.')
+
+    def seed_users(self, emails, plans_per_user, trainings_per_plan,
+                   diary_entries):
+        """Create the users with their plans, trainings and diaries."""
+        User.objects.bulk_create(
+            [User(email=email, password=self.password) for email in emails],
+            batch_size=self.batch_size)
+        user_ids = list(User.objects.filter(email__in=emails).values_list(
+            'pk', flat=True))
+
+        entries = []
+        summaries = []
+        diary_distances = {}
+        for user_id in user_ids:
+            user_entries = self.diary_entries(user_id, diary_entries)
+            entries.extend(user_entries)
+            diary_distances[user_id] = {
+                entry.date: entry.training_distance for entry in user_entries}
+            summaries.append(self.summary(user_id, user_entries))
+        TrainingDiary.objects.bulk_create(entries, batch_size=self.batch_size)
+        TrainingSummary.objects.bulk_create(summaries,
+                                            batch_size=self.batch_size)
+
+        # The current plan includes today, the older plans precede it.
+        first_start = self.today - timedelta(days=trainings_per_plan // 2)
+        plans = []
+        for user_id in user_ids:
+            for number in range(plans_per_user):
+                start_date = first_start - timedelta(
+                    days=(plans_per_user - 1 - number) * trainings_per_plan)
+                plans.append(TrainingPlan(
+                    name=f'Plan {number + 1}', owner_id=user_id,
+                    start_date=start_date,
+                    end_date=start_date + timedelta(
+                        days=trainings_per_plan - 1),
+                    current_plan=number == plans_per_user - 1))
+        TrainingPlan.objects.bulk_create(plans, batch_size=self.batch_size)
+        plans = TrainingPlan.objects.filter(owner__in=user_ids)
+
+        trainings = []
+        for plan in plans.only('pk', 'owner_id', 'start_date'):
+            distances = diary_distances[plan.owner_id]
+            for day in range(trainings_per_plan):
+                date = plan.start_date + timedelta(days=day)
+                trainings.append(Training(
+                    training_plan_id=plan.pk, date=date,
+                    main_training=self.random.choice(TRAININGS),
+                    additional_training=self.random.choice(
+                        ADDITIONAL_TRAININGS),
+                    completed=date in distances,
+                    completed_distance=distances.get(date, 0)))
+        Training.objects.bulk_create(trainings, batch_size=self.batch_size)
+        TrainingPlan.recalculate_counters(plans)
+
+        self.totals['users'] += len(user_ids)
+        self.totals['plans'] += len(user_ids) * plans_per_user
+        self.totals['trainings'] += len(trainings)
+        self.totals['entries'] += len(entries)
+
+    def diary_entries(self, user_id, count):
+        """Return unsaved diary entries of the days before today."""
+        entries = []
+        for day in range(1, count + 1):
+            distance = Decimal(self.random.randint(300, 2500)) / 100
+            time = self.random.randint(20, 150)
+            entries.append(TrainingDiary(
+                user_id=user_id, date=self.today - timedelta(days=day),
+                training_information=self.random.choice(TRAININGS),
+                training_distance=distance, training_time=time,
+                average_speed=round(distance / time, 2)))
+        return entries
+
+    @staticmethod
+    def summary(user_id, entries):
+        """Return the unsaved diary summary of the user's entries."""
+        if not entries:
+            return TrainingSummary(user_id=user_id)
+        return TrainingSummary(
+            user_id=user_id, entries=len(entries),
+            total_distance=sum(entry.training_distance for entry in entries),
+            total_time=sum(entry.training_time for entry in entries),
+            longest_distance=max(entry.training_distance
+                                 for entry in entries),
+            longest_time=max(entry.training_time for entry in entries),
+            best_average_speed=max(entry.average_speed for entry in entries),
+            last_entry_date=max(entry.date for entry in entries))
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from runapp.models import TrainingPlan
+
+
+def parse_date(value):
+    """Return the date given in the YYYY-MM-DD format."""
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class Command(BaseCommand):
+    help = 'Move the trainings of a plan not completed yet by N days.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('plan_id', type=int)
+        parser.add_argument('from_date', type=parse_date,
+                            help='move trainings planned on or after the '
+                                 'date (YYYY-MM-DD)')
+        parser.add_argument('days', type=int,
+                            help='number of days, negative to move earlier')
+        parser.add_argument('--extend-plan', action='store_true',
+                            help='move the plan end date if needed')
+
+    def handle(self, *args, **options):
+        try:
+            training_plan = TrainingPlan.objects.get(pk=options['plan_id'])
+        except TrainingPlan.DoesNotExist:
+            raise CommandError(f'Training plan {options["plan_id"]} does '
+                               f'not exist.')
+        try:
+            shifted = training_plan.shift_trainings(
+                options['from_date'], options['days'],
+                options['extend_plan'])
+        except ValidationError as error:
+            raise CommandError(' '.join(error.messages))
+        self.stdout.write(f'Moved {shifted} trainings by {options["days"]} '
+                          f'days.')
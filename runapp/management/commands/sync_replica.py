@@ -0,0 +1,32 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = 'Copy the SQLite primary database to the SQLite replicas, ' \
+           'standing in for replication during local development.'
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        aliases = getattr(settings, 'DATABASE_REPLICAS', [])
+        for alias in [DEFAULT_DB_ALIAS] + aliases:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError('Only SQLite databases can be copied, '
+                                   'use the replication of the database '
+                                   'server instead.')
+        source = sqlite3.connect(primary['NAME'])
+        try:
+            for alias in aliases:
+                connections[alias].close()
+                target = sqlite3.connect(connections[alias].settings_dict[
+                    'NAME'])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f'Copied the primary database to {alias}.')
+        finally:
+            source.close()
@@ -0,0 +1,153 @@
+import asyncio
+from time import perf_counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.functional import SimpleLazyObject
+
+from runapp.authentication import get_user
+from runapp.profiling import (RequestProfile, RequestStats, current_profile,
+                              profile_sql)
+from runapp.routers import STICKY_COOKIE, replica_reads
+
+request_stats = RequestStats(getattr(settings, 'PROFILING_SAMPLES', 1000))
+
+
+@sync_and_async_middleware
+class ProfilingMiddleware:
+    """Measure where the time of each request goes.
+
+    Record the wall time, SQL queries and instrumented blocks of every
+    request, add them to the Server-Timing header and to the per-view
+    request stats. The middleware removes itself unless the
+    PROFILING_ENABLED setting is True.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Mark the instance as a coroutine function for the handler.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        start = perf_counter()
+        try:
+            install_sql_profiler()
+            response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.process_response(request, response, profile, start)
+
+    async def __acall__(self, request):
+        """Handle the request under ASGI."""
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        start = perf_counter()
+        try:
+            # The sync code of the request queries the connections of
+            # the thread this runs in.
+            await sync_to_async(install_sql_profiler)()
+            response = await self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.process_response(request, response, profile, start)
+
+    @staticmethod
+    def process_response(request, response, profile, start):
+        """Add the Server-Timing header and record the request stats."""
+        total = (perf_counter() - start) * 1000
+        response['Server-Timing'] = profile.server_timing(total)
+        match = request.resolver_match
+        request_stats.record(match.view_name if match else 'unresolved',
+                             total, profile)
+        return response
+
+
+def install_sql_profiler():
+    """Add the query profiler to the connections of the current thread."""
+    for connection in connections.all():
+        if profile_sql not in connection.execute_wrappers:
+            connection.execute_wrappers.append(profile_sql)
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """Set request.user from the per-process user cache.
+
+    Replace Django's AuthenticationMiddleware, so repeated requests of
+    a logged in user do not fetch the user from the database.
+    """
+
+    def process_request(self, request):
+        """Lazily load the user of the request session."""
+        super().process_request(request)
+        request.user = SimpleLazyObject(
+            lambda: get_cached_user(request))
+
+
+def get_cached_user(request):
+    """Return the request user, loading it once per request."""
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = get_user(request)
+    return request._cached_user
+
+
+@sync_and_async_middleware
+class ReplicaRoutingMiddleware:
+    """Let read-only views read from the replica databases.
+
+    Views with a true replica_reads attribute read from a replica on
+    GET and HEAD requests. A request with another method sets a cookie
+    keeping the reads of the following REPLICA_STICKY_SECONDS on the
+    primary, so users see their own changes despite replication lag.
+    Under ASGI the middleware stays async, so requests are not
+    serialized on the thread of sync middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Mark the instance as a coroutine function for the handler.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        # The flag is cleared on both ends, a thread serves many requests.
+        replica_reads.set(False)
+        response = self.get_response(request)
+        replica_reads.set(False)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        """Handle the request under ASGI."""
+        replica_reads.set(False)
+        response = await self.get_response(request)
+        replica_reads.set(False)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        """Keep the next reads on the primary after an unsafe request."""
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response.set_cookie(
+                STICKY_COOKIE, '1',
+                max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 10),
+                httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Allow replica reads for read-only views of safe requests."""
+        view_class = getattr(view_func, 'view_class', None)
+        if (getattr(view_class, 'replica_reads', False)
+                and request.method in ('GET', 'HEAD')
+                and STICKY_COOKIE not in request.COOKIES):
+            replica_reads.set(True)
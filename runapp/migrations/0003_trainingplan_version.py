@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-18 11:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('runapp', '0002_auto_20210515_1353'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingplan',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.3 on 2026-10-18 11:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('runapp', '0003_trainingplan_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trainingdiary',
+            index=models.Index(fields=['user', 'date'], name='trainingdiary_user_date_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.3 on 2026-10-18 11:18
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def keep_newest_current_plan(apps, schema_editor):
+    """Unset all but the newest current plan of every owner."""
+    TrainingPlan = apps.get_model('runapp', 'TrainingPlan')
+    newest = TrainingPlan.objects.filter(current_plan=True).values(
+        'owner').annotate(newest=Max('pk')).values('newest')
+    TrainingPlan.objects.filter(current_plan=True).exclude(
+        pk__in=newest).update(current_plan=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('runapp', '0004_trainingdiary_user_date_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='training',
+            index=models.Index(fields=['training_plan', 'date'], name='training_plan_date_idx'),
+        ),
+        migrations.RunPython(keep_newest_current_plan,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='trainingplan',
+            constraint=models.UniqueConstraint(condition=models.Q(('current_plan', True)), fields=('owner',), name='unique_current_plan_per_owner'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.3 on 2026-10-18 11:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('runapp', '0005_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrainingSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='runapp.user')),
+                ('entries', models.PositiveIntegerField(default=0)),
+                ('total_distance', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('total_time', models.PositiveIntegerField(default=0)),
+                ('longest_distance', models.DecimalField(decimal_places=2, default=0, max_digits=4)),
+                ('longest_time', models.PositiveIntegerField(default=0)),
+                ('best_average_speed', models.DecimalField(decimal_places=2, default=0, max_digits=4)),
+                ('last_entry_date', models.DateField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 3.2.3 on 2026-10-18 11:20
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def calculate_counters(apps, schema_editor):
+    """Fill in the progress counters of the existing training plans."""
+    TrainingPlan = apps.get_model('runapp', 'TrainingPlan')
+    Training = apps.get_model('runapp', 'Training')
+    TrainingDiary = apps.get_model('runapp', 'TrainingDiary')
+    trainings = Training.objects.filter(
+        training_plan=OuterRef('pk')).order_by().values('training_plan')
+    completed_dates = Training.objects.filter(
+        training_plan=OuterRef(OuterRef('pk')), completed=True
+    ).values('date')
+    distance = TrainingDiary.objects.filter(
+        user=OuterRef('owner'), date__in=completed_dates
+    ).order_by().values('user')
+    TrainingPlan.objects.update(
+        trainings_total=Coalesce(Subquery(
+            trainings.annotate(count=Count('pk')).values('count')), 0),
+        trainings_completed=Coalesce(Subquery(
+            trainings.filter(completed=True).annotate(
+                count=Count('pk')).values('count')), 0),
+        completed_distance=Coalesce(Subquery(
+            distance.annotate(total=Sum('training_distance')).values(
+                'total')), Value(0, output_field=models.DecimalField())),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('runapp', '0006_trainingsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingplan',
+            name='completed_distance',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=9),
+        ),
+        migrations.AddField(
+            model_name='trainingplan',
+            name='trainings_completed',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='trainingplan',
+            name='trainings_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(calculate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-18 11:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('runapp', '0008_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='plans_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2.3 on 2026-10-18 11:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('runapp', '0009_user_plans_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, verbose_name='name of the template')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='template description (optional)')),
+                ('duration', models.PositiveSmallIntegerField(verbose_name='duration in days')),
+                ('author', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlanTemplateTraining',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.PositiveSmallIntegerField(verbose_name='day of the plan counted from 0')),
+                ('main_training', models.CharField(max_length=32)),
+                ('additional_training', models.CharField(blank=True, max_length=32, null=True)),
+                ('template', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='runapp.plantemplate')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='plantemplatetraining',
+            constraint=models.UniqueConstraint(fields=('template', 'day'), name='unique_template_training_day'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.3 on 2026-10-18 11:47
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('runapp', '0011_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeeklyAdherence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField(verbose_name='monday of the week')),
+                ('trainings_planned', models.PositiveIntegerField(default=0)),
+                ('trainings_completed', models.PositiveIntegerField(default=0)),
+                ('entries', models.PositiveIntegerField(default=0)),
+                ('distance', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('completed_distance', models.DecimalField(decimal_places=2, default=0, max_digits=8, verbose_name='distance on days of completed trainings')),
+                ('time', models.PositiveIntegerField(default=0)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='weeklyadherence',
+            constraint=models.UniqueConstraint(fields=('user', 'week_start'), name='unique_user_week_adherence'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.3 on 2026-10-18 12:09
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def set_heartbeat(apps, schema_editor):
+    """Start the heartbeat of the running jobs at their start time."""
+    Job = apps.get_model('runapp', 'Job')
+    Job.objects.filter(status='running').update(heartbeat_at=F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('runapp', '0012_weekly_adherence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_heartbeat, migrations.RunPython.noop),
+    ]
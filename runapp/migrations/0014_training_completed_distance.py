@@ -0,0 +1,45 @@
+# Generated by Django 3.2.3 on 2026-10-18 12:18
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def credit_distances(apps, schema_editor):
+    """Credit the completed trainings and recalculate the plan distances.
+
+    Which entry completed a training was not stored, so the distance of
+    the owner's diary entries on the training day is credited.
+    """
+    TrainingPlan = apps.get_model('runapp', 'TrainingPlan')
+    Training = apps.get_model('runapp', 'Training')
+    TrainingDiary = apps.get_model('runapp', 'TrainingDiary')
+    distance = TrainingDiary.objects.filter(
+        user__trainingplan=OuterRef('training_plan'), date=OuterRef('date')
+    ).order_by().values('user').annotate(
+        total=Sum('training_distance')).values('total')
+    Training.objects.filter(completed=True).update(
+        completed_distance=Coalesce(Subquery(distance), Value(
+            0, output_field=models.DecimalField())))
+    completed = Training.objects.filter(
+        training_plan=OuterRef('pk'), completed=True
+    ).order_by().values('training_plan')
+    TrainingPlan.objects.update(completed_distance=Coalesce(Subquery(
+        completed.annotate(total=Sum('completed_distance')).values('total')),
+        Value(0, output_field=models.DecimalField())))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('runapp', '0013_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='training',
+            name='completed_distance',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=4, verbose_name='distance of the diary entry completing the training'),
+        ),
+        migrations.RunPython(credit_distances, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,22 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
-from django.core.exceptions import PermissionDenied
-from django.db import models
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import IntegrityError, models, transaction
+from django.db.models import (Count, F, Max, OuterRef, Subquery, Sum,
+                              Value)
+from django.db.models.functions import Cast, Coalesce, Greatest
 from django.urls import reverse
+from django.utils import timezone
+
+from runapp.authentication import user_cache
+
+SET_CURRENT_ATTEMPTS = 3
+TRAININGS_BATCH_SIZE = 500
+USERS_BATCH_SIZE = 500
 
 
 class UserManager(BaseUserManager):
@@ -24,6 +39,38 @@ class UserManager(BaseUserManager):
         user.save(using=self._db)
         return user
 
+    def create_users(self, accounts, workers=None):
+        """Create users from (email, password) pairs in bulk.
+
+        The passwords are hashed in a pool of threads, hashlib releases
+        the GIL while hashing. Users without a password get an unusable
+        one. No user is created if an email is missing, repeated or
+        already taken.
+        """
+        emails, passwords = [], []
+        for email, password in accounts:
+            if not email:
+                raise ValueError('Can not create user without email address')
+            emails.append(self.normalize_email(email))
+            passwords.append(password)
+        if len(set(emails)) < len(emails):
+            raise ValueError('Email addresses must not repeat')
+        taken = list(self.filter(email__in=emails).values_list(
+            'email', flat=True)[:10])
+        if taken:
+            raise ValueError(f'Users already exist: {", ".join(taken)}')
+
+        if workers is None:
+            workers = getattr(settings, 'PASSWORD_HASH_WORKERS', None)
+        with ThreadPoolExecutor(workers) as executor:
+            hashes = list(executor.map(make_password, passwords))
+        with transaction.atomic(using=self._db):
+            self.bulk_create(
+                [self.model(email=email, password=hash_)
+                 for email, hash_ in zip(emails, hashes)],
+                batch_size=USERS_BATCH_SIZE)
+        return list(self.filter(email__in=emails).order_by('pk'))
+
 
 class User(AbstractBaseUser):
     """A class to represent a user."""
@@ -31,6 +78,7 @@ class User(AbstractBaseUser):
                               max_length=255)
     is_active = models.BooleanField(default=True)
     is_admin = models.BooleanField(default=False)
+    plans_version = models.PositiveIntegerField(default=0, editable=False)
 
     USERNAME_FIELD = 'email'
 
@@ -49,6 +97,13 @@ class User(AbstractBaseUser):
         """Return True if a user is allowed to access app models."""
         return self.is_admin
 
+    @classmethod
+    def bump_plans_version(cls, user_id):
+        """Increase the version of the user's list of training plans."""
+        cls.objects.filter(pk=user_id).update(
+            plans_version=F('plans_version') + 1)
+        user_cache.invalidate(user_id)
+
 
 class TrainingPlan(models.Model):
     """Represent a single training plan."""
@@ -60,6 +115,24 @@ class TrainingPlan(models.Model):
                                        default=False)
     description = models.TextField(verbose_name='plan description (optional)',
                                    null=True, blank=True)
+    version = models.PositiveIntegerField(default=0, editable=False)
+    trainings_total = models.PositiveIntegerField(default=0, editable=False)
+    trainings_completed = models.PositiveIntegerField(default=0,
+                                                      editable=False)
+    completed_distance = models.DecimalField(max_digits=9, decimal_places=2,
+                                             default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Columns only changed by UPDATEs with F() expressions.
+    counter_fields = ('version', 'trainings_total', 'trainings_completed',
+                      'completed_distance')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner'],
+                                    condition=models.Q(current_plan=True),
+                                    name='unique_current_plan_per_owner'),
+        ]
 
     def __str__(self):
         return self.name
@@ -74,7 +147,7 @@ class TrainingPlan(models.Model):
         If the user is not the owner, raise the Permission Denied
         error.
         """
-        if self.owner != user:
+        if self.owner_id != user.pk:
             raise PermissionDenied
 
     @classmethod
@@ -83,27 +156,190 @@ class TrainingPlan(models.Model):
 
         If there is no current plan return None.
         """
-        training_plan = cls.objects.filter(owner=user, current_plan=True)
-        if training_plan.exists():
-            return training_plan[0]
+        return cls.objects.filter(owner=user, current_plan=True).first()
+
+    @classmethod
+    def set_current(cls, plan_id, user):
+        """Set training plan as user's current plan.
+
+        Clear the flag of the previous current plan and set it on the
+        selected one in a single transaction. A switch made at the same
+        time by another request violates the unique constraint and is
+        retried. Return True if the plan belongs to the user and is now
+        the current plan; otherwise the transaction is rolled back.
+        """
+        for attempt in range(1, SET_CURRENT_ATTEMPTS + 1):
+            try:
+                with transaction.atomic():
+                    cls.objects.filter(
+                        owner=user, current_plan=True).exclude(
+                        pk=plan_id).update(
+                        current_plan=False, version=F('version') + 1,
+                        updated_at=timezone.now())
+                    cls.objects.filter(
+                        pk=plan_id, owner=user, current_plan=False).update(
+                        current_plan=True, version=F('version') + 1,
+                        updated_at=timezone.now())
+                    if not cls.objects.filter(
+                            pk=plan_id, owner=user,
+                            current_plan=True).exists():
+                        transaction.set_rollback(True)
+                        return False
+                    User.bump_plans_version(user.pk)
+                    return True
+            except IntegrityError:
+                if attempt == SET_CURRENT_ATTEMPTS:
+                    raise
+
+    @classmethod
+    def create_with_trainings(cls, owner_id, start_date, duration,
+                              training_days, **fields):
+        """Create a plan for the user with trainings on the given days.
+
+        The trainings are (day, main training, additional training)
+        tuples with days counted from the start date. They are saved
+        with a single bulk insert in the transaction creating the plan.
+        """
+        with transaction.atomic():
+            training_plan = cls.objects.create(
+                owner_id=owner_id, start_date=start_date,
+                end_date=start_date + timedelta(days=duration - 1),
+                trainings_total=len(training_days), **fields)
+            Training.objects.bulk_create([
+                Training(training_plan=training_plan,
+                         date=start_date + timedelta(days=day),
+                         main_training=main_training,
+                         additional_training=additional_training)
+                for day, main_training, additional_training in training_days
+            ], batch_size=TRAININGS_BATCH_SIZE)
+        return training_plan
+
+    def get_training_days(self):
+        """Return the trainings as tuples used by create_with_trainings."""
+        return [((date - self.start_date).days, main_training,
+                 additional_training)
+                for date, main_training, additional_training
+                in self.training_set.order_by('date').values_list(
+                    'date', 'main_training', 'additional_training')]
+
+    def clone(self, owner_id, start_date, name=None, current_plan=False):
+        """Return a copy of the plan shifted to start on the given date."""
+        return TrainingPlan.create_with_trainings(
+            owner_id, start_date, (self.end_date - self.start_date).days + 1,
+            self.get_training_days(), name=name or self.name,
+            description=self.description, current_plan=current_plan)
+
+    def shift_trainings(self, from_date, days, extend_plan=False):
+        """Move the trainings not completed yet by the number of days.
+
+        Shift all trainings planned on or after the date with a single
+        UPDATE. The moved trainings must stay within the plan and must
+        not land on the day of a training that is not moved, otherwise
+        raise ValidationError listing the problems. With extend_plan
+        the plan end date is moved when trainings are shifted past it.
+        Return the number of shifted trainings.
+        """
+        trainings = self.training_set.filter(date__gte=from_date,
+                                             completed=False)
+        delta = timedelta(days=days)
+        with transaction.atomic():
+            shifted_dates = {date + delta for date in trainings.values_list(
+                'date', flat=True)}
+            if not shifted_dates or not days:
+                return 0
+            first, last = min(shifted_dates), max(shifted_dates)
+            end_date = max(self.end_date, last) if extend_plan \
+                else self.end_date
+            errors = []
+            if first < self.start_date:
+                errors.append(f'The trainings cannot be moved before the '
+                              f'plan start date {self.start_date}.')
+            if last > end_date:
+                errors.append(f'The trainings cannot be moved after the '
+                              f'plan end date {self.end_date}.')
+            kept_dates = self.training_set.filter(
+                date__range=(first, last)).exclude(
+                date__gte=from_date, completed=False).values_list(
+                'date', flat=True)
+            for date in sorted(shifted_dates.intersection(kept_dates)):
+                errors.append(f'You already have training planned for '
+                              f'{date}.')
+            if errors:
+                raise ValidationError(errors)
+
+            shifted = trainings.update(date=F('date') + delta,
+                                       updated_at=timezone.now())
+            TrainingPlan.objects.filter(pk=self.pk).update(
+                end_date=end_date, version=F('version') + 1,
+                updated_at=timezone.now())
+            if end_date != self.end_date:
+                # The plan list shows the end date.
+                User.bump_plans_version(self.owner_id)
+        self.end_date = end_date
+        return shifted
 
     @classmethod
-    def set_current(cls, plan_id):
-        """Set training plan as user's current plan."""
-        training_plan = cls.objects.get(pk=plan_id)
-        training_plan.current_plan = True
-        training_plan.save()
+    def bump_version(cls, plan_id):
+        """Increase the plan version after the plan or its trainings change."""
+        cls.objects.filter(pk=plan_id).update(version=F('version') + 1,
+                                              updated_at=timezone.now())
+
+    @classmethod
+    def update_counters(cls, plan_id, total=0, completed=0, distance=0):
+        """Change the plan progress counters by the given amounts."""
+        cls.objects.filter(pk=plan_id).update(
+            trainings_total=F('trainings_total') + total,
+            trainings_completed=F('trainings_completed') + completed,
+            completed_distance=F('completed_distance') + distance,
+            updated_at=timezone.now(),
+        )
+
+    @classmethod
+    def recalculate_counters(cls, plans=None):
+        """Recalculate the progress counters of the plans in bulk.
+
+        The completed distance is the sum of the distances credited to
+        the completed trainings by their diary entries. If no plans are
+        given, recalculate the counters of all plans. Return the number
+        of updated plans.
+        """
+        if plans is None:
+            plans = cls.objects.all()
+        trainings = Training.objects.filter(
+            training_plan=OuterRef('pk')).order_by().values('training_plan')
+        completed = trainings.filter(completed=True)
+        return plans.update(
+            trainings_total=Coalesce(Subquery(
+                trainings.annotate(count=Count('pk')).values('count')), 0),
+            trainings_completed=Coalesce(Subquery(
+                completed.annotate(count=Count('pk')).values('count')), 0),
+            completed_distance=Coalesce(Subquery(
+                completed.annotate(total=Sum('completed_distance')).values(
+                    'total')), Value(0, output_field=models.DecimalField())),
+        )
 
     def save(self, **kwargs):
         """Save instance of the class.
 
         Make sure only one training plan object per user have the
-        current_plan attribute set to True.
+        current_plan attribute set to True. Saving an existing plan
+        leaves out the version and the counters, which are only changed
+        by UPDATEs, so a stale instance does not overwrite them.
         """
-        if self.current_plan:
-            TrainingPlan.objects.filter(
-                owner=self.owner, current_plan=True).update(current_plan=False)
-        super().save(**kwargs)
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields]
+        with transaction.atomic():
+            if self.current_plan:
+                TrainingPlan.objects.filter(
+                    owner=self.owner_id, current_plan=True).exclude(
+                    pk=self.pk).update(
+                    current_plan=False, version=F('version') + 1,
+                    updated_at=timezone.now())
+            super().save(**kwargs)
 
 
 class Training(models.Model):
@@ -114,9 +350,19 @@ class Training(models.Model):
                                            blank=True)
     completed = models.BooleanField(verbose_name='training completed',
                                     default=False)
+    completed_distance = models.DecimalField(
+        verbose_name='distance of the diary entry completing the training',
+        max_digits=4, decimal_places=2, default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
     training_plan = models.ForeignKey(TrainingPlan, on_delete=models.CASCADE,
                                       unique_for_date='date')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['training_plan', 'date'],
+                         name='training_plan_date_idx'),
+        ]
+
     def __str__(self):
         return self.training_information()
 
@@ -127,6 +373,24 @@ class Training(models.Model):
             info += f' + {self.additional_training}'
         return info
 
+    def mark_completed(self, entry):
+        """Mark the training as completed with the diary entry.
+
+        The training is updated only if it is not completed yet, so the
+        plan counters are not increased twice. Return False if it was
+        already completed.
+        """
+        if not Training.objects.filter(pk=self.pk, completed=False).update(
+                completed=True, completed_distance=entry.training_distance,
+                updated_at=timezone.now()):
+            return False
+        self.completed = True
+        self.completed_distance = entry.training_distance
+        TrainingPlan.update_counters(self.training_plan_id, completed=1,
+                                     distance=entry.training_distance)
+        TrainingPlan.bump_version(self.training_plan_id)
+        return True
+
 
 class TrainingDiary(models.Model):
     """Represent a single entry in the user's training diary."""
@@ -143,3 +407,248 @@ class TrainingDiary(models.Model):
                              null=True, blank=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE,
                              unique_for_date='date')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date'],
+                         name='trainingdiary_user_date_idx'),
+        ]
+
+
+class TrainingSummary(models.Model):
+    """Keep running totals and personal bests of the user's diary."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                primary_key=True)
+    entries = models.PositiveIntegerField(default=0)
+    total_distance = models.DecimalField(max_digits=10, decimal_places=2,
+                                         default=0)
+    total_time = models.PositiveIntegerField(default=0)
+    longest_distance = models.DecimalField(max_digits=4, decimal_places=2,
+                                           default=0)
+    longest_time = models.PositiveIntegerField(default=0)
+    best_average_speed = models.DecimalField(max_digits=4, decimal_places=2,
+                                             default=0)
+    last_entry_date = models.DateField(null=True, blank=True)
+
+    @classmethod
+    def record_entry(cls, entry):
+        """Add a new diary entry to the user's summary.
+
+        The new values are cast to numbers, SQLite binds decimals as
+        text, which compares greater than any number.
+        """
+        decimal = models.DecimalField(max_digits=4, decimal_places=2)
+        updated = cls.objects.filter(user_id=entry.user_id).update(
+            entries=F('entries') + 1,
+            total_distance=F('total_distance') + entry.training_distance,
+            total_time=F('total_time') + entry.training_time,
+            longest_distance=Greatest('longest_distance', Cast(
+                Value(entry.training_distance), decimal)),
+            longest_time=Greatest('longest_time', Value(entry.training_time)),
+            best_average_speed=Greatest('best_average_speed', Cast(
+                Value(entry.average_speed), decimal)),
+            last_entry_date=Coalesce(Greatest('last_entry_date', Value(
+                entry.date, output_field=models.DateField())), Value(
+                entry.date, output_field=models.DateField())),
+        )
+        if not updated:
+            cls.refresh(entry.user_id)
+
+    @classmethod
+    def refresh(cls, user_id):
+        """Recalculate the user's summary from all diary entries."""
+        totals = TrainingDiary.objects.filter(user_id=user_id).aggregate(
+            entries=Count('pk'),
+            total_distance=Sum('training_distance'),
+            total_time=Sum('training_time'),
+            longest_distance=Max('training_distance'),
+            longest_time=Max('training_time'),
+            best_average_speed=Max('average_speed'),
+            last_entry_date=Max('date'),
+        )
+        defaults = {field: value if value is not None else 0
+                    for field, value in totals.items()}
+        defaults['last_entry_date'] = totals['last_entry_date']
+        cls.objects.update_or_create(user_id=user_id, defaults=defaults)
+
+
+class PlanTemplate(models.Model):
+    """Represent a reusable plan with trainings on days after its start."""
+    name = models.CharField(verbose_name='name of the template',
+                            max_length=64)
+    description = models.TextField(
+        verbose_name='template description (optional)', null=True,
+        blank=True)
+    duration = models.PositiveSmallIntegerField(
+        verbose_name='duration in days')
+    author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True,
+                               blank=True)
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def from_plan(cls, training_plan, name=None):
+        """Create a template with the trainings of the plan."""
+        with transaction.atomic():
+            template = cls.objects.create(
+                name=name or training_plan.name,
+                description=training_plan.description,
+                duration=(training_plan.end_date -
+                          training_plan.start_date).days + 1,
+                author_id=training_plan.owner_id)
+            PlanTemplateTraining.objects.bulk_create([
+                PlanTemplateTraining(template=template, day=day,
+                                     main_training=main_training,
+                                     additional_training=additional_training)
+                for day, main_training, additional_training
+                in training_plan.get_training_days()
+            ], batch_size=TRAININGS_BATCH_SIZE)
+        return template
+
+    def apply(self, owner_ids, start_date, current_plan=False):
+        """Create a training plan from the template for every user.
+
+        The template trainings are read once. Every plan is created
+        with its trainings in a separate transaction, so the plans of
+        the users processed before a failure are kept. Return the
+        created plans.
+        """
+        training_days = list(self.plantemplatetraining_set.order_by(
+            'day').values_list('day', 'main_training', 'additional_training'))
+        return [TrainingPlan.create_with_trainings(
+            owner_id, start_date, self.duration, training_days,
+            name=self.name, description=self.description,
+            current_plan=current_plan) for owner_id in owner_ids]
+
+
+class PlanTemplateTraining(models.Model):
+    """Represent a single training of a plan template."""
+    template = models.ForeignKey(PlanTemplate, on_delete=models.CASCADE)
+    day = models.PositiveSmallIntegerField(
+        verbose_name='day of the plan counted from 0')
+    main_training = models.CharField(max_length=32)
+    additional_training = models.CharField(max_length=32, null=True,
+                                           blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['template', 'day'],
+                                    name='unique_template_training_day'),
+        ]
+
+
+class Job(models.Model):
+    """Represent a unit of work run in the background by a worker."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=64)
+    arguments = models.JSONField(default=dict, blank=True)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, null=True,
+                              blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES,
+                              default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    progress_done = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=64, blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'],
+                         name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
+
+    @classmethod
+    def claim(cls, worker, candidates=5):
+        """Mark the oldest due pending job as running and return it.
+
+        The job is taken with a conditional UPDATE, so of several
+        workers trying at the same time only one gets it, without row
+        locks SQLite does not have. Return None if no job is due.
+        """
+        now = timezone.now()
+        pending = cls.objects.filter(status=cls.PENDING, run_after__lte=now)
+        for pk in pending.order_by('run_after', 'pk').values_list(
+                'pk', flat=True)[:candidates]:
+            if cls.objects.filter(pk=pk, status=cls.PENDING).update(
+                    status=cls.RUNNING, worker=worker, started_at=now,
+                    heartbeat_at=now, attempts=F('attempts') + 1):
+                return cls.objects.get(pk=pk)
+        return None
+
+    @classmethod
+    def requeue_stale(cls, timeout):
+        """Return running jobs without a recent heartbeat to the queue.
+
+        Such jobs were left by a worker that died. A job that has used
+        up its attempts is marked as failed instead. Return the number
+        of requeued jobs.
+        """
+        now = timezone.now()
+        stale = cls.objects.filter(
+            status=cls.RUNNING,
+            heartbeat_at__lt=now - timedelta(seconds=timeout))
+        stale.filter(attempts__gte=F('max_attempts')).update(
+            status=cls.FAILED, error='The worker running the job stopped.',
+            finished_at=now)
+        return stale.filter(attempts__lt=F('max_attempts')).update(
+            status=cls.PENDING, run_after=now)
+
+    def set_progress(self, done, total=None):
+        """Save the progress of the running job and its heartbeat."""
+        self.progress_done = done
+        fields = {'progress_done': done, 'heartbeat_at': timezone.now()}
+        if total is not None:
+            self.progress_total = fields['progress_total'] = total
+        Job.objects.filter(pk=self.pk).update(**fields)
+
+
+class WeeklyAdherence(models.Model):
+    """Keep the precomputed plan adherence of a user in one week."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    week_start = models.DateField(verbose_name='monday of the week')
+    trainings_planned = models.PositiveIntegerField(default=0)
+    trainings_completed = models.PositiveIntegerField(default=0)
+    entries = models.PositiveIntegerField(default=0)
+    distance = models.DecimalField(max_digits=8, decimal_places=2,
+                                   default=0)
+    completed_distance = models.DecimalField(
+        verbose_name='distance on days of completed trainings',
+        max_digits=8, decimal_places=2, default=0)
+    time = models.PositiveIntegerField(default=0)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'week_start'],
+                                    name='unique_user_week_adherence'),
+        ]
+
+    @property
+    def adherence(self):
+        """Return the percentage of planned trainings completed."""
+        if not self.trainings_planned:
+            return None
+        return round(100 * self.trainings_completed / self.trainings_planned)
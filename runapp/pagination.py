@@ -0,0 +1,45 @@
+from datetime import date
+
+from django.db.models import Q
+
+DIARY_PAGE_SIZE = 50
+# The largest value of a BigAutoField primary key.
+MAX_CURSOR_ID = 2 ** 63 - 1
+
+
+def encode_cursor(entry):
+    """Return the cursor pointing right after the diary entry."""
+    return f'{entry.date.isoformat()}_{entry.pk}'
+
+
+def decode_cursor(cursor):
+    """Return the (date, id) pair stored in the cursor.
+
+    If the cursor is missing or malformed, or its id could not be a
+    primary key, return None.
+    """
+    try:
+        entry_date, pk = cursor.split('_')
+        entry_date, pk = date.fromisoformat(entry_date), int(pk)
+    except (AttributeError, ValueError):
+        return None
+    if not 0 <= pk <= MAX_CURSOR_ID:
+        return None
+    return entry_date, pk
+
+
+def paginate_by_date(queryset, cursor=None, page_size=DIARY_PAGE_SIZE):
+    """Return a page of objects ordered by date and the next cursor.
+
+    The page starts right after the object the cursor points to. The
+    next cursor is None when there are no more objects.
+    """
+    position = decode_cursor(cursor)
+    if position is not None:
+        after_date, after_pk = position
+        queryset = queryset.filter(
+            Q(date__gt=after_date) | Q(date=after_date, pk__gt=after_pk))
+    objects = list(queryset.order_by('date', 'pk')[:page_size + 1])
+    if len(objects) > page_size:
+        return objects[:page_size], encode_cursor(objects[page_size - 1])
+    return objects, None
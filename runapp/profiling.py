@@ -0,0 +1,117 @@
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+current_profile = ContextVar('current_profile', default=None)
+
+
+class RequestProfile:
+    """Collect the timings of a single request in milliseconds."""
+
+    def __init__(self):
+        self.timings = defaultdict(float)
+        self.sql_queries = 0
+        self.sql_time = 0.0
+
+    def add(self, name, duration):
+        """Add the duration of a measured block."""
+        self.timings[name] += duration
+
+    def execute_sql(self, execute, sql, params, many, context):
+        """Run the query and record its time, used as execute wrapper."""
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_queries += 1
+            self.sql_time += (perf_counter() - start) * 1000
+
+    def server_timing(self, total):
+        """Return the value of the Server-Timing header."""
+        metrics = [
+            f'total;dur={total:.2f}',
+            f'db;dur={self.sql_time:.2f};desc="{self.sql_queries} queries"',
+        ]
+        metrics.extend(f'{name};dur={duration:.2f}'
+                       for name, duration in self.timings.items())
+        return ', '.join(metrics)
+
+
+def profile_sql(execute, sql, params, many, context):
+    """Record the query in the profile of the current request.
+
+    Used as a permanent execute wrapper of the database connections.
+    The profile is looked up in the context of the query, so queries
+    run in a thread on behalf of an async request are recorded too.
+    """
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile.execute_sql(execute, sql, params, many, context)
+
+
+@contextmanager
+def timer(name):
+    """Measure the time spent in the block during a profiled request.
+
+    Outside of a profiled request the block runs without measuring.
+    """
+    profile = current_profile.get()
+    if profile is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, (perf_counter() - start) * 1000)
+
+
+def percentile(values, fraction):
+    """Return the value below which the given fraction of values fall."""
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class RequestStats:
+    """Keep the most recent request profiles of each view."""
+
+    def __init__(self, max_samples):
+        self.max_samples = max_samples
+        self._samples = defaultdict(lambda: deque(maxlen=self.max_samples))
+        self._lock = Lock()
+
+    def record(self, view_name, total, profile):
+        """Store the profile of a finished request."""
+        sample = dict(profile.timings, total=total,
+                      db=profile.sql_time, queries=profile.sql_queries)
+        with self._lock:
+            self._samples[view_name].append(sample)
+
+    def summary(self):
+        """Return the percentiles of each metric for every view."""
+        with self._lock:
+            samples = {view_name: list(view_samples)
+                       for view_name, view_samples in self._samples.items()}
+        summary = {}
+        for view_name, view_samples in samples.items():
+            metrics = defaultdict(list)
+            for sample in view_samples:
+                for name, value in sample.items():
+                    metrics[name].append(value)
+            summary[view_name] = {'requests': len(view_samples)}
+            for name, values in metrics.items():
+                summary[view_name][name] = {
+                    'p50': percentile(values, 0.5),
+                    'p95': percentile(values, 0.95),
+                    'p99': percentile(values, 0.99),
+                    'max': max(values),
+                }
+        return summary
+
+    def clear(self):
+        """Remove all stored profiles."""
+        with self._lock:
+            self._samples.clear()
@@ -0,0 +1,51 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# True while a read-only view runs and its reads may go to a replica.
+replica_reads = ContextVar('replica_reads', default=False)
+
+STICKY_COOKIE = 'use_primary'
+
+
+def get_replicas():
+    """Return the aliases of the replicas of the primary database.
+
+    A replica pointing at the database of the primary, e.g. a test
+    mirror, is left out, so its reads share the primary connection and
+    see the changes of its open transaction.
+    """
+    primary = connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+    return [alias for alias in getattr(settings, 'DATABASE_REPLICAS', [])
+            if connections[alias].settings_dict['NAME'] != primary]
+
+
+class ReplicaRouter:
+    """Send the reads of read-only views to replicas, the rest to primary.
+
+    Only the models of runapp are read from replicas, sessions and the
+    other contrib apps always use the primary. Once a request writes,
+    its later reads use the primary as well.
+    """
+
+    def db_for_read(self, model, **hints):
+        """Return a random replica if the current view allows it."""
+        if not replica_reads.get() or model._meta.app_label != 'runapp':
+            return DEFAULT_DB_ALIAS
+        replicas = get_replicas()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        """Return the primary and keep the later reads on it."""
+        replica_reads.set(False)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Allow relations, the replicas hold the same data."""
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Migrate the primary only, the replicas copy its schema."""
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,86 @@
+from time import monotonic
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from runapp.authentication import user_cache
+from runapp.calendar import month_cache
+from runapp.models import (Training, TrainingDiary, TrainingPlan,
+                           TrainingSummary, User)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    """Remember when the new connection was last known to work."""
+    connection.health_checked_at = monotonic()
+
+
+@receiver(request_started)
+def check_connections(**kwargs):
+    """Close the persistent connections that stopped working.
+
+    Django 3.2 reuses a connection kept by CONN_MAX_AGE without checking
+    it, so a connection dropped by the server would fail the first
+    query of the request. A connection is checked only when it was not
+    checked for DATABASE_CHECK_INTERVAL seconds, so a busy process does
+    not send an extra query with every request. Closed connections
+    reopen on the next query.
+    """
+    interval = getattr(settings, 'DATABASE_CHECK_INTERVAL', 10)
+    now = monotonic()
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+        checked_at = getattr(connection, 'health_checked_at', None)
+        if checked_at is not None and now - checked_at < interval:
+            continue
+        connection.health_checked_at = now
+        if not connection.is_usable():
+            connection.close()
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    """Remove the cached copies of the user."""
+    user_cache.invalidate(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Training)
+def training_changed(sender, instance, **kwargs):
+    """Invalidate the cached calendars of the training's plan."""
+    TrainingPlan.bump_version(instance.training_plan_id)
+    month_cache.invalidate(instance.training_plan_id)
+
+
+@receiver(post_save, sender=TrainingPlan)
+def training_plan_saved(sender, instance, **kwargs):
+    """Invalidate the cached calendars and plan list of the owner."""
+    TrainingPlan.bump_version(instance.pk)
+    User.bump_plans_version(instance.owner_id)
+    month_cache.invalidate(instance.pk)
+
+
+@receiver(post_delete, sender=TrainingPlan)
+def training_plan_deleted(sender, instance, **kwargs):
+    """Remove the cached calendars and plan list of the owner."""
+    User.bump_plans_version(instance.owner_id)
+    month_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=TrainingDiary)
+def diary_entry_saved(sender, instance, created, **kwargs):
+    """Update the user's training summary with the saved entry."""
+    if created:
+        TrainingSummary.record_entry(instance)
+    else:
+        TrainingSummary.refresh(instance.user_id)
+
+
+@receiver(post_delete, sender=TrainingDiary)
+def diary_entry_deleted(sender, instance, **kwargs):
+    """Recalculate the user's training summary without the entry."""
+    TrainingSummary.refresh(instance.user_id)
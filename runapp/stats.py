@@ -0,0 +1,178 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, Exists, OuterRef, Q, Sum
+from django.db.models.functions import TruncMonth, TruncWeek, TruncYear
+
+from runapp.calendar import get_date_today
+from runapp.models import (Training, TrainingDiary, TrainingSummary, User,
+                           WeeklyAdherence)
+
+ADHERENCE_CHUNK_SIZE = 500
+
+PERIOD_FUNCTIONS = {
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'year': TruncYear,
+}
+
+
+def period_totals(user, period, since=None):
+    """Return the user's training totals for each week, month or year.
+
+    The periods are ordered from the most recent one. Only entries
+    from the since date onwards are taken into account if it is given.
+    """
+    entries = user.trainingdiary_set.all()
+    if since is not None:
+        entries = entries.filter(date__gte=since)
+    return entries.annotate(
+        period=PERIOD_FUNCTIONS[period]('date')
+    ).values('period').annotate(
+        entries=Count('pk'),
+        distance=Sum('training_distance'),
+        time=Sum('training_time'),
+    ).order_by('-period')
+
+
+def rolling_load(user, today=None):
+    """Return the user's distance and time in the last 7 and 28 days."""
+    today = today or get_date_today()
+    last_7_days = Q(date__gt=today - timedelta(days=7))
+    return user.trainingdiary_set.filter(
+        date__gt=today - timedelta(days=28), date__lte=today
+    ).aggregate(
+        distance_7_days=Sum('training_distance', filter=last_7_days),
+        time_7_days=Sum('training_time', filter=last_7_days),
+        distance_28_days=Sum('training_distance'),
+        time_28_days=Sum('training_time'),
+    )
+
+
+def get_summary(user):
+    """Return the user's training summary with totals and personal bests.
+
+    The summary is created from the diary if it does not exist yet.
+    """
+    try:
+        return TrainingSummary.objects.get(user=user)
+    except TrainingSummary.DoesNotExist:
+        TrainingSummary.refresh(user.pk)
+        return TrainingSummary.objects.get(user=user)
+
+
+def week_start(day):
+    """Return the Monday of the week of the day."""
+    return day - timedelta(days=day.weekday())
+
+
+def adherence_rows(user_ids, first_week, last_week):
+    """Return the weekly adherence of the users as unsaved rows.
+
+    Trainings and diary entries of all the users are grouped by user
+    and week in two queries. Only weeks with a planned training or a
+    diary entry get a row.
+    """
+    dates = {'date__gte': first_week, 'date__lt': last_week + timedelta(
+        days=7)}
+    rows = {}
+
+    def get_row(user_id, week):
+        if (user_id, week) not in rows:
+            rows[user_id, week] = WeeklyAdherence(user_id=user_id,
+                                                  week_start=week)
+        return rows[user_id, week]
+
+    trainings = Training.objects.filter(
+        training_plan__owner__in=user_ids, **dates
+    ).annotate(week=TruncWeek('date')).values(
+        'training_plan__owner', 'week'
+    ).annotate(
+        planned=Count('pk'),
+        completed=Count('pk', filter=Q(completed=True)),
+    ).order_by()
+    for total in trainings:
+        row = get_row(total['training_plan__owner'], total['week'])
+        row.trainings_planned = total['planned']
+        row.trainings_completed = total['completed']
+
+    completed_day = Training.objects.filter(
+        training_plan__owner=OuterRef('user'), date=OuterRef('date'),
+        completed=True)
+    entries = TrainingDiary.objects.filter(
+        user__in=user_ids, **dates
+    ).annotate(
+        week=TruncWeek('date'), on_completed_day=Exists(completed_day)
+    ).values('user', 'week').annotate(
+        entries=Count('pk'),
+        distance=Sum('training_distance'),
+        completed_distance=Sum('training_distance',
+                               filter=Q(on_completed_day=True)),
+        time=Sum('training_time'),
+    ).order_by()
+    for total in entries:
+        row = get_row(total['user'], total['week'])
+        row.entries = total['entries']
+        row.distance = total['distance']
+        row.completed_distance = total['completed_distance'] or 0
+        row.time = total['time']
+    return list(rows.values())
+
+
+def save_adherence(user_ids, first_week, rows):
+    """Replace the users' adherence rows from the first week onwards."""
+    with transaction.atomic():
+        WeeklyAdherence.objects.filter(
+            user__in=user_ids, week_start__gte=first_week).delete()
+        WeeklyAdherence.objects.bulk_create(
+            rows, batch_size=ADHERENCE_CHUNK_SIZE)
+
+
+def compute_adherence(weeks=8, workers=None, chunk_size=None, today=None,
+                      job=None):
+    """Recompute the weekly adherence of all users for the last weeks.
+
+    The users are split into chunks computed in a pool of worker
+    processes. The workers only read, the rows are saved by this
+    process, so SQLite never sees concurrent writers. The workers are
+    forked after the database connections are closed, so each opens
+    its own. The progress of the job, if given, is saved after every
+    chunk. Return the number of saved rows.
+    """
+    if workers is None:
+        workers = getattr(settings, 'ADHERENCE_WORKERS', None)
+    chunk_size = chunk_size or ADHERENCE_CHUNK_SIZE
+    last_week = week_start(today or get_date_today())
+    first_week = last_week - timedelta(weeks=weeks - 1)
+    user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+    chunks = [user_ids[first:first + chunk_size]
+              for first in range(0, len(user_ids), chunk_size)]
+    if job is not None:
+        job.set_progress(0, len(user_ids))
+    if len(chunks) < 2 or workers == 1:
+        return save_chunks(chunks, first_week, (
+            adherence_rows(chunk, first_week, last_week)
+            for chunk in chunks), job)
+
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(workers, mp_context=context) as executor:
+        return save_chunks(chunks, first_week, executor.map(
+            adherence_rows, chunks, [first_week] * len(chunks),
+            [last_week] * len(chunks)), job)
+
+
+def save_chunks(chunks, first_week, results, job=None):
+    """Save the computed rows of every chunk and return their number."""
+    saved = 0
+    users = 0
+    for chunk, rows in zip(chunks, results):
+        save_adherence(chunk, first_week, rows)
+        saved += len(rows)
+        users += len(chunk)
+        if job is not None:
+            job.set_progress(users)
+    return saved
@@ -1,3 +1,1803 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import random
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import partial
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.contrib.sessions.models import Session
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed, ValidationError
+from django.core.management import CommandError, call_command
+from django.core.signals import request_started
+from django.db import IntegrityError, connection, connections
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
+from django.utils import timezone
+
+from runapp.authentication import UserCache, user_cache
+from runapp.calendar import (TrainingCalendar, format_month,
+                             get_date_today, month_cache, months_between)
+from runapp.fragments import get_fragment_cache
+from runapp.ical import get_feed_token
+from runapp.importers import import_activities, import_trainings
+from runapp.jobs import JOBS, enqueue, register, work
+from runapp.middleware import (ProfilingMiddleware, ReplicaRoutingMiddleware,
+                               request_stats)
+from runapp.models import (User, TrainingPlan, Training, TrainingDiary,
+                           TrainingSummary, PlanTemplate, Job,
+                           WeeklyAdherence)
+from runapp.pagination import paginate_by_date
+from runapp.profiling import timer
+from runapp.routers import (STICKY_COOKIE, ReplicaRouter, get_replicas,
+                            replica_reads)
+from runapp.stats import (compute_adherence, get_summary, period_totals,
+                          rolling_load)
+from runapp.views import TrainingDiaryView, TrainingPlanCreateView
+
+
+SLOW_VIEW_SECONDS = 0.2
+
+
+async def slow_view(request):
+    """Wait without blocking the event loop."""
+    await asyncio.sleep(SLOW_VIEW_SECONDS)
+    return HttpResponse()
+
+
+# The URLs of the tests running the middleware chain under ASGI.
+urlpatterns = [path('slow', slow_view)]
+
+
+class ViewQueryCountTests(TestCase):
+    """Check the number of database queries made by each view.
+
+    The session and the user are read from the caches, so only the
+    queries of the view itself are counted.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('runner@example.com', 'password')
+        cls.other_user = User.objects.create_user('other@example.com',
+                                                  'password')
+        cls.start_date = date(2021, 5, 1)
+        cls.plan = TrainingPlan.objects.create(
+            name='Marathon', start_date=cls.start_date,
+            end_date=cls.start_date + timedelta(days=60), owner=cls.user,
+            current_plan=True)
+        TrainingPlan.objects.create(
+            name='Half marathon', start_date=cls.start_date,
+            end_date=cls.start_date + timedelta(days=30), owner=cls.user)
+        Training.objects.bulk_create([
+            Training(training_plan=cls.plan, main_training='Easy run',
+                     date=cls.start_date + timedelta(days=day))
+            for day in range(0, 20, 2)
+        ])
+        TrainingPlan.recalculate_counters()
+        cls.training = cls.plan.training_set.earliest('date')
+        TrainingDiary.objects.bulk_create([
+            TrainingDiary(user=cls.user, date=cls.start_date + timedelta(
+                days=day), training_information='Easy run',
+                training_distance=10, training_time=60, average_speed=10)
+            for day in range(10)
+        ])
+
+    def setUp(self):
+        month_cache.clear()
+        get_fragment_cache().clear()
+        self.login(self.user)
+
+    def login(self, user):
+        """Log the user in and fill the session and user caches."""
+        self.client.force_login(user)
+        self.client.get(reverse('runapp:homepage'))
+
+    def test_training_plan_details(self):
+        url = reverse('runapp:training_plan_details', args=[self.plan.pk])
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Easy run', count=10)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+    def test_training_plan_details_after_change(self):
+        url = reverse('runapp:training_plan_details', args=[self.plan.pk])
+        self.client.get(url)
+        self.training.main_training = 'Tempo run'
+        self.training.save()
+        response = self.client.get(url)
+        self.assertContains(response, 'Tempo run', count=1)
+
+    def test_training_plan_list(self):
+        url = reverse('runapp:training_plan_list')
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertContains(response, 'Half marathon')
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        self.plan.name = 'Spring marathon'
+        self.plan.save()
+        self.assertContains(self.client.get(url), 'Spring marathon')
+
+    def test_training_plan_edit(self):
+        url = reverse('runapp:training_plan_edit', args=[self.plan.pk])
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_select_current_training_plan(self):
+        url = reverse('runapp:select_current_training_plan')
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertContains(response, 'selected')
+
+    def test_training_create(self):
+        url = reverse('runapp:training_create', args=[self.plan.pk])
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_training_edit(self):
+        url = reverse('runapp:training_edit', args=[self.training.pk])
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_training_edit_keeps_date(self):
+        url = reverse('runapp:training_edit', args=[self.training.pk])
+        response = self.client.post(url, {
+            'date': self.training.date, 'main_training': 'Tempo run'})
+        self.assertRedirects(response, self.plan.get_absolute_url())
+        self.training.refresh_from_db()
+        self.assertEqual(self.training.main_training, 'Tempo run')
+
+    def test_training_delete(self):
+        url = reverse('runapp:training_delete', args=[self.training.pk])
+        with self.assertNumQueries(6):
+            response = self.client.post(url)
+        self.assertRedirects(response, self.plan.get_absolute_url())
+        self.assertFalse(Training.objects.filter(pk=self.training.pk).exists())
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.trainings_total, 9)
+
+    def test_diary_entry_create(self):
+        url = reverse('runapp:diary_entry_create', args=[self.training.pk])
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_calendar(self):
+        url = reverse('runapp:calendar', args=[5, 2021])
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertContains(response, 'Easy run', count=10)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+    def test_training_diary(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('runapp:training_diary'))
+        self.assertContains(response, 'Easy run', count=10)
+
+    def test_other_users_plan_is_forbidden(self):
+        self.login(self.other_user)
+        urls = [
+            reverse('runapp:training_plan_details', args=[self.plan.pk]),
+            reverse('runapp:training_plan_edit', args=[self.plan.pk]),
+            reverse('runapp:training_edit', args=[self.training.pk]),
+            reverse('runapp:diary_entry_create', args=[self.training.pk]),
+        ]
+        for url in urls:
+            with self.subTest(url=url), self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 403)
+
+    def test_session_and_user_are_cached(self):
+        url = reverse('runapp:homepage')
+        user_cache.clear()
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        self.user.save()
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_changes_invalidate_other_processes(self):
+        other_process_cache = UserCache(10, 30, 'default')
+        key = (self.user.pk, self.user.get_session_auth_hash())
+        other_process_cache.set(
+            key, self.user, other_process_cache.get_token(self.user.pk))
+        self.assertIsNotNone(other_process_cache.get(key))
+        User.bump_plans_version(self.user.pk)
+        self.assertIsNone(other_process_cache.get(key))
+
+    def test_password_change_ends_cached_session(self):
+        self.user.set_password('new password')
+        self.user.save()
+        response = self.client.get(reverse('runapp:homepage'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_other_users_changes_are_forbidden(self):
+        self.login(self.other_user)
+        urls = [
+            reverse('runapp:training_plan_edit', args=[self.plan.pk]),
+            reverse('runapp:training_delete', args=[self.training.pk]),
+            reverse('runapp:diary_entry_create', args=[self.training.pk]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.post(url)
+            self.assertEqual(response.status_code, 403)
+        self.assertTrue(Training.objects.filter(pk=self.training.pk,
+                                                completed=False).exists())
+
+
+class TrainingImportTests(TestCase):
+    """Check importing trainings into plans in bulk."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('runner@example.com', 'password')
+        cls.plan = TrainingPlan.objects.create(
+            name='Marathon', start_date=date(2021, 5, 1),
+            end_date=date(2021, 7, 31), owner=cls.user)
+        cls.training = Training.objects.create(
+            training_plan=cls.plan, date=date(2021, 5, 10),
+            main_training='Easy run')
+        TrainingPlan.recalculate_counters()
+        cls.plan.refresh_from_db()
+
+    def post_file(self, name, content):
+        self.client.force_login(self.user)
+        file = StringIO(content)
+        file.name = name
+        return self.client.post(
+            reverse('runapp:training_import', args=[self.plan.pk]),
+            {'file': file})
+
+    def test_import_file(self):
+        response = self.post_file(
+            'plan.csv', 'date,main_training,additional_training\n'
+                        '2021-05-01,Easy run,\n2021-05-02,Intervals,Strides\n')
+        self.assertRedirects(response, self.plan.get_absolute_url())
+        trainings = self.plan.training_set.order_by('date')
+        self.assertEqual([(training.date.day, training.training_information())
+                          for training in trainings],
+                         [(1, 'Easy run'), (2, 'Intervals + Strides'),
+                          (10, 'Easy run')])
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.trainings_total, 3)
+
+    def test_invalid_rows_save_nothing(self):
+        version = self.plan.version
+        response = self.post_file('plan.json', json.dumps([
+            {'date': '2021-05-02', 'main_training': 'Easy run'},
+            {'date': '2021-04-30', 'main_training': 'Easy run'},
+            {'date': '2021-05-02', 'main_training': 'Tempo run'},
+            {'date': '2021-05-03'},
+            {'date': '2021-05-10', 'main_training': 'Long run'},
+        ]))
+        self.assertEqual(response.status_code, 200)
+        errors = response.context['form'].non_field_errors()
+        self.assertEqual(len(errors), 4)
+        self.assertIn('Row 2: the date of the training cannot be earlier',
+                      errors[0])
+        self.assertIn('Row 3: the file contains more than one training',
+                      errors[1])
+        self.assertIn('Row 4, main_training:', errors[2])
+        self.assertEqual(errors[3],
+                         'You already have training planned for 2021-05-10.')
+        self.assertEqual(self.plan.training_set.count(), 1)
+        self.plan.refresh_from_db()
+        self.assertEqual((self.plan.trainings_total, self.plan.version),
+                         (1, version))
+
+    def test_malformed_files_are_form_errors(self):
+        files = {
+            'nul.csv': ('date,main_training\n2021-05-01,Easy\x00run\n',
+                        'The file must not contain NUL characters.'),
+            'long.csv': ('date,main_training\n2021-05-01,"%s"\n'
+                         % ('x' * 200000),
+                         'The file is not valid CSV.'),
+        }
+        for name, (content, message) in files.items():
+            with self.subTest(name=name):
+                response = self.post_file(name, content)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    response.context['form'].non_field_errors(), [message])
+        self.assertEqual(self.plan.training_set.count(), 1)
+
+    def test_trainings_are_saved_in_batches(self):
+        rows = [{'date': str(self.plan.start_date + timedelta(days=day)),
+                 'main_training': 'Easy run', 'additional_training': None}
+                for day in range(10, 34)]
+        with CaptureQueriesContext(connection) as queries:
+            trainings = import_trainings(self.plan, rows, batch_size=10)
+        self.assertEqual(len(trainings), 24)
+        inserts = [query for query in queries.captured_queries
+                   if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 3)
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.trainings_total, 25)
+
+    def test_command(self):
+        other_plan = TrainingPlan.objects.create(
+            name='Half marathon', start_date=date(2021, 5, 1),
+            end_date=date(2021, 5, 31), owner=self.user)
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as file:
+            file.write('date,main_training\n2021-05-05,Easy run\n'
+                       '2021-05-10,Long run\n')
+            file.flush()
+            stdout, stderr = StringIO(), StringIO()
+            with self.assertRaisesMessage(
+                    CommandError, '2 training plans were not imported.'):
+                call_command('import_trainings', file.name, self.plan.pk,
+                             other_plan.pk, 0, stdout=stdout, stderr=stderr)
+        self.assertEqual(stdout.getvalue(), f'Training plan {other_plan.pk}: '
+                                            f'imported 2 trainings.\n')
+        self.assertIn(f'Training plan {self.plan.pk}: You already have',
+                      stderr.getvalue())
+        self.assertIn('Training plan 0 does not exist.', stderr.getvalue())
+        self.assertEqual(self.plan.training_set.count(), 1)
+        self.assertEqual(other_plan.training_set.count(), 2)
+
+
+class DiaryPaginationTests(TestCase):
+    """Check the keyset pages and the streamed training diary."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('runner@example.com', 'password')
+        # Several entries share a date, the id decides their order.
+        TrainingDiary.objects.bulk_create([
+            TrainingDiary(user=cls.user, date=date(2021, 5, 1 + number // 3),
+                          training_information=f'Run {number}',
+                          training_distance=10, training_time=60,
+                          average_speed=10)
+            for number in range(8)
+        ])
+        cls.entries = list(cls.user.trainingdiary_set.order_by('date', 'pk'))
+
+    def get_pages(self, page_size):
+        pages, cursor = [], None
+        while True:
+            page, cursor = paginate_by_date(
+                self.user.trainingdiary_set.all(), cursor, page_size)
+            pages.append(page)
+            if cursor is None:
+                return pages
+
+    def test_pages_with_equal_dates(self):
+        pages = self.get_pages(page_size=3)
+        self.assertEqual([len(page) for page in pages], [3, 3, 2])
+        self.assertEqual([entry for page in pages for entry in page],
+                         self.entries)
+
+    def test_next_page_is_stable(self):
+        first_page, cursor = paginate_by_date(
+            self.user.trainingdiary_set.all(), page_size=4)
+        self.assertEqual(cursor, f'2021-05-02_{self.entries[3].pk}')
+        TrainingDiary.objects.create(
+            user=self.user, date=date(2021, 5, 1), training_information='Jog',
+            training_distance=5, training_time=30, average_speed=10)
+        page, _ = paginate_by_date(self.user.trainingdiary_set.all(), cursor,
+                                   page_size=4)
+        self.assertEqual(page, self.entries[4:])
+
+    def test_invalid_cursor_gives_first_page(self):
+        for cursor in ('invalid', '2021-13-01_1', '2021-05-01_x', '_',
+                       f'2021-05-01_{2 ** 63}', '2021-05-01_-1'):
+            with self.subTest(cursor=cursor):
+                page, _ = paginate_by_date(
+                    self.user.trainingdiary_set.all(), cursor, page_size=2)
+                self.assertEqual(page, self.entries[:2])
+
+    def test_out_of_range_cursor_in_views(self):
+        self.client.force_login(self.user)
+        cursor = f'2021-05-01_{10 ** 20}'
+        for url in (reverse('runapp:training_diary'),
+                    reverse('runapp:api_diary')):
+            with self.subTest(url=url):
+                response = self.client.get(url, {'after': cursor})
+                self.assertEqual(response.status_code, 200)
+
+    def test_diary_pages(self):
+        self.client.force_login(self.user)
+        url = reverse('runapp:training_diary')
+        with mock.patch('runapp.views.paginate_by_date',
+                        partial(paginate_by_date, page_size=5)):
+            response = self.client.get(url)
+            next_cursor = response.context['next_cursor']
+            self.assertContains(response, f'?after={next_cursor}')
+            self.assertContains(response, 'Run 4')
+            self.assertNotContains(response, 'Run 5')
+            response = self.client.get(url, {'after': next_cursor})
+            self.assertContains(response, 'Run 7')
+            self.assertNotContains(response, 'Run 4')
+            self.assertIsNone(response.context['next_cursor'])
+            self.assertContains(response, 'First page')
+            response = self.client.get(url, {'after': 'invalid'})
+            self.assertContains(response, 'Run 0')
+
+    def test_streamed_diary(self):
+        self.client.force_login(self.user)
+        with mock.patch.object(TrainingDiaryView, 'stream_chunk_size', 3):
+            response = self.client.get(reverse('runapp:training_diary'),
+                                       {'stream': 1})
+            chunks = [chunk.decode() for chunk in response.streaming_content]
+        # The page head and tail around three chunks of rows.
+        self.assertEqual(len(chunks), 5)
+        self.assertIn('<th>Date</th>', chunks[0])
+        self.assertEqual([chunk.count('<tr>') for chunk in chunks[1:4]],
+                         [3, 3, 2])
+        self.assertIn('Export CSV', chunks[4])
+        self.assertNotIn('Show all entries', chunks[4])
+        content = ''.join(chunks)
+        positions = [content.index(f'Run {number}<') for number in range(8)]
+        self.assertEqual(positions, sorted(positions))
+
+
+class TrainingStatsTests(TestCase):
+    """Check the totals and the training load computed from the diary."""
+    today = date(2021, 6, 16)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('runner@example.com', 'password')
+        other_user = User.objects.create_user('other@example.com',
+                                              'password')
+        runs = [
+            (date(2020, 12, 31), 20, 120), (date(2021, 1, 3), 15, 90),
+            (date(2021, 5, 19), 6, 40), (date(2021, 6, 9), 12, 70),
+            (date(2021, 6, 10), 8, 50), (date(2021, 6, 14), 5, 30),
+            (date(2021, 6, 16), 10, 60), (date(2021, 6, 17), 3, 20),
+        ]
+        TrainingDiary.objects.bulk_create([
+            TrainingDiary(user=cls.user, date=day, training_information='Run',
+                          training_distance=distance, training_time=time,
+                          average_speed=Decimal(distance * 60) / time)
+            for day, distance, time in runs
+        ] + [TrainingDiary(user=other_user, date=cls.today,
+                           training_information='Run', training_distance=30,
+                           training_time=150, average_speed=12)])
+
+    def get_totals(self, period, since=None):
+        return [(total['period'], total['entries'], total['distance'],
+                 total['time'])
+                for total in period_totals(self.user, period, since)]
+
+    def test_weekly_totals(self):
+        # The week of the new year starts on Monday, 28 December 2020.
+        self.assertEqual(self.get_totals('week'), [
+            (date(2021, 6, 14), 3, Decimal('18'), 110),
+            (date(2021, 6, 7), 2, Decimal('20'), 120),
+            (date(2021, 5, 17), 1, Decimal('6'), 40),
+            (date(2020, 12, 28), 2, Decimal('35'), 210),
+        ])
+
+    def test_monthly_totals(self):
+        self.assertEqual(self.get_totals('month', since=date(2021, 1, 1)), [
+            (date(2021, 6, 1), 5, Decimal('38'), 230),
+            (date(2021, 5, 1), 1, Decimal('6'), 40),
+            (date(2021, 1, 1), 1, Decimal('15'), 90),
+        ])
+
+    def test_yearly_totals(self):
+        self.assertEqual(self.get_totals('year'), [
+            (date(2021, 1, 1), 7, Decimal('59'), 360),
+            (date(2020, 1, 1), 1, Decimal('20'), 120),
+        ])
+
+    def test_rolling_load(self):
+        self.assertEqual(rolling_load(self.user, self.today), {
+            'distance_7_days': Decimal('23'), 'time_7_days': 140,
+            'distance_28_days': Decimal('35'), 'time_28_days': 210,
+        })
+        self.assertEqual(rolling_load(self.user, date(2022, 1, 1)), {
+            'distance_7_days': None, 'time_7_days': None,
+            'distance_28_days': None, 'time_28_days': None,
+        })
+
+    def test_summary(self):
+        summary = get_summary(self.user)
+        self.assertEqual(
+            (summary.entries, summary.total_distance, summary.total_time,
+             summary.longest_distance, summary.longest_time,
+             summary.last_entry_date),
+            (8, Decimal('79'), 480, Decimal('20'), 120, date(2021, 6, 17)))
+        TrainingDiary.objects.create(
+            user=self.user, date=date(2021, 6, 20), training_information='Run',
+            training_distance=25, training_time=130, average_speed=Decimal(
+                '11.54'))
+        summary = get_summary(self.user)
+        self.assertEqual(
+            (summary.entries, summary.total_distance, summary.longest_distance,
+             summary.best_average_speed, summary.last_entry_date),
+            (9, Decimal('104'), Decimal('25'), Decimal('11.54'),
+             date(2021, 6, 20)))
+
+    def test_personal_bests_keep_bigger_values(self):
+        get_summary(self.user)
+        for distance, time, speed in (('25', 130, '11.54'),
+                                      ('5.5', 40, '8.25'),
+                                      ('3', 20, '9')):
+            TrainingDiary.objects.create(
+                user=self.user, date=date(2021, 6, 20),
+                training_information='Run', training_distance=distance,
+                training_time=time, average_speed=speed)
+        summary = get_summary(self.user)
+        self.assertEqual(
+            (summary.entries, summary.longest_distance, summary.longest_time,
+             summary.best_average_speed),
+            (11, Decimal('25'), 130, Decimal('11.54')))
+
+    def test_stats_view(self):
+        self.client.force_login(self.user)
+        with mock.patch('runapp.views.get_date_today',
+                        return_value=self.today):
+            response = self.client.get(reverse('runapp:training_stats'))
+        self.assertContains(response, 'Entries: 8<br>')
+        self.assertContains(response, 'Last 7 days: 23.00 (140)')
+        self.assertContains(response, 'Last 28 days: 35.00 (210)')
+        self.assertEqual(len(response.context['weekly_totals']), 3)
+        self.assertEqual(len(response.context['monthly_totals']), 4)
+        self.assertEqual(len(response.context['yearly_totals']), 2)
+
+
+class DiaryEntryCreateTests(TestCase):
+    """Check completing a training with a diary entry."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('runner@example.com', 'password')
+        cls.plan = TrainingPlan.objects.create(
+            name='Base', owner=cls.user, start_date=date(2021, 5, 1),
+            end_date=date(2021, 5, 7))
+        cls.training = Training.objects.create(
+            training_plan=cls.plan, date=date(2021, 5, 1),
+            main_training='Easy run')
+
+    def post_entry(self, day):
+        return self.client.post(
+            reverse('runapp:diary_entry_create', args=[self.training.pk]),
+            {'date': f'2021-05-0{day}', 'training_information': 'Easy run',
+             'training_distance': '10', 'training_time': '60'})
+
+    def test_completed_training_is_not_counted_twice(self):
+        self.client.force_login(self.user)
+        for day in (1, 2):
+            response = self.post_entry(day)
+            self.assertRedirects(response, self.plan.get_absolute_url())
+        self.assertEqual(self.user.trainingdiary_set.count(), 1)
+        self.plan.refresh_from_db()
+        self.assertEqual((self.plan.trainings_completed,
+                          self.plan.completed_distance), (1, Decimal('10')))
+
+    def test_repair_keeps_credited_distance(self):
+        self.client.force_login(self.user)
+        # The entry is dated after the training and another plan has a
+        # training on the same day, neither changes the credited distance.
+        other_plan = TrainingPlan.objects.create(
+            name='Other', owner=self.user, start_date=date(2021, 5, 1),
+            end_date=date(2021, 5, 7))
+        Training.objects.create(training_plan=other_plan,
+                                date=date(2021, 5, 3), main_training='Run',
+                                completed=True)
+        self.post_entry(3)
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.completed_distance, Decimal('10'))
+        TrainingPlan.recalculate_counters()
+        self.plan.refresh_from_db()
+        other_plan.refresh_from_db()
+        self.assertEqual((self.plan.trainings_completed,
+                          self.plan.completed_distance), (1, Decimal('10')))
+        self.assertEqual(other_plan.completed_distance, 0)
+        self.client.post(reverse('runapp:training_delete',
+                                 args=[self.training.pk]))
+        self.plan.refresh_from_db()
+        self.assertEqual((self.plan.trainings_completed,
+                          self.plan.completed_distance), (0, 0))
+
+    def test_saving_stale_plan_keeps_counters(self):
+        stale = TrainingPlan.objects.get(pk=self.plan.pk)
+        self.training.mark_completed(TrainingDiary(training_distance=10))
+        stale.name = 'Base 2'
+        stale.save()
+        self.plan.refresh_from_db()
+        self.assertEqual((self.plan.name, self.plan.trainings_completed,
+                          self.plan.completed_distance),
+                         ('Base 2', 1, Decimal('10')))
+
+    def test_saving_stale_plan_increases_version(self):
+        stale = TrainingPlan.objects.get(pk=self.plan.pk)
+        TrainingPlan.bump_version(self.plan.pk)
+        TrainingPlan.bump_version(self.plan.pk)
+        stale.save()
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.version, stale.version + 3)
+
+    def test_mark_completed_once(self):
+        entry = TrainingDiary(training_distance=Decimal('5'))
+        self.assertTrue(self.training.mark_completed(entry))
+        stale = Training.objects.get(pk=self.training.pk)
+        stale.completed = False
+        self.assertFalse(stale.mark_completed(entry))
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.trainings_completed, 1)
+
+
+class ApiTests(TestCase):
+    """Check the JSON API of training plans."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('runner@example.com', 'password')
+        cls.other_user = User.objects.create_user('other@example.com',
+                                                  'password')
+        cls.plan = TrainingPlan.objects.create(
+            name='Marathon', start_date=date(2021, 4, 20),
+            end_date=date(2021, 6, 10), owner=cls.user)
+        Training.objects.bulk_create([
+            Training(training_plan=cls.plan, main_training='Easy run',
+                     date=cls.plan.start_date + timedelta(days=day))
+            for day in range(0, 50, 5)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def assertCachedUntilChanged(self, url, change):
+        """Check the URL gives 304 for its ETag until the change."""
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response
+
+    def rename_training(self):
+        training = self.plan.training_set.earliest('date')
+        training.main_training = 'Tempo run'
+        training.save()
+
+    def test_login_required(self):
+        self.client.logout()
+        response = self.client.get(reverse('runapp:api_plan_list'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_plan_list(self):
+        url = reverse('runapp:api_plan_list')
+        response = self.assertCachedUntilChanged(
+            url, lambda: TrainingPlan.objects.create(
+                name='Half marathon', start_date=date(2021, 7, 1),
+                end_date=date(2021, 8, 1), owner=self.user))
+        self.assertEqual([plan['name'] for plan in response.json()],
+                         ['Marathon', 'Half marathon'])
+
+    def test_plan_detail(self):
+        url = reverse('runapp:api_plan', args=[self.plan.pk])
+        response = self.assertCachedUntilChanged(url, self.rename_training)
+        self.assertEqual(response.json()['name'], 'Marathon')
+        self.client.force_login(self.other_user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_plan_create(self):
+        url = reverse('runapp:api_plan_list')
+        response = self.client.post(url, {
+            'name': 'Spring 10k', 'start_date': '2021-03-01',
+            'end_date': '2021-03-31', 'description': ''},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        plan = TrainingPlan.objects.get(pk=response.json()['id'])
+        self.assertEqual((plan.name, plan.owner), ('Spring 10k', self.user))
+        response = self.client.post(url, {'name': 'No dates'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('start_date', response.json()['errors'])
+        response = self.client.post(url, '[]',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_plan_month(self):
+        url = reverse('runapp:api_plan_month', args=[self.plan.pk, 2021, 5])
+        response = self.assertCachedUntilChanged(url, self.rename_training)
+        dates = [training['date'] for training in response.json()['trainings']]
+        self.assertEqual(dates, ['2021-05-05', '2021-05-10', '2021-05-15',
+                                 '2021-05-20', '2021-05-25', '2021-05-30'])
+
+    def test_plan_month_out_of_range(self):
+        for year, month in ((0, 1), (10000, 1), (2021, 0), (2021, 13)):
+            with self.subTest(year=year, month=month):
+                response = self.client.get(reverse(
+                    'runapp:api_plan_month',
+                    args=[self.plan.pk, year, month]))
+                self.assertEqual(response.status_code, 404)
+
+    def test_diary_bulk_create(self):
+        url = reverse('runapp:api_diary_bulk')
+        trainings = list(self.plan.training_set.order_by('date')[:2])
+        entries = [
+            {'date': str(training.date), 'training': training.pk,
+             'training_information': 'Easy run', 'training_distance': '8',
+             'training_time': 45}
+            for training in trainings
+        ] + [{'date': '2021-05-02', 'training_information': 'Long run',
+              'training_distance': '20', 'training_time': 120}]
+        invalid = entries + [
+            {'date': '2021-05-03', 'training_information': 'Run',
+             'training_distance': '0', 'training_time': 30},
+            dict(entries[0], date='2021-05-04'),
+        ]
+        response = self.client.post(url, json.dumps(invalid),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()['errors']), ['3', '4'])
+        self.assertEqual(response.json()['errors']['4']['training'],
+                         ['Training already completed'])
+        self.assertFalse(TrainingDiary.objects.exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, json.dumps(entries),
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len([
+            query for query in queries.captured_queries
+            if query['sql'].startswith('INSERT INTO "runapp_trainingdiary"')
+        ]), 1)
+        self.assertEqual(response.json(), {'created': 3})
+        self.assertEqual(self.user.trainingdiary_set.count(), 3)
+        self.plan.refresh_from_db()
+        self.assertEqual((self.plan.trainings_completed,
+                          self.plan.completed_distance), (2, Decimal('16')))
+        summary = TrainingSummary.objects.get(user=self.user)
+        self.assertEqual((summary.entries, summary.longest_distance),
+                         (3, Decimal('20')))
+        response = self.client.post(url, json.dumps(entries[:1]),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.client.force_login(self.other_user)
+        response = self.client.post(
+            url, json.dumps([dict(entries[1], training=trainings[1].pk)]),
+            content_type='application/json')
+        self.assertEqual(response.json()['errors']['0']['training'],
+                         ['Training not found'])
+
+
+class AsyncViewTests(TestCase):
+    """Check the async views give the same pages as the sync views."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('runner@example.com', 'password')
+        cls.plan = TrainingPlan.objects.create(
+            name='Marathon', start_date=date(2021, 5, 1),
+            end_date=date(2021, 7, 1), owner=cls.user, current_plan=True)
+        Training.objects.bulk_create([
+            Training(training_plan=cls.plan, main_training='Easy run',
+                     date=cls.plan.start_date + timedelta(days=day))
+            for day in range(0, 20, 2)
+        ])
+        TrainingDiary.objects.bulk_create([
+            TrainingDiary(user=cls.user, date=date(2021, 5, day),
+                          training_information='Long run',
+                          training_distance=10, training_time=60,
+                          average_speed=10)
+            for day in range(1, 11)
+        ])
+
+    def setUp(self):
+        month_cache.clear()
+        get_fragment_cache().clear()
+
+    async def test_async_views(self):
+        pages = [
+            ('training_plan_details', [self.plan.pk], 'Easy run', 10),
+            ('training_plan_list', [], 'Marathon', 1),
+            ('calendar', [5, 2021], 'Easy run', 10),
+            ('training_diary', [], 'Long run', 10),
+        ]
+        await sync_to_async(self.async_client.force_login)(self.user)
+        for name, args, text, count in pages:
+            with self.subTest(name=name):
+                response = await self.async_client.get(
+                    reverse(f'runapp:async_{name}', args=args))
+                self.assertContains(response, text, count=count)
+
+    async def test_async_views_require_login(self):
+        response = await self.async_client.get(
+            reverse('runapp:async_training_diary'))
+        self.assertEqual(response.status_code, 302)
+
+    async def test_async_views_check_owner(self):
+        other_user = await sync_to_async(User.objects.create_user)(
+            'other@example.com', 'password')
+        await sync_to_async(self.async_client.force_login)(other_user)
+        response = await self.async_client.get(reverse(
+            'runapp:async_training_plan_details', args=[self.plan.pk]))
+        self.assertEqual(response.status_code, 403)
+
+    async def test_streamed_responses(self):
+        self.user.is_admin = True
+        await sync_to_async(self.user.save)()
+        await sync_to_async(self.async_client.force_login)(self.user)
+        pages = [
+            (reverse('runapp:training_diary') + '?stream=1', 'Long run'),
+            (reverse('runapp:diary_export', args=['csv']), 'Long run'),
+            (reverse('runapp:diary_export', args=['jsonl']), 'Long run'),
+            (reverse('runapp:all_diaries_export', args=['csv']), 'Long run'),
+            (reverse('runapp:training_plan_feed',
+                     args=[get_feed_token(self.plan)]), 'BEGIN:VEVENT'),
+        ]
+        for url, text in pages:
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                # The content is consumed on the event loop like the
+                # ASGI handler does.
+                content = b''.join(response.streaming_content).decode()
+                self.assertEqual(content.count(text), 10)
+
+
+
+@override_settings(PROFILING_ENABLED=True)
+class ProfilingMiddlewareTests(TestCase):
+    """Check the timings added to responses by the profiling middleware."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('runner@example.com', 'password')
+        cls.plan = TrainingPlan.objects.create(
+            name='Marathon', start_date=date(2021, 5, 1),
+            end_date=date(2021, 7, 1), owner=cls.user, current_plan=True)
+
+    def setUp(self):
+        month_cache.clear()
+        request_stats.clear()
+
+    @staticmethod
+    def count_users(request):
+        User.objects.count()
+        with timer('render'):
+            return HttpResponse()
+
+    def test_disabled(self):
+        with override_settings(PROFILING_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(self.count_users)
+
+    def test_server_timing(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('runapp:calendar',
+                                               args=[5, 2021]))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^total;dur=[0-9.]+, db;dur=[0-9.]+;')
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        self.assertIn('calendar;dur=', timing)
+        self.assertIn('render;dur=', timing)
+        stats = request_stats.summary()['runapp:calendar']
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['queries']['max'], len(queries))
+
+    async def test_async_requests(self):
+        async def get_response(request):
+            return await sync_to_async(self.count_users)(request)
+
+        middleware = ProfilingMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        responses = await asyncio.gather(*[
+            middleware(RequestFactory().get('/')) for _ in range(3)])
+        for response in responses:
+            timing = response['Server-Timing']
+            self.assertIn('desc="1 queries"', timing)
+            self.assertIn('render;dur=', timing)
+        self.assertEqual(request_stats.summary()['unresolved']['requests'],
+                         3)
+
+
+class CalendarRenderTests(TestCase):
+    """Check the fast calendar renderer against TrainingCalendar."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('runner@example.com', 'password')
+        today = get_date_today()
+        cls.plan = TrainingPlan.objects.create(
+            name='Marathon', start_date=today - timedelta(days=40),
+            end_date=today + timedelta(days=40), owner=user)
+        Training.objects.bulk_create([
+            Training(training_plan=cls.plan, main_training='Easy run',
+                     additional_training='Strides' if day % 3 else '',
+                     date=cls.plan.start_date + timedelta(days=day))
+            for day in range(0, 81, 2)
+        ])
+
+    def test_same_html_as_training_calendar(self):
+        for month, year in months_between(self.plan.start_date,
+                                          self.plan.end_date):
+            with self.subTest(month=month, year=year):
+                calendar = TrainingCalendar(self.plan, month, year)
+                self.assertEqual(
+                    format_month(self.plan, month, year, calendar.trainings),
+                    calendar.formatmonth(year, month))
+
+
+class MultiMonthCalendarTests(TestCase):
+    """Check the calendars of a year and of the whole current plan."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('runner@example.com', 'password')
+        cls.other_user = User.objects.create_user('other@example.com',
+                                                  'password')
+        cls.plan = TrainingPlan.objects.create(
+            name='Marathon', start_date=date(2021, 4, 20),
+            end_date=date(2021, 6, 10), owner=cls.user, current_plan=True)
+        Training.objects.bulk_create([
+            Training(training_plan=cls.plan, main_training='Easy run',
+                     date=cls.plan.start_date + timedelta(days=day))
+            for day in range(0, 50, 5)
+        ])
+
+    def setUp(self):
+        month_cache.clear()
+        self.client.force_login(self.user)
+
+    def test_year_calendar(self):
+        response = self.client.get(reverse('runapp:year_calendar',
+                                           args=[2021]))
+        self.assertContains(response, 'class="month"', count=12)
+        self.assertContains(response, 'January 2021')
+        self.assertContains(response, 'December 2021')
+        self.assertContains(response, 'Easy run', count=10)
+        self.assertContains(response, reverse('runapp:year_calendar',
+                                              args=[2022]))
+
+    def test_year_calendar_out_of_range(self):
+        for year in (0, 1, 9999, 10000):
+            with self.subTest(year=year):
+                response = self.client.get(reverse('runapp:year_calendar',
+                                                   args=[year]))
+                self.assertEqual(response.status_code, 404)
+
+    def test_plan_calendar(self):
+        response = self.client.get(reverse('runapp:plan_calendar'))
+        self.assertContains(response, 'class="month"', count=3)
+        for name in ('April 2021', 'May 2021', 'June 2021'):
+            self.assertContains(response, name)
+        self.assertContains(response, 'Easy run', count=10)
+
+    def test_other_users_plan_is_not_shown(self):
+        self.client.force_login(self.other_user)
+        urls = [reverse('runapp:year_calendar', args=[2021]),
+                reverse('runapp:plan_calendar')]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertNotContains(response, 'Easy run')
+                self.assertNotContains(response, 'class="month"')
+                self.assertContains(response, 'No training plan selected')
+
+
+class TrainingPlanFeedTests(TestCase):
+    """Check the iCalendar feed of a training plan."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('runner@example.com', 'password')
+        cls.plan = TrainingPlan.objects.create(
+            name='Marathon, spring', start_date=date(2021, 5, 1),
+            end_date=date(2021, 5, 31), owner=user)
+        cls.trainings = [
+            Training.objects.create(
+                training_plan=cls.plan, date=date(2021, 5, day),
+                main_training='Easy run', additional_training='Strides')
+            for day in (3, 5, 7)
+        ]
+        cls.url = reverse('runapp:training_plan_feed',
+                          args=[get_feed_token(cls.plan)])
+
+    @staticmethod
+    def get_content(response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_feed(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'],
+                         'text/calendar; charset=utf-8')
+        content = self.get_content(response)
+        self.assertTrue(content.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertTrue(content.endswith('END:VCALENDAR\r\n'))
+        self.assertIn('X-WR-CALNAME:Marathon\\, spring\r\n', content)
+        self.assertEqual(content.count('BEGIN:VEVENT'), 3)
+        for training in self.trainings:
+            self.assertIn(f'UID:training-{training.pk}@testserver', content)
+        self.assertIn('DTSTART;VALUE=DATE:20210503\r\n'
+                      'DTEND;VALUE=DATE:20210504\r\n'
+                      'SUMMARY:Easy run + Strides\r\n', content)
+
+    def test_changes_since_sync_token(self):
+        response = self.client.get(self.url)
+        sync_token = response['X-Sync-Token']
+        training = self.trainings[1]
+        training.completed = True
+        training.save()
+        response = self.client.get(self.url, {'since': sync_token})
+        content = self.get_content(response)
+        self.assertEqual(content.count('BEGIN:VEVENT'), 1)
+        self.assertIn(f'UID:training-{training.pk}@', content)
+        self.assertIn('DESCRIPTION:Completed', content)
+        self.assertNotEqual(response['X-Sync-Token'], sync_token)
+        response = self.client.get(self.url, {'since': 'invalid'})
+        self.assertEqual(self.get_content(response).count('BEGIN:VEVENT'), 3)
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.trainings[0].save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_token(self):
+        token = get_feed_token(self.plan)
+        tampered = token[:-1] + ('A' if token[-1] != 'A' else 'B')
+        other_salt = signing.dumps(self.plan.pk, salt='other')
+        for token in (tampered, other_salt, 'invalid'):
+            with self.subTest(token=token):
+                response = self.client.get(reverse(
+                    'runapp:training_plan_feed', args=[token]))
+                self.assertEqual(response.status_code, 404)
+
+
+class PlanTemplateTests(TestCase):
+    """Check copying plans and creating plans from templates."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('runner@example.com', 'password')
+        cls.plan = TrainingPlan.objects.create(
+            name='Marathon', start_date=date(2021, 5, 1),
+            end_date=date(2021, 7, 23), owner=cls.user, current_plan=True)
+        Training.objects.bulk_create([
+            Training(training_plan=cls.plan, main_training='Easy run',
+                     additional_training='Strides' if day % 4 else None,
+                     date=cls.plan.start_date + timedelta(days=day),
+                     completed=day < 10)
+            for day in range(0, 84, 2)
+        ])
+
+    def assert_copied(self, new_plan, start_date):
+        self.assertEqual(new_plan.start_date, start_date)
+        self.assertEqual(new_plan.end_date, start_date + timedelta(days=83))
+        self.assertEqual(new_plan.trainings_total, 42)
+        shift = start_date - self.plan.start_date
+        self.assertEqual(
+            list(new_plan.training_set.order_by('date').values_list(
+                'date', 'additional_training', 'completed')),
+            [(date + shift, additional_training, False)
+             for date, additional_training in self.plan.training_set.order_by(
+                'date').values_list('date', 'additional_training')])
+
+    def test_apply_template(self):
+        template = PlanTemplate.from_plan(self.plan, 'Marathon block')
+        self.assertEqual(template.duration, 84)
+        users = [User.objects.create_user(f'athlete{number}@example.com')
+                 for number in range(3)]
+        start_date = date(2022, 1, 3)
+        with CaptureQueriesContext(connection) as queries:
+            plans = template.apply([user.pk for user in users], start_date,
+                                   current_plan=True)
+        inserts = [query for query in queries if query['sql'].startswith(
+            'INSERT INTO "runapp_training"')]
+        self.assertEqual(len(inserts), 3)
+        for user, new_plan in zip(users, plans):
+            self.assertEqual(new_plan.owner_id, user.pk)
+            self.assertEqual(TrainingPlan.get_current(user), new_plan)
+            self.assert_copied(new_plan, start_date)
+
+    def test_clone_view(self):
+        self.client.force_login(self.user)
+        url = reverse('runapp:training_plan_clone', args=[self.plan.pk])
+        response = self.client.post(url, {
+            'name': 'Autumn marathon', 'start_date': '2021-09-06'})
+        new_plan = TrainingPlan.objects.get(name='Autumn marathon')
+        self.assertRedirects(response, new_plan.get_absolute_url())
+        self.assert_copied(new_plan, date(2021, 9, 6))
+        self.assertEqual(TrainingPlan.get_current(self.user), self.plan)
+
+
+class ShiftTrainingsTests(TestCase):
+    """Check moving the remaining trainings of a plan."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('runner@example.com', 'password')
+        cls.plan = TrainingPlan.objects.create(
+            name='Marathon', start_date=date(2021, 5, 1),
+            end_date=date(2021, 5, 31), owner=cls.user)
+        Training.objects.bulk_create([
+            Training(training_plan=cls.plan, main_training='Easy run',
+                     date=date(2021, 5, day), completed=day < 10)
+            for day in range(1, 30, 2)
+        ])
+
+    def dates(self):
+        return list(self.plan.training_set.order_by('date').values_list(
+            'date', flat=True))
+
+    def test_shift_trainings(self):
+        before = self.dates()
+        with CaptureQueriesContext(connection) as queries:
+            shifted = self.plan.shift_trainings(date(2021, 5, 10), 2)
+        updates = [query for query in queries if query['sql'].startswith(
+            'UPDATE "runapp_training"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(shifted, 10)
+        self.assertEqual(self.dates(), [
+            day if day < date(2021, 5, 10) else day + timedelta(days=2)
+            for day in before])
+
+    def test_shift_onto_kept_training(self):
+        with self.assertRaisesMessage(
+                ValidationError, 'training planned for 2021-05-09'):
+            self.plan.shift_trainings(date(2021, 5, 11), -2)
+
+    def test_shift_after_plan_end(self):
+        with self.assertRaises(ValidationError):
+            self.plan.shift_trainings(date(2021, 5, 10), 4)
+        self.plan.shift_trainings(date(2021, 5, 10), 4, extend_plan=True)
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.end_date, date(2021, 6, 2))
+
+    def test_shift_view(self):
+        self.client.force_login(self.user)
+        url = reverse('runapp:training_shift', args=[self.plan.pk])
+        response = self.client.post(url, {'from_date': '2021-05-20',
+                                          'days': 1})
+        self.assertRedirects(response, self.plan.get_absolute_url())
+        self.assertEqual(self.dates()[-1], date(2021, 5, 30))
+
+
+    def test_extended_plan_in_plan_list(self):
+        get_fragment_cache().clear()
+        self.client.force_login(self.user)
+        list_url = reverse('runapp:training_plan_list')
+        self.assertContains(self.client.get(list_url), '31 May 2021')
+        response = self.client.post(
+            reverse('runapp:training_shift', args=[self.plan.pk]),
+            {'from_date': '2021-05-10', 'days': 4, 'extend_plan': 'on'})
+        self.assertRedirects(response, self.plan.get_absolute_url())
+        response = self.client.get(list_url)
+        self.assertContains(response, '02 Jun 2021')
+        self.assertNotContains(response, '31 May 2021')
+
+class SeedDataTests(TestCase):
+    """Check the synthetic dataset created by the seed_data command."""
+
+    def test_seed_data(self):
+        call_command('seed_data', users=3, plans_per_user=2,
+                     trainings_per_plan=30, diary_entries=10, batch_size=50,
+                     stdout=StringIO())
+        self.assertEqual(User.objects.count(), 3)
+        self.assertEqual(TrainingPlan.objects.filter(
+            current_plan=True).count(), 3)
+        self.assertEqual(Training.objects.count(), 180)
+        self.assertEqual(TrainingDiary.objects.count(), 30)
+        user = User.objects.earliest('pk')
+        summary = TrainingSummary.objects.get(user=user)
+        TrainingSummary.refresh(user.pk)
+        self.assertEqual(TrainingSummary.objects.filter(
+            user=user, entries=summary.entries,
+            total_distance=summary.total_distance,
+            best_average_speed=summary.best_average_speed).count(), 1)
+        plan = user.trainingplan_set.get(current_plan=True)
+        self.assertEqual(plan.trainings_total, 30)
+        self.assertEqual(plan.trainings_completed, plan.training_set.filter(
+            completed=True).count())
+
+
+GPX_ACTIVITY = b'''<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">
+  <trk><name>Morning run</name><trkseg>
+    <trkpt lat="52.0" lon="21.0"><time>2021-05-03T06:00:00Z</time></trkpt>
+    <trkpt lat="52.0" lon="21.05"><time>2021-05-03T06:20:00Z</time></trkpt>
+    <trkpt lat="52.0" lon="21.1"><time>2021-05-03T06:40:00Z</time></trkpt>
+  </trkseg></trk>
+</gpx>'''
+
+TCX_ACTIVITY = b'''<?xml version="1.0" encoding="UTF-8"?>
+<TrainingCenterDatabase
+    xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2">
+  <Activities><Activity Sport="Running">
+    <Id>2021-05-05T17:00:00Z</Id>
+    <Lap StartTime="2021-05-05T17:00:00Z">
+      <TotalTimeSeconds>1800</TotalTimeSeconds>
+      <DistanceMeters>5000</DistanceMeters>
+    </Lap>
+    <Lap StartTime="2021-05-05T17:30:00Z">
+      <TotalTimeSeconds>1500.4</TotalTimeSeconds>
+      <DistanceMeters>5000</DistanceMeters>
+    </Lap>
+  </Activity></Activities>
+</TrainingCenterDatabase>'''
+
+CSV_ACTIVITIES = b'''date,distance,time,name
+2021-05-07,12.5,70,Long run
+2021-05-08,5,30,
+'''
+
+
+class ActivityImportTests(TestCase):
+    """Check adding diary entries from activity files."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('runner@example.com', 'password')
+        cls.plan = TrainingPlan.objects.create(
+            name='Marathon', start_date=date(2021, 5, 1),
+            end_date=date(2021, 5, 31), owner=cls.user, current_plan=True)
+        Training.objects.bulk_create([
+            Training(training_plan=cls.plan, main_training='Easy run',
+                     date=date(2021, 5, day)) for day in (3, 5, 6)
+        ])
+        TrainingPlan.recalculate_counters()
+
+    def test_import_activities(self):
+        report = import_activities(self.user, [
+            ('run.gpx', GPX_ACTIVITY), ('run.tcx', TCX_ACTIVITY),
+            ('runs.csv', CSV_ACTIVITIES)], workers=2)
+        self.assertEqual([(file['name'], file['entries'], file['error'])
+                          for file in report],
+                         [('run.gpx', 1, None), ('run.tcx', 1, None),
+                          ('runs.csv', 2, None)])
+        entries = {entry.date.day: entry
+                   for entry in self.user.trainingdiary_set.all()}
+        self.assertEqual(sorted(entries), [3, 5, 7, 8])
+        self.assertEqual(entries[3].training_distance, Decimal('6.85'))
+        self.assertEqual(entries[3].training_time, 40)
+        self.assertEqual(entries[3].training_information, 'Easy run')
+        self.assertEqual(entries[5].training_distance, Decimal('10.00'))
+        self.assertEqual(entries[5].training_time, 55)
+        self.assertEqual(entries[7].training_information, 'Long run')
+        self.assertEqual(entries[8].training_information, 'Run')
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.trainings_completed, 2)
+        self.assertEqual(self.plan.completed_distance, Decimal('16.85'))
+        TrainingPlan.recalculate_counters()
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.completed_distance, Decimal('16.85'))
+        self.assertEqual(TrainingSummary.objects.get(user=self.user).entries,
+                         4)
+
+    def test_trainings_completed_meanwhile_are_not_credited(self):
+        training = Training.objects.get(date=date(2021, 5, 5))
+        training_information = Training.training_information
+
+        def complete_meanwhile(instance):
+            if instance.pk == training.pk:
+                Training.objects.filter(pk=training.pk).update(
+                    completed=True, completed_distance=3)
+            return training_information(instance)
+
+        with mock.patch.object(Training, 'training_information',
+                               complete_meanwhile):
+            import_activities(self.user, [
+                ('run.gpx', GPX_ACTIVITY), ('run.tcx', TCX_ACTIVITY)],
+                workers=1)
+        training.refresh_from_db()
+        self.assertEqual(training.completed_distance, Decimal('3'))
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.trainings_completed, 1)
+        self.assertEqual(self.plan.completed_distance, Decimal('6.85'))
+
+    def test_invalid_files_are_skipped(self):
+        TrainingDiary.objects.create(
+            user=self.user, date=date(2021, 5, 3), training_information='Run',
+            training_distance=5, training_time=30, average_speed=1)
+        future = f'date,distance,time\n{get_date_today() + timedelta(1)},5,30'
+        report = import_activities(self.user, [
+            ('run.gpx', GPX_ACTIVITY), ('future.csv', future.encode()),
+            ('broken.tcx', b'<Activity'), ('run.fit', b''),
+            ('runs.csv', CSV_ACTIVITIES)], workers=1)
+        self.assertEqual([file['entries'] for file in report],
+                         [0, 0, 0, 0, 2])
+        self.assertIn('already have a diary entry', report[0]['error'])
+        self.assertIn('not yet taken place', report[1]['error'])
+        self.assertTrue(report[2]['error'])
+        self.assertIn('Only GPX, TCX and CSV', report[3]['error'])
+        self.assertEqual(self.user.trainingdiary_set.count(), 3)
+
+    def test_rows_without_distance_or_time_are_rejected(self):
+        self.client.force_login(self.user)
+        files = [StringIO(content) for content in (
+            'date,distance,time\n2021-05-07,5,0\n',
+            'date,distance,time\n2021-05-07,nan,30\n')]
+        for file, name in zip(files, ('zero_time.csv', 'nan.csv')):
+            file.name = name
+        response = self.client.post(reverse('runapp:activity_import'),
+                                    {'files': files})
+        self.assertEqual(response.status_code, 200)
+        errors = [file['error'] for file in response.context['report']]
+        self.assertEqual(errors, [
+            'Row 1 needs a positive distance and time.'] * 2)
+        self.assertFalse(self.user.trainingdiary_set.exists())
+
+
+class DiaryExportTests(TestCase):
+    """Check the streamed diary exports."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('runner@example.com', 'password')
+        cls.admin = User.objects.create_superuser('admin@example.com',
+                                                  'password')
+        for user, distance in ((cls.user, 10), (cls.admin, 5)):
+            TrainingDiary.objects.bulk_create([
+                TrainingDiary(user=user, date=date(2021, 5, day),
+                              training_information='Easy run, hills',
+                              training_distance=distance, training_time=60,
+                              average_speed=10)
+                for day in range(1, 31)
+            ])
+
+    def get_content(self, name, export_format):
+        response = self.client.get(reverse(f'runapp:{name}',
+                                           args=[export_format]))
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export(self):
+        self.client.force_login(self.user)
+        rows = list(csv.reader(StringIO(self.get_content('diary_export',
+                                                         'csv'))))
+        self.assertEqual(rows[0][:3], ['date', 'training_information',
+                                       'training_distance'])
+        self.assertEqual(len(rows), 31)
+        self.assertEqual(rows[1][:3], ['2021-05-01', 'Easy run, hills',
+                                       '10.00'])
+
+    def test_jsonl_export(self):
+        self.client.force_login(self.user)
+        lines = self.get_content('diary_export', 'jsonl').splitlines()
+        self.assertEqual(len(lines), 30)
+        self.assertEqual(json.loads(lines[-1])['date'], '2021-05-30')
+
+    def test_all_diaries_export(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('runapp:all_diaries_export',
+                                           args=['csv']))
+        self.assertEqual(response.status_code, 403)
+        self.client.force_login(self.admin)
+        lines = self.get_content('all_diaries_export', 'jsonl').splitlines()
+        self.assertEqual(len(lines), 60)
+        self.assertEqual(json.loads(lines[0])['user__email'],
+                         'runner@example.com')
+
+    def test_unknown_format(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('runapp:diary_export',
+                                           args=['gpx']))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(PASSWORD_SCRYPT_WORK_FACTOR=2 ** 10)
+class PasswordHashingTests(TestCase):
+    """Check the password hasher and the bulk creation of users."""
+
+    def login(self, email, password):
+        return authenticate(email=email, password=password)
+
+    def test_new_passwords_use_scrypt(self):
+        user = User.objects.create_user('runner@example.com', 'password')
+        self.assertTrue(user.password.startswith('scrypt$1024$'))
+        self.assertEqual(self.login('runner@example.com', 'password'), user)
+        self.assertIsNone(self.login('runner@example.com', 'wrong'))
+
+    def test_old_hash_is_updated_on_login(self):
+        user = User.objects.create_user('runner@example.com')
+        User.objects.filter(pk=user.pk).update(password=make_password(
+            'password', hasher='pbkdf2_sha256'))
+        self.login('runner@example.com', 'password')
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('scrypt$1024$'))
+        with self.settings(PASSWORD_SCRYPT_WORK_FACTOR=2 ** 11):
+            self.assertEqual(self.login('runner@example.com', 'password'),
+                             user)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('scrypt$2048$'))
+
+    def test_create_users(self):
+        users = User.objects.create_users(
+            [(f'Runner{number}@EXAMPLE.com', 'password')
+             for number in range(20)] + [('coach@example.com', None)],
+            workers=4)
+        self.assertEqual(len(users), 21)
+        self.assertEqual(users[0].email, 'Runner0@example.com')
+        self.assertTrue(self.login('Runner19@example.com', 'password'))
+        self.assertFalse(users[-1].has_usable_password())
+        self.assertEqual(len({user.password for user in users[:20]}), 20)
+
+    def test_create_users_rejects_taken_emails(self):
+        User.objects.create_user('runner@example.com', 'password')
+        for accounts in ([('new@example.com', 'a'), ('new@example.com', 'b')],
+                         [('new@example.com', 'a'), ('', 'b')],
+                         [('runner@example.com', 'a')]):
+            with self.subTest(accounts=accounts), \
+                    self.assertRaises(ValueError):
+                User.objects.create_users(accounts)
+        self.assertEqual(User.objects.count(), 1)
+
+
+class AdherenceReportTests(TestCase):
+    """Check the precomputed weekly adherence report."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('runner@example.com', 'password')
+        cls.admin = User.objects.create_superuser('admin@example.com',
+                                                  'password')
+        plan = TrainingPlan.objects.create(
+            name='Base', owner=cls.user, start_date=date(2021, 5, 3),
+            end_date=date(2021, 5, 16))
+        Training.objects.bulk_create([
+            Training(training_plan=plan, date=date(2021, 5, day),
+                     main_training='Easy run', completed=day in (3, 5, 10))
+            for day in (3, 5, 7, 10, 12, 14)
+        ])
+        TrainingDiary.objects.bulk_create([
+            TrainingDiary(user=cls.user, date=date(2021, 5, day),
+                          training_information='Easy run',
+                          training_distance=distance, training_time=60,
+                          average_speed=10)
+            for day, distance in ((3, 10), (4, 6), (5, 12), (10, 8))
+        ])
+
+    def compute(self, **kwargs):
+        return compute_adherence(weeks=2, workers=1,
+                                 today=date(2021, 5, 12), **kwargs)
+
+    def test_compute_adherence(self):
+        self.assertEqual(self.compute(), 2)
+        first, second = WeeklyAdherence.objects.filter(
+            user=self.user).order_by('week_start')
+        self.assertEqual(first.week_start, date(2021, 5, 3))
+        self.assertEqual((first.trainings_planned, first.trainings_completed,
+                          first.entries), (3, 2, 3))
+        self.assertEqual(first.distance, Decimal('28'))
+        self.assertEqual(first.completed_distance, Decimal('22'))
+        self.assertEqual(first.adherence, 67)
+        self.assertEqual((second.trainings_planned,
+                          second.trainings_completed, second.distance),
+                         (3, 1, Decimal('8')))
+
+    def test_recompute_replaces_rows(self):
+        self.compute()
+        Training.objects.filter(date=date(2021, 5, 12)).update(completed=True)
+        self.assertEqual(self.compute(chunk_size=1), 2)
+        self.assertEqual(WeeklyAdherence.objects.get(
+            week_start=date(2021, 5, 10)).trainings_completed, 2)
+
+    def test_report_view(self):
+        self.compute()
+        url = reverse('runapp:adherence_report')
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['rows']), 2)
+        self.client.force_login(self.admin)
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'week': '2021-05-05'})
+        self.assertEqual([row.user for row in response.context['rows']],
+                         [self.user])
+        self.assertContains(response, '67%')
+
+
+@override_settings(JOB_RETRY_DELAY=0)
+class JobQueueTests(TransactionTestCase):
+    """Check the background job queue.
+
+    The worker closes database connections between jobs, which a
+    TestCase transaction would not survive.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('runner@example.com',
+                                             'password')
+        self.other_user = User.objects.create_user('other@example.com',
+                                                   'password')
+        plan = TrainingPlan.objects.create(
+            name='Base', owner=self.user, start_date=date(2021, 5, 1),
+            end_date=date(2021, 5, 7))
+        Training.objects.create(training_plan=plan, date=date(2021, 5, 1),
+                                main_training='Easy run')
+        self.template = PlanTemplate.from_plan(plan)
+
+    def register_job(self, name, function):
+        register(name)(function)
+        self.addCleanup(JOBS.pop, name)
+
+    def test_apply_plan_template_job(self):
+        job = enqueue('apply_plan_template', owner=self.user,
+                      template_id=self.template.pk, start_date='2021-06-01')
+        self.assertEqual(work(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.result, {'plans': 2})
+        self.assertEqual((job.progress_done, job.progress_total), (2, 2))
+        self.assertEqual(TrainingPlan.objects.filter(
+            start_date=date(2021, 6, 1)).count(), 2)
+
+    def test_compute_adherence_job_reports_progress(self):
+        job = enqueue('compute_adherence', weeks=2)
+        self.assertEqual(work(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual((job.progress_done, job.progress_total), (2, 2))
+
+    def test_failed_job_is_retried(self):
+        calls = []
+
+        def flaky(job):
+            calls.append(job.attempts)
+            if len(calls) < 2:
+                raise ValueError('Try again')
+            return 'done'
+
+        self.register_job('flaky', flaky)
+        job = enqueue('flaky')
+        self.assertEqual(work(burst=True), 2)
+        job.refresh_from_db()
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual((job.status, job.result), (Job.DONE, 'done'))
+
+    def test_job_fails_after_last_attempt(self):
+        def broken(job):
+            raise ValueError('Broken')
+
+        self.register_job('broken', broken)
+        job = enqueue('broken', max_attempts=2)
+        self.assertEqual(work(burst=True), 2)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.error, 'ValueError: Broken')
+
+    def test_job_is_claimed_once(self):
+        enqueue('refresh_summaries')
+        self.assertIsNotNone(Job.claim('first'))
+        self.assertIsNone(Job.claim('second'))
+
+    def test_stale_jobs(self):
+        retried = enqueue('refresh_summaries')
+        last_attempt = enqueue('refresh_summaries', max_attempts=1)
+        alive = enqueue('refresh_summaries')
+        for _ in range(3):
+            Job.claim('dead worker')
+        Job.objects.update(
+            heartbeat_at=timezone.now() - timedelta(minutes=5))
+        Job.objects.get(pk=alive.pk).set_progress(1, 10)
+        self.assertEqual(Job.requeue_stale(60), 1)
+        statuses = dict(Job.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {retried.pk: Job.PENDING,
+                                    last_attempt.pk: Job.FAILED,
+                                    alive.pk: Job.RUNNING})
+        last_attempt.refresh_from_db()
+        self.assertEqual(last_attempt.error,
+                         'The worker running the job stopped.')
+
+    def test_unknown_job(self):
+        with self.assertRaises(ValueError):
+            enqueue('unknown')
+
+    def test_status_endpoint(self):
+        job = enqueue('refresh_summaries', owner=self.user)
+        url = reverse('runapp:api_job', args=[job.pk])
+        self.client.force_login(self.other_user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.user)
+        data = self.client.get(url).json()
+        self.assertEqual((data['name'], data['status']),
+                         ('refresh_summaries', Job.PENDING))
+
+    def test_enqueue_endpoint(self):
+        url = reverse('runapp:api_job_list')
+        body = json.dumps({'name': 'refresh_summaries',
+                           'arguments': {'user_ids': [self.user.pk]}})
+        self.client.force_login(self.user)
+        response = self.client.post(url, body,
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.user.is_admin = True
+        self.user.save()
+        response = self.client.post(url, body,
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        job = Job.objects.get(owner=self.user)
+        self.assertEqual(response['Location'],
+                         reverse('runapp:api_job', args=[job.pk]))
+        self.assertEqual(job.arguments, {'user_ids': [self.user.pk]})
+        for invalid in ({'name': 'unknown'},
+                        {'name': 'refresh_summaries',
+                         'arguments': {'plan_ids': []}},
+                        {'name': 'refresh_summaries', 'arguments': []}):
+            with self.subTest(body=invalid):
+                response = self.client.post(
+                    url, json.dumps(invalid),
+                    content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(Job.objects.count(), 1)
+
+
+class ReplicaRoutingTests(TestCase):
+    """Check the routing of read-only views to the replica."""
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+        self.addCleanup(replica_reads.set, False)
+        # The test replica mirrors the primary, give it a name of its own.
+        patcher = mock.patch.dict(connections['replica'].settings_dict,
+                                  {'NAME': 'replica.sqlite3'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def process_view(self, request, view_class):
+        middleware = ReplicaRoutingMiddleware(lambda request: None)
+        middleware.process_view(request, view_class.as_view(), [], {})
+
+    def test_reads_of_read_only_views_use_replica(self):
+        self.process_view(self.factory.get('/'), TrainingDiaryView)
+        self.assertEqual(self.router.db_for_read(TrainingDiary), 'replica')
+        self.assertEqual(self.router.db_for_read(Session), 'default')
+
+    def test_other_views_use_primary(self):
+        self.process_view(self.factory.get('/'), TrainingPlanCreateView)
+        self.assertEqual(self.router.db_for_read(TrainingDiary), 'default')
+        self.process_view(self.factory.post('/'), TrainingDiaryView)
+        self.assertEqual(self.router.db_for_read(TrainingDiary), 'default')
+
+    def test_reads_after_write_use_primary(self):
+        replica_reads.set(True)
+        self.assertEqual(self.router.db_for_write(TrainingDiary), 'default')
+        self.assertEqual(self.router.db_for_read(TrainingDiary), 'default')
+
+    def test_post_makes_reads_sticky(self):
+        middleware = ReplicaRoutingMiddleware(lambda request: HttpResponse())
+        response = middleware(self.factory.post('/'))
+        self.assertEqual(response.cookies[STICKY_COOKIE]['max-age'], 10)
+        request = self.factory.get('/')
+        request.COOKIES[STICKY_COOKIE] = '1'
+        self.process_view(request, TrainingDiaryView)
+        self.assertEqual(self.router.db_for_read(TrainingDiary), 'default')
+
+    def test_mirror_of_primary_is_not_a_replica(self):
+        self.assertEqual(get_replicas(), ['replica'])
+        connections['replica'].settings_dict['NAME'] = connections[
+            'default'].settings_dict['NAME']
+        self.assertEqual(get_replicas(), [])
+
+
+@override_settings(DATABASE_CHECK_INTERVAL=10)
+class ConnectionCheckTests(TestCase):
+    """Check the health checks of persistent connections."""
+
+    def test_connections_checked_after_interval(self):
+        connection.ensure_connection()
+        connection.health_checked_at = time.monotonic()
+        with mock.patch.object(connection, 'is_usable',
+                               return_value=True) as is_usable:
+            request_started.send(sender=None)
+            request_started.send(sender=None)
+            self.assertEqual(is_usable.call_count, 0)
+            connection.health_checked_at -= 11
+            request_started.send(sender=None)
+            request_started.send(sender=None)
+        self.assertEqual(is_usable.call_count, 1)
+
+
+@override_settings(ROOT_URLCONF='runapp.tests')
+class AsgiMiddlewareTests(SimpleTestCase):
+    """Check that the middleware chain does not serialize ASGI requests."""
+
+    async def test_requests_run_concurrently(self):
+        start = time.perf_counter()
+        responses = await asyncio.gather(
+            *(self.async_client.get('/slow') for _ in range(10)))
+        elapsed = time.perf_counter() - start
+        self.assertEqual({response.status_code for response in responses},
+                         {200})
+        self.assertLess(elapsed, 3 * SLOW_VIEW_SECONDS)
+
+
+class SetCurrentPlanTests(TransactionTestCase):
+    """Check switching the current training plan."""
+    threads = 16
+    switches_per_thread = 25
+
+    def setUp(self):
+        self.user = User.objects.create_user('runner@example.com',
+                                             'password')
+        self.plans = [
+            TrainingPlan.objects.create(
+                name=f'Plan {number}', start_date=date(2021, 5, 1),
+                end_date=date(2021, 7, 1), owner=self.user,
+                current_plan=number == 0)
+            for number in range(5)
+        ]
+
+    def current_plans(self):
+        return list(TrainingPlan.objects.filter(
+            owner=self.user, current_plan=True).values_list('pk', flat=True))
+
+    def test_set_current(self):
+        self.assertTrue(TrainingPlan.set_current(self.plans[3].pk, self.user))
+        self.assertEqual(self.current_plans(), [self.plans[3].pk])
+
+    def test_set_current_ignores_other_users_plans(self):
+        other_user = User.objects.create_user('other@example.com', 'password')
+        self.assertFalse(TrainingPlan.set_current(self.plans[3].pk,
+                                                  other_user))
+        self.assertEqual(self.current_plans(), [self.plans[0].pk])
+
+    def test_set_current_keeps_plan_when_selection_is_invalid(self):
+        other_user = User.objects.create_user('other@example.com', 'password')
+        other_plan = TrainingPlan.objects.create(
+            name='Other plan', start_date=date(2021, 5, 1),
+            end_date=date(2021, 7, 1), owner=other_user, current_plan=True)
+        self.assertFalse(TrainingPlan.set_current(self.plans[3].pk,
+                                                  other_user))
+        self.assertFalse(TrainingPlan.set_current(other_plan.pk + 1,
+                                                  self.user))
+        self.assertEqual(self.current_plans(), [self.plans[0].pk])
+        self.assertTrue(TrainingPlan.objects.get(pk=other_plan.pk)
+                        .current_plan)
+
+    def test_constraint_allows_single_current_plan(self):
+        with self.assertRaises(IntegrityError):
+            TrainingPlan.objects.filter(owner=self.user).update(
+                current_plan=True)
+
+    def test_concurrent_switches_leave_single_current_plan(self):
+        self.assertFalse(connection.is_in_memory_db())
+        errors = []
+
+        def switch_plans(seed):
+            generator = random.Random(seed)
+            try:
+                for _ in range(self.switches_per_thread):
+                    plan = generator.choice(self.plans)
+                    TrainingPlan.set_current(plan.pk, self.user)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=switch_plans, args=(seed,))
+                   for seed in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.current_plans()), 1)
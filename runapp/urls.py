@@ -1,7 +1,7 @@
 from django.urls import path
 from django.contrib.auth.views import LogoutView, LoginView
 
-from . import views
+from . import api, async_views, views
 
 app_name = 'runapp'
 urlpatterns = [
@@ -17,20 +17,74 @@ urlpatterns = [
          name='training_plan_edit'),
     path('training_plan/<int:pk>', views.TrainingPlanDetailsView.as_view(),
          name='training_plan_details'),
+    path('training_plan/copy/<int:pk>', views.TrainingPlanCloneView.as_view(),
+         name='training_plan_clone'),
+    path('training_plan/feed/<str:token>.ics',
+         views.TrainingPlanFeedView.as_view(), name='training_plan_feed'),
     path('training_plans', views.TrainingPlanListView.as_view(),
          name='training_plan_list'),
     path('select_plan', views.SelectCurrentTrainingPlanView.as_view(),
          name='select_current_training_plan'),
     path('training/new/<int:plan_pk>', views.TrainingCreateView.as_view(),
          name='training_create'),
+    path('training/import/<int:plan_pk>', views.TrainingImportView.as_view(),
+         name='training_import'),
+    path('training/shift/<int:plan_pk>', views.TrainingShiftView.as_view(),
+         name='training_shift'),
     path('training/edit/<int:pk>', views.TrainingEditView.as_view(),
          name='training_edit'),
     path('training/delete/<int:pk>', views.TrainingDeleteView.as_view(),
          name='training_delete'),
     path('calendar/<int:month>/<int:year>',
          views.CurrentPlanCalendarView.as_view(), name='calendar'),
+    path('calendar/<int:year>', views.YearCalendarView.as_view(),
+         name='year_calendar'),
+    path('calendar/plan', views.PlanCalendarView.as_view(),
+         name='plan_calendar'),
     path('training_diary', views.TrainingDiaryView.as_view(),
          name='training_diary'),
+    path('training_diary/import', views.ActivityImportView.as_view(),
+         name='activity_import'),
+    path('training_diary/export.<str:export_format>',
+         views.DiaryExportView.as_view(), name='diary_export'),
+    path('training_diary/export/all.<str:export_format>',
+         views.AllDiariesExportView.as_view(), name='all_diaries_export'),
+    path('training_stats', views.TrainingStatsView.as_view(),
+         name='training_stats'),
+    path('training_stats/adherence', views.AdherenceReportView.as_view(),
+         name='adherence_report'),
     path('training_diary/new_entry/<int:training_pk>', views.DiaryEntryCreateView.as_view(),
          name='diary_entry_create'),
+    path('profiling/stats', views.ProfilingStatsView.as_view(),
+         name='profiling_stats'),
+    path('api/plans', api.PlanListApiView.as_view(), name='api_plan_list'),
+    path('api/plans/<int:pk>', api.PlanApiView.as_view(), name='api_plan'),
+    path('api/plans/<int:pk>/trainings', api.PlanTrainingsApiView.as_view(),
+         name='api_plan_trainings'),
+    path('api/plans/<int:pk>/trainings/bulk',
+         api.PlanTrainingsBulkApiView.as_view(),
+         name='api_plan_trainings_bulk'),
+    path('api/plans/<int:pk>/month/<int:year>/<int:month>',
+         api.PlanMonthApiView.as_view(), name='api_plan_month'),
+    path('api/trainings/<int:pk>', api.TrainingApiView.as_view(),
+         name='api_training'),
+    path('api/diary', api.DiaryApiView.as_view(), name='api_diary'),
+    path('api/diary/bulk', api.DiaryBulkApiView.as_view(),
+         name='api_diary_bulk'),
+    path('api/diary/<int:pk>', api.DiaryEntryApiView.as_view(),
+         name='api_diary_entry'),
+    path('api/jobs', api.JobListApiView.as_view(), name='api_job_list'),
+    path('api/jobs/<int:pk>', api.JobApiView.as_view(), name='api_job'),
+    path('async/training_plan/<int:pk>',
+         async_views.AsyncTrainingPlanDetailsView.as_view(),
+         name='async_training_plan_details'),
+    path('async/training_plans',
+         async_views.AsyncTrainingPlanListView.as_view(),
+         name='async_training_plan_list'),
+    path('async/calendar/<int:month>/<int:year>',
+         async_views.AsyncCurrentPlanCalendarView.as_view(),
+         name='async_calendar'),
+    path('async/training_diary',
+         async_views.AsyncTrainingDiaryView.as_view(),
+         name='async_training_diary'),
 ]
@@ -1,12 +1,37 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import transaction
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import get_template, render_to_string
 from django.views import View
 from django.views.generic import TemplateView
 
-from runapp.calendar import TrainingCalendar, get_date_today, str_to_datetime
-from runapp.forms import (UserForm, TrainingPlanForm, SelectCurrentPlanForm,
-                          TrainingForm, DiaryEntryForm)
-from runapp.models import TrainingPlan, Training
+from runapp.calendar import (get_date_today, is_valid_year, months_between,
+                             previous_and_next_month, render_month,
+                             render_months, str_to_datetime)
+from runapp.conditional import conditional_response
+from runapp.exports import (DIARY_FIELDS, EXPORT_FORMATS, export_response,
+                            streaming_response)
+from runapp.forms import (ActivityImportForm, UserForm, TrainingPlanForm,
+                          SelectCurrentPlanForm, TrainingForm, DiaryEntryForm,
+                          TrainingImportForm, TrainingPlanCloneForm,
+                          TrainingShiftForm)
+from runapp.fragments import cached_fragment, fragment_metrics
+from runapp.ical import (decode_sync_token, encode_sync_token,
+                         get_feed_token, get_plan_id, iter_calendar)
+from runapp.importers import (import_activities, import_trainings,
+                              parse_trainings_file)
+from runapp.middleware import request_stats
+from runapp.models import (TrainingPlan, Training, TrainingDiary,
+                           WeeklyAdherence)
+from runapp.pagination import paginate_by_date
+from runapp.profiling import timer
+from runapp.stats import (get_summary, period_totals, rolling_load,
+                          week_start)
 
 
 class LandingPageView(View):
@@ -85,6 +110,7 @@ class TrainingPlanEditView(LoginRequiredMixin, View):
     def post(self, request, pk):
         """Edit the selected training plan."""
         training_plan = get_object_or_404(TrainingPlan, pk=pk)
+        training_plan.confirm_owner(request.user)
         form = self.form_class(request.POST, instance=training_plan)
         if form.is_valid():
             form.save()
@@ -96,23 +122,108 @@ class TrainingPlanEditView(LoginRequiredMixin, View):
 
 class TrainingPlanDetailsView(LoginRequiredMixin, View):
     """View for displaying details about the training plan."""
+    replica_reads = True
 
     def get(self, request, pk):
         """Display information about the selected training plan."""
         training_plan = get_object_or_404(TrainingPlan, pk=pk)
         training_plan.confirm_owner(request.user)
-        context = {'training_plan': training_plan, 'today': get_date_today()}
+        today = get_date_today()
+        trainings_html = cached_fragment(
+            'training_plan_trainings',
+            (training_plan.pk, training_plan.version, today),
+            lambda: render_to_string(
+                'runapp/training_plan_trainings.html',
+                {'trainings': training_plan.training_set.order_by('date'),
+                 'today': today}))
+        context = {'training_plan': training_plan,
+                   'trainings_html': trainings_html,
+                   'feed_token': get_feed_token(training_plan)}
         return render(request, 'runapp/training_plan_details.html', context)
 
 
+class TrainingPlanCloneView(LoginRequiredMixin, View):
+    """View for copying a training plan with all its trainings."""
+    form_class = TrainingPlanCloneForm
+    template_name = 'runapp/training_plan_clone.html'
+
+    def get(self, request, pk):
+        """Display the form for copying the training plan."""
+        training_plan = get_object_or_404(TrainingPlan, pk=pk)
+        training_plan.confirm_owner(request.user)
+        form = self.form_class(initial={'name': training_plan.name})
+        context = {'form': form, 'training_plan': training_plan}
+        return render(request, self.template_name, context)
+
+    def post(self, request, pk):
+        """Create a copy of the plan starting on the chosen date."""
+        training_plan = get_object_or_404(TrainingPlan, pk=pk)
+        training_plan.confirm_owner(request.user)
+        form = self.form_class(request.POST)
+        if form.is_valid():
+            new_plan = training_plan.clone(
+                request.user.pk, form.cleaned_data['start_date'],
+                name=form.cleaned_data['name'],
+                current_plan=form.cleaned_data['current_plan'])
+            return redirect(new_plan)
+
+        context = {'form': form, 'training_plan': training_plan}
+        return render(request, self.template_name, context)
+
+
+class TrainingPlanFeedView(View):
+    """View for subscribing to a training plan from a calendar app."""
+    chunk_size = 500
+
+    def get(self, request, token):
+        """Stream the training plan in the iCalendar format.
+
+        The plan is identified by the signed token from the feed link.
+        With the since parameter set to a sync token from an earlier
+        response, only trainings changed after it are returned.
+        """
+        plan_id = get_plan_id(token)
+        if plan_id is None:
+            raise Http404
+        training_plan = get_object_or_404(TrainingPlan, pk=plan_id)
+        since = request.GET.get('since')
+        etag = f'feed-{training_plan.pk}-{training_plan.version}-' \
+               f'{since or ""}'
+
+        def get_response():
+            trainings = training_plan.training_set.order_by('date', 'pk')
+            changed_after = decode_sync_token(since)
+            if changed_after is not None:
+                trainings = trainings.filter(updated_at__gt=changed_after)
+            response = streaming_response(
+                request, iter_calendar(
+                    training_plan,
+                    trainings.iterator(chunk_size=self.chunk_size),
+                    request.get_host()),
+                content_type='text/calendar; charset=utf-8')
+            response['X-Sync-Token'] = encode_sync_token(
+                training_plan.updated_at)
+            return response
+
+        return conditional_response(request, etag, training_plan.updated_at,
+                                    get_response)
+
+
 class TrainingPlanListView(LoginRequiredMixin, View):
     """View for displaying the list of user training plans."""
+    replica_reads = True
 
     def get(self, request):
         """Display all user training plans."""
-        training_plans = TrainingPlan.objects.filter(owner=request.user)
+        training_plans_html = cached_fragment(
+            'training_plan_list',
+            (request.user.pk, request.user.plans_version),
+            lambda: render_to_string(
+                'runapp/training_plan_list_items.html',
+                {'training_plans': TrainingPlan.objects.filter(
+                    owner=request.user)}))
         return render(request, 'runapp/training_plan_list.html',
-                      {'training_plans': training_plans})
+                      {'training_plans_html': training_plans_html})
 
 
 class SelectCurrentTrainingPlanView(LoginRequiredMixin, View):
@@ -130,7 +241,7 @@ class SelectCurrentTrainingPlanView(LoginRequiredMixin, View):
         form = self.form_class(request.user, data=request.POST)
         if form.is_valid():
             plan_id = form.cleaned_data.get('current_plan')
-            TrainingPlan.set_current(plan_id)
+            TrainingPlan.set_current(plan_id, request.user)
             today = get_date_today()
             return redirect('runapp:calendar', today.month, today.year)
 
@@ -157,7 +268,9 @@ class TrainingCreateView(LoginRequiredMixin, View):
         form = self.form_class(request.POST, user=request.user)
         form.instance.training_plan = training_plan
         if form.is_valid():
-            training = form.save()
+            with transaction.atomic():
+                training = form.save()
+                TrainingPlan.update_counters(training_plan.pk, total=1)
             if request.GET.get('date'):
                 return redirect('runapp:calendar', training.date.month,
                                 training.date.year)
@@ -167,6 +280,69 @@ class TrainingCreateView(LoginRequiredMixin, View):
         return render(request, self.template_name, context)
 
 
+class TrainingImportView(LoginRequiredMixin, View):
+    """View for importing trainings from a file."""
+    form_class = TrainingImportForm
+    template_name = 'runapp/training_import.html'
+
+    def get(self, request, plan_pk):
+        """Display the form for uploading a file with trainings."""
+        training_plan = get_object_or_404(TrainingPlan, pk=plan_pk)
+        training_plan.confirm_owner(request.user)
+        form = self.form_class()
+        context = {'form': form, 'training_plan': training_plan}
+        return render(request, self.template_name, context)
+
+    def post(self, request, plan_pk):
+        """Add all trainings from the uploaded file to the plan."""
+        training_plan = get_object_or_404(TrainingPlan, pk=plan_pk)
+        training_plan.confirm_owner(request.user)
+        form = self.form_class(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                rows = parse_trainings_file(form.cleaned_data['file'])
+                import_trainings(training_plan, rows)
+            except ValidationError as error:
+                form.add_error(None, error)
+            else:
+                return redirect(training_plan)
+
+        context = {'form': form, 'training_plan': training_plan}
+        return render(request, self.template_name, context)
+
+
+class TrainingShiftView(LoginRequiredMixin, View):
+    """View for moving the remaining trainings of a plan."""
+    form_class = TrainingShiftForm
+    template_name = 'runapp/training_shift.html'
+
+    def get(self, request, plan_pk):
+        """Display the form for moving the trainings."""
+        training_plan = get_object_or_404(TrainingPlan, pk=plan_pk)
+        training_plan.confirm_owner(request.user)
+        form = self.form_class(initial={'from_date': get_date_today()})
+        context = {'form': form, 'training_plan': training_plan}
+        return render(request, self.template_name, context)
+
+    def post(self, request, plan_pk):
+        """Move the trainings from the date by the number of days."""
+        training_plan = get_object_or_404(TrainingPlan, pk=plan_pk)
+        training_plan.confirm_owner(request.user)
+        form = self.form_class(request.POST)
+        if form.is_valid():
+            try:
+                training_plan.shift_trainings(
+                    form.cleaned_data['from_date'], form.cleaned_data['days'],
+                    form.cleaned_data['extend_plan'])
+            except ValidationError as error:
+                form.add_error(None, error)
+            else:
+                return redirect(training_plan)
+
+        context = {'form': form, 'training_plan': training_plan}
+        return render(request, self.template_name, context)
+
+
 class TrainingEditView(LoginRequiredMixin, View):
     """View for editing a scheduled training."""
     form_class = TrainingForm
@@ -174,7 +350,8 @@ class TrainingEditView(LoginRequiredMixin, View):
 
     def get(self, request, pk):
         """Display the form for editing the training."""
-        training = get_object_or_404(Training, pk=pk)
+        training = get_object_or_404(
+            Training.objects.select_related('training_plan'), pk=pk)
         plan = training.training_plan
         plan.confirm_owner(request.user)
         date = str_to_datetime(request.GET.get('date'))
@@ -184,7 +361,8 @@ class TrainingEditView(LoginRequiredMixin, View):
 
     def post(self, request, pk):
         """Edit the selected training."""
-        training = get_object_or_404(Training, pk=pk)
+        training = get_object_or_404(
+            Training.objects.select_related('training_plan'), pk=pk)
         plan = training.training_plan
         form = self.form_class(data=request.POST, instance=training,
                                user=request.user)
@@ -204,41 +382,218 @@ class TrainingDeleteView(LoginRequiredMixin, View):
 
     def post(self, request, pk):
         """Delete the selected training."""
-        training = get_object_or_404(Training, pk=pk)
+        training = get_object_or_404(
+            Training.objects.select_related('training_plan'), pk=pk)
         plan = training.training_plan
         plan.confirm_owner(request.user)
-        training.delete()
+        with transaction.atomic():
+            training.delete()
+            TrainingPlan.update_counters(
+                plan.pk, total=-1, completed=-int(training.completed),
+                distance=-training.completed_distance)
         return redirect(plan)
 
 
 class CurrentPlanCalendarView(LoginRequiredMixin, View):
     """Display a monthly calendar with the user's current plan."""
+    replica_reads = True
 
     def get(self, request, month, year):
         """Display a calendar for the given month."""
         current_plan = TrainingPlan.get_current(request.user)
         context = {'training_plan': current_plan}
         if current_plan is not None:
-            calendar = TrainingCalendar(current_plan, month, year)
-            monthly_calendar = calendar.formatmonth(year, month)
-            previous_month, next_month = calendar.previous_and_next_month()
+            monthly_calendar = render_month(current_plan, month, year)
+            previous_month, next_month = previous_and_next_month(month, year)
             context.update({
                 'monthly_calendar': monthly_calendar,
                 'previous_month': previous_month,
                 'next_month': next_month,
             })
-        return render(request, 'runapp/current_plan_calendar.html', context)
+        with timer('render'):
+            return render(request, 'runapp/current_plan_calendar.html',
+                          context)
+
+
+class YearCalendarView(LoginRequiredMixin, View):
+    """Display calendars of all months of a year with the current plan."""
+    template_name = 'runapp/multi_month_calendar.html'
+
+    def get(self, request, year):
+        """Display calendars for the given year."""
+        if not is_valid_year(year):
+            raise Http404
+        current_plan = TrainingPlan.get_current(request.user)
+        context = {'training_plan': current_plan, 'year': year,
+                   'previous_year': year - 1, 'next_year': year + 1}
+        if current_plan is not None:
+            months = [(month, year) for month in range(1, 13)]
+            context['calendars'] = render_months(current_plan, months)
+        with timer('render'):
+            return render(request, self.template_name, context)
+
+
+class PlanCalendarView(LoginRequiredMixin, View):
+    """Display calendars of all months of the current plan."""
+    template_name = 'runapp/multi_month_calendar.html'
+
+    def get(self, request):
+        """Display calendars from the plan start to the plan end."""
+        current_plan = TrainingPlan.get_current(request.user)
+        context = {'training_plan': current_plan}
+        if current_plan is not None:
+            months = months_between(current_plan.start_date,
+                                    current_plan.end_date)
+            context['calendars'] = render_months(current_plan, months)
+        with timer('render'):
+            return render(request, self.template_name, context)
 
 
 class TrainingDiaryView(LoginRequiredMixin, View):
     """View for displaying a training diary."""
+    replica_reads = True
+    template_name = 'runapp/training_diary.html'
+    rows_template_name = 'runapp/training_diary_rows.html'
+    rows_marker = '<!-- training diary rows -->'
+    stream_chunk_size = 200
 
     def get(self, request):
-        """Display user training diary."""
+        """Display user training diary.
+
+        Display a single page of entries after the cursor given in the
+        query string, or stream all entries if requested.
+        """
+        if request.GET.get('stream'):
+            return self.stream_entries(request)
+        cursor = request.GET.get('after')
+        entries, next_cursor = paginate_by_date(
+            request.user.trainingdiary_set.all(), cursor)
+        context = {'entries': entries, 'cursor': cursor,
+                   'next_cursor': next_cursor}
+        with timer('render'):
+            return render(request, self.template_name, context)
+
+    def stream_entries(self, request):
+        """Return a response rendering all entries incrementally."""
+        with timer('render'):
+            page = render_to_string(self.template_name, {
+                'streaming': True, 'rows_marker': self.rows_marker,
+            }, request=request)
+        head, tail = page.split(self.rows_marker)
+        entries = request.user.trainingdiary_set.order_by('date', 'pk')
+        rows_template = get_template(self.rows_template_name)
+
+        def render_page():
+            yield head
+            chunk = []
+            for entry in entries.iterator(chunk_size=self.stream_chunk_size):
+                chunk.append(entry)
+                if len(chunk) == self.stream_chunk_size:
+                    yield rows_template.render({'entries': chunk})
+                    chunk = []
+            if chunk:
+                yield rows_template.render({'entries': chunk})
+            yield tail
+
+        return streaming_response(request, render_page())
+
+
+class ActivityImportView(LoginRequiredMixin, View):
+    """View for adding diary entries from activity files."""
+    form_class = ActivityImportForm
+    template_name = 'runapp/activity_import.html'
+
+    def get(self, request):
+        """Display the form for uploading activity files."""
+        return render(request, self.template_name,
+                      {'form': self.form_class()})
+
+    def post(self, request):
+        """Import the runs and show the result of every file."""
+        form = self.form_class(request.POST, request.FILES)
+        context = {'form': form}
+        if form.is_valid():
+            files = [(file.name, file.read())
+                     for file in request.FILES.getlist('files')]
+            context['report'] = import_activities(request.user, files)
+        return render(request, self.template_name, context)
+
+
+class DiaryExportView(LoginRequiredMixin, View):
+    """View for downloading the user's training diary."""
+
+    def get(self, request, export_format):
+        """Stream all diary entries in the CSV or JSON lines format."""
+        if export_format not in EXPORT_FORMATS:
+            raise Http404
+        entries = request.user.trainingdiary_set.order_by('date', 'pk')
+        return export_response(request, entries, DIARY_FIELDS,
+                               export_format, 'training_diary')
+
+
+class AllDiariesExportView(LoginRequiredMixin, View):
+    """View for downloading the diaries of all users by admins."""
+    fields = ('user__email',) + DIARY_FIELDS
+
+    def get(self, request, export_format):
+        """Stream the diary entries of all users."""
+        if not request.user.is_admin:
+            raise PermissionDenied
+        if export_format not in EXPORT_FORMATS:
+            raise Http404
+        entries = TrainingDiary.objects.order_by('user', 'date', 'pk')
+        return export_response(request, entries, self.fields,
+                               export_format, 'training_diaries')
+
+
+class TrainingStatsView(LoginRequiredMixin, View):
+    """View for displaying statistics of the user's training diary."""
+
+    def get(self, request):
+        """Display training totals, recent load and personal bests."""
         user = request.user
-        entries = user.trainingdiary_set.all().order_by('date')
-        return render(request, 'runapp/training_diary.html',
-                      {'entries': entries})
+        today = get_date_today()
+        context = {
+            'summary': get_summary(user),
+            'load': rolling_load(user, today),
+            'weekly_totals': period_totals(
+                user, 'week', since=today - timedelta(weeks=12)),
+            'monthly_totals': period_totals(
+                user, 'month',
+                since=today.replace(day=1, year=today.year - 1)),
+            'yearly_totals': period_totals(user, 'year'),
+        }
+        return render(request, 'runapp/training_stats.html', context)
+
+
+class AdherenceReportView(LoginRequiredMixin, View):
+    """View for displaying the precomputed weekly plan adherence."""
+
+    def get(self, request):
+        """Display the adherence of all users in a week to admins.
+
+        Other users see their own adherence in the recent weeks. Only
+        the report table is read, it is filled by compute_adherence.
+        """
+        if not request.user.is_admin:
+            rows = WeeklyAdherence.objects.filter(
+                user=request.user).order_by('-week_start')[:12]
+            return render(request, 'runapp/adherence_report.html',
+                          {'rows': rows})
+        try:
+            date = str_to_datetime(request.GET.get('week'))
+        except ValueError:
+            date = None
+        week = week_start(date.date() if date else get_date_today())
+        rows = WeeklyAdherence.objects.filter(
+            week_start=week).select_related('user').order_by('user__email')
+        context = {
+            'rows': rows,
+            'week': week,
+            'previous_week': week - timedelta(weeks=1),
+            'next_week': week + timedelta(weeks=1),
+        }
+        return render(request, 'runapp/adherence_report.html', context)
 
 
 class DiaryEntryCreateView(LoginRequiredMixin, View):
@@ -248,7 +603,8 @@ class DiaryEntryCreateView(LoginRequiredMixin, View):
 
     def get(self, request, training_pk):
         """Display the form for creating a new diary entry."""
-        training = get_object_or_404(Training, pk=training_pk)
+        training = get_object_or_404(
+            Training.objects.select_related('training_plan'), pk=training_pk)
         plan = training.training_plan
         plan.confirm_owner(request.user)
         if training.completed:
@@ -262,16 +618,36 @@ class DiaryEntryCreateView(LoginRequiredMixin, View):
 
     def post(self, request, training_pk):
         """Create a new diary entry."""
-        training = get_object_or_404(Training, pk=training_pk)
+        training = get_object_or_404(
+            Training.objects.select_related('training_plan'), pk=training_pk)
         plan = training.training_plan
+        plan.confirm_owner(request.user)
+        if training.completed:
+            return redirect(plan)
         form = self.form_class(data=request.POST)
         if form.is_valid():
             form.instance.user = request.user
             form.instance.average_speed = form.cleaned_data.get(
                 'training_distance') / form.cleaned_data.get('training_time')
-            form.save()
-            training.completed = True
-            training.save()
+            with transaction.atomic():
+                entry = form.save()
+                # A concurrent request may have completed it meanwhile.
+                if not training.mark_completed(entry):
+                    transaction.set_rollback(True)
             return redirect(plan)
         context = {'form': form, 'plan_pk': plan.id}
         return render(request, self.template_name, context)
+
+
+class ProfilingStatsView(LoginRequiredMixin, View):
+    """View for displaying the request profiling stats to admins."""
+
+    def get(self, request):
+        """Return percentiles of the request timings of each view."""
+        if not request.user.is_admin:
+            raise PermissionDenied
+        return JsonResponse({
+            'enabled': settings.PROFILING_ENABLED,
+            'views': request_stats.summary(),
+            'fragment_cache': fragment_metrics.summary(),
+        })